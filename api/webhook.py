@@ -1,40 +1,30 @@
 """Vercel serverless function for Telegram webhook."""
 
+import asyncio
+
 from fastapi import FastAPI, Request, Response
-from telegram import Update
-from telegram.ext import (
-    Application,
-    CallbackQueryHandler,
-    CommandHandler,
-    MessageHandler,
-    filters,
-)
-
-from src.bot.handlers import (
-    handle_callback_query,
-    handle_message,
-    handle_photo,
-    handle_document,
-    newchat_command,
-    settings_command,
-    start_command,
-)
+
+from src import metrics
+from src.bot.app import build_application, process_update
 from src.config import settings
+from src.db.retention import run_retention
+from src.llm.engine import engine
+from src.services.batch_service import run_batch_jobs
+from src.services.usage import usage_ledger
+from src.tracing import configure_tracing
+
+configure_tracing(settings.tracing_exporters, settings.tracing_json_path)
 
 # Initialize FastAPI app
 app = FastAPI(title="Voroojak Webhook")
 
-# Initialize Telegram bot application
-telegram_app = Application.builder().token(settings.telegram_token).build()
+# Initialize Telegram bot application (handlers: src/bot/app.py)
+telegram_app = build_application()
 
-# Register handlers
-telegram_app.add_handler(CommandHandler("start", start_command))
-telegram_app.add_handler(CommandHandler("settings", settings_command))
-telegram_app.add_handler(CommandHandler("newchat", newchat_command))
-telegram_app.add_handler(CallbackQueryHandler(handle_callback_query))
-telegram_app.add_handler(MessageHandler(filters.PHOTO, handle_photo))
-telegram_app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
-telegram_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+
+def _authorized(request: Request, secret: str | None) -> bool:
+    """Whether the request carries "Authorization: Bearer <secret>" (never, if no secret is set)."""
+    return bool(secret) and request.headers.get("authorization") == f"Bearer {secret}"
 
 
 @app.get("/")
@@ -43,22 +33,63 @@ async def root():
     return {"status": "ok", "bot": "voroojak"}
 
 
+@app.get("/api/stats")
+async def stats(request: Request):
+    """Per-model LLM latency percentiles, hedge rate and scheduler queues."""
+    if not _authorized(request, settings.metrics_token):
+        return Response(status_code=401)
+    
+    return {"models": engine.latency_report(), "scheduler": engine.scheduler.stats()}
+
+
+@app.get("/metrics")
+async def metrics_endpoint(request: Request):
+    """Prometheus metrics for this instance."""
+    if not _authorized(request, settings.metrics_token):
+        return Response(status_code=401)
+    
+    for model, state in engine.scheduler.stats().items():
+        metrics.scheduler_queued.set(state["queued"], model=model)
+        metrics.scheduler_in_flight.set(state["in_flight"], model=model)
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/api/cron/retention")
+async def retention(request: Request):
+    """Scheduled job: archive old chat history within one function invocation."""
+    if not _authorized(request, settings.cron_secret):
+        return Response(status_code=401)
+    
+    moved = await asyncio.to_thread(run_retention, max_seconds=settings.webhook_deadline_seconds)
+    return {"archived": moved}
+
+
+@app.get("/api/cron/batches")
+async def batches(request: Request):
+    """Scheduled job: collect and deliver Batch API results, then submit queued requests."""
+    if not _authorized(request, settings.cron_secret):
+        return Response(status_code=401)
+    
+    return await run_batch_jobs(telegram_app.bot)
+
+
 @app.post("/api/webhook")
 async def webhook(request: Request):
     """Handle incoming Telegram webhook updates."""
     try:
-        # Parse update from Telegram
+        # Parse and process the update within the request's time budget
         data = await request.json()
-        update = Update.de_json(data, telegram_app.bot)
-        
-        # Process update
-        await telegram_app.process_update(update)
+        await process_update(telegram_app, data)
         
         return Response(status_code=200)
     
     except Exception as e:
         print(f"Error processing webhook: {e}")
         return Response(status_code=500)
+    
+    finally:
+        # The instance may be frozen once the response is sent, with usage still buffered
+        await usage_ledger.drain()
 
 
 # Initialize bot on startup
@@ -74,4 +105,6 @@ async def startup():
 @app.on_event("shutdown")
 async def shutdown():
     """Cleanup on shutdown."""
+    # Write usage records still buffered in this instance
+    await asyncio.to_thread(usage_ledger.flush)
     await telegram_app.shutdown()
@@ -0,0 +1,154 @@
+"""Micro-benchmark of prompt formatting for a history with images.
+
+Usage:
+    python -m benchmarks.bench_formatters --messages 30 --images 6 --image-kb 400
+
+Each turn re-reads the history as new MessageRecord objects (as the handler
+does) and formats it for the Responses API and then Chat Completions (the
+fallback path). Compares the previous implementation (f-string data URLs plus
+deepcopy) with the memoized formatter, cold and warm.
+"""
+
+import argparse
+import copy
+import gc
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+from collections.abc import Callable
+from typing import Any
+
+from src.db.records import HistoryRecord, MessageRecord
+from src.llm.formatters import format_cache, to_chat_completion_format, to_responses_format
+
+
+def legacy_responses_format(history: HistoryRecord, current_message: str) -> list[dict[str, Any]]:
+    """to_responses_format before memoization."""
+    formatted = []
+    for msg in history.messages:
+        if msg.image_data:
+            content = [
+                {"type": "input_text", "text": msg.content},
+                {"type": "input_image", "image_url": f"data:image/jpeg;base64,{msg.image_data}"},
+            ]
+            formatted.append({"role": msg.role, "content": content})
+        else:
+            formatted.append({"role": msg.role, "content": msg.content})
+    formatted.append({"role": "user", "content": current_message})
+    return formatted
+
+
+def legacy_chat_format(messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """to_chat_completion_format before memoization."""
+    standard = []
+    for msg in messages:
+        msg_copy = copy.deepcopy(msg)
+        content = msg_copy["content"]
+        if isinstance(content, list):
+            new_content = []
+            for item in content:
+                if item.get("type") == "input_text":
+                    new_content.append({"type": "text", "text": item["text"]})
+                elif item.get("type") == "input_image":
+                    new_content.append({"type": "image_url", "image_url": {"url": item["image_url"]}})
+                else:
+                    new_content.append(item)
+            msg_copy["content"] = new_content
+        standard.append(msg_copy)
+    return standard
+
+
+def build_rows(messages: int, images: int, image_kb: int) -> str:
+    """History as the JSON PostgREST would return it."""
+    image = "A" * (image_kb * 1024)
+    # Spread the images evenly over user messages
+    user_positions = list(range(0, messages, 2))
+    step = max(1, len(user_positions) // images) if images else 1
+    with_image = set(user_positions[::step][:images])
+    rows = []
+    for i in range(messages):
+        role = "user" if i % 2 == 0 else "assistant"
+        has_image = i in with_image
+        rows.append({
+            "id": str(uuid.UUID(int=i + 1)),
+            "seq": i + 1,
+            "user_id": 1,
+            "role": role,
+            "content": f"Message {i}: " + "lorem ipsum " * 20,
+            "image_data": image if has_image else None,
+        })
+    return json.dumps(rows)
+
+
+def load_history(payload: str) -> HistoryRecord:
+    return HistoryRecord(messages=[MessageRecord.from_row(row) for row in json.loads(payload)])
+
+
+def measure(
+    name: str,
+    turn: Callable[[HistoryRecord], Any],
+    payload: str,
+    turns: int,
+    before_each: Callable[[], None] = lambda: None,
+) -> dict[str, float]:
+    times = []
+    allocated = []
+    for _ in range(turns):
+        history = load_history(payload)
+        before_each()
+        gc.collect()
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = turn(history)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        times.append(elapsed)
+        allocated.append(peak)
+    return {
+        "name": name,
+        "median_ms": statistics.median(times) * 1000,
+        "peak_alloc_kb": statistics.median(allocated) / 1024,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=30)
+    parser.add_argument("--images", type=int, default=6, help="Messages carrying an image")
+    parser.add_argument("--image-kb", type=int, default=400, help="Base64 size of each image")
+    parser.add_argument("--turns", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    payload = build_rows(args.messages, args.images, args.image_kb)
+    message = "And what about this one?"
+
+    def legacy(history: HistoryRecord):
+        return legacy_chat_format(legacy_responses_format(history, message))
+
+    def memoized(history: HistoryRecord):
+        return to_chat_completion_format(to_responses_format(history, message))
+
+    # Warm the cache once so "warm" turns see a previously formatted history
+    format_cache.clear()
+    memoized(load_history(payload))
+
+    results = [
+        measure("legacy (f-string + deepcopy)", legacy, payload, args.turns),
+        measure("memoized, cold cache", memoized, payload, args.turns, before_each=format_cache.clear),
+        measure("memoized, warm cache", memoized, payload, args.turns),
+    ]
+
+    print(f"{args.messages} messages, {args.images} images of {args.image_kb} KB, median of {args.turns} turns")
+    print(f"{'implementation':<32} {'time ms':>9} {'peak alloc KB':>14}")
+    for row in results:
+        print(f"{row['name']:<32} {row['median_ms']:>9.3f} {row['peak_alloc_kb']:>14.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
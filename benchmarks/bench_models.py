@@ -0,0 +1,118 @@
+"""Micro-benchmark of hot-path row models: pydantic vs slotted records.
+
+Usage:
+    python -m benchmarks.bench_models --messages 30 --turns 2000
+
+Per update the handler turns the PostgREST rows for recent history and user
+settings into objects, then assembles the prompt. This times that work with
+the pydantic models (src/db/models.py) and with the read models
+(src/db/records.py), and measures the memory the resulting objects retain.
+"""
+
+import argparse
+import gc
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+from collections.abc import Callable
+from typing import Any
+
+from pydantic import BaseModel, Field
+
+from src.db.models import ChatMessage, UserSettings
+from src.db.records import HistoryRecord, MessageRecord, SettingsRecord
+from src.llm.prompt import build_prompt
+
+
+class PydanticHistory(BaseModel):
+    """The pydantic history container the read models replaced (baseline only)."""
+
+    messages: list[ChatMessage] = Field(default_factory=list)
+    total: int | None = None
+
+
+def build_rows(messages: int) -> tuple[list[dict[str, Any]], dict[str, Any]]:
+    """History and settings rows as PostgREST returns them."""
+    history = [
+        {
+            "id": str(uuid.uuid4()),
+            "seq": i + 1,
+            "user_id": 1,
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"Message {i}: " + "lorem ipsum dolor sit amet " * 8,
+            "image_data": None,
+            "has_image": False,
+            "message_id": 1000 + i if i % 2 == 0 else None,
+            "session_id": 0,
+            "created_at": "2025-01-01T12:00:00.123456",
+        }
+        for i in range(messages)
+    ]
+    settings = {
+        "user_id": 1,
+        "selected_model": "gpt-5-mini",
+        "reasoning_effort": "medium",
+        "cache_responses": True,
+        "updated_at": "2025-01-01T12:00:00",
+    }
+    return history, settings
+
+
+def load_pydantic(rows: list[dict[str, Any]], settings: dict[str, Any]):
+    history = PydanticHistory(messages=[ChatMessage(**row) for row in rows], total=len(rows))
+    return history, UserSettings(**settings)
+
+
+def load_records(rows: list[dict[str, Any]], settings: dict[str, Any]):
+    history = HistoryRecord(messages=[MessageRecord.from_row(row) for row in rows], total=len(rows))
+    return history, SettingsRecord.from_row(settings)
+
+
+def time_turns(load: Callable, payload: str, settings: dict[str, Any], turns: int, with_prompt: bool) -> float:
+    samples = []
+    for _ in range(turns):
+        rows = json.loads(payload)
+        started = time.perf_counter()
+        history, _ = load(rows, settings)
+        if with_prompt:
+            build_prompt(history, "What next?")
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e6
+
+
+def retained_bytes(load: Callable, payload: str, settings: dict[str, Any]) -> int:
+    """Memory held by the loaded objects beyond the parsed rows themselves."""
+    rows = json.loads(payload)
+    gc.collect()
+    tracemalloc.start()
+    result = load(rows, settings)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=30)
+    parser.add_argument("--turns", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    history_rows, settings_row = build_rows(args.messages)
+    payload = json.dumps(history_rows)
+
+    print(f"{args.messages} history rows + settings, median of {args.turns} updates")
+    print(f"{'models':<10} {'load us':>9} {'load+prompt us':>15} {'retained KB':>12}")
+    for name, load in (("pydantic", load_pydantic), ("records", load_records)):
+        load_us = time_turns(load, payload, settings_row, args.turns, with_prompt=False)
+        turn_us = time_turns(load, payload, settings_row, args.turns, with_prompt=True)
+        retained = retained_bytes(load, payload, settings_row) / 1024
+        print(f"{name:<10} {load_us:>9.1f} {turn_us:>15.1f} {retained:>12.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
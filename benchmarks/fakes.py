@@ -0,0 +1,920 @@
+"""Local stand-ins for the Telegram Bot API, OpenAI and Supabase PostgREST.
+
+Each fake is a small FastAPI app with an injected latency per call and a shared
+`CallStats` recorder. They implement only what the bot uses, just well enough
+for the real client libraries to parse the responses.
+"""
+
+import asyncio
+import email
+import email.policy
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from urllib.parse import parse_qs
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from starlette.requests import ClientDisconnect
+
+# =============================================================================
+# Shared plumbing
+# =============================================================================
+
+@dataclass
+class Latency:
+    """Injected per-call delay: `base` seconds plus up to `jitter` seconds."""
+
+    base: float = 0.0
+    jitter: float = 0.0
+
+    async def sleep(self) -> None:
+        delay = self.base + random.random() * self.jitter
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+@dataclass
+class CallStats:
+    """Thread-safe per-endpoint call counts and server-side durations."""
+
+    durations: dict[tuple[str, str], list[float]] = field(default_factory=lambda: defaultdict(list))
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def record(self, service: str, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            self.durations[(service, endpoint)].append(seconds)
+
+    def counts_by_service(self) -> dict[str, int]:
+        with self._lock:
+            totals: dict[str, int] = defaultdict(int)
+            for (service, _), samples in self.durations.items():
+                totals[service] += len(samples)
+            return dict(totals)
+
+    def snapshot(self) -> dict[tuple[str, str], list[float]]:
+        with self._lock:
+            return {key: list(samples) for key, samples in self.durations.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.durations.clear()
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def make_app() -> FastAPI:
+    """FastAPI app that treats clients hanging up (e.g. cancelled hedges) as normal."""
+    app = FastAPI()
+
+    @app.exception_handler(ClientDisconnect)
+    async def client_disconnected(request: Request, exc: ClientDisconnect):
+        return Response(status_code=499)
+
+    return app
+
+
+# =============================================================================
+# Fake PostgREST (Supabase)
+# =============================================================================
+
+# Primary key and column defaults for the tables in schema.sql
+def _image_count(row: dict[str, Any]) -> int:
+    return (row.get("image_data") is not None) + len(row.get("extra_image_data") or [])
+
+
+TABLES: dict[str, dict[str, Any]] = {
+    "allowed_users": {"pk": ["telegram_id"], "defaults": {"is_active": True, "created_at": now_iso}},
+    "user_settings": {
+        "pk": ["user_id"],
+        "defaults": {
+            "selected_model": "gpt-5-mini",
+            "reasoning_effort": "medium",
+            "cache_responses": True,
+            "auto_route": False,
+            "updated_at": now_iso,
+        },
+    },
+    "chat_history": {
+        "pk": ["id"],
+        "unique": [["user_id", "message_id"]],
+        "generated": {
+            "has_image": lambda row: row.get("image_data") is not None,
+            "image_count": lambda row: _image_count(row),
+        },
+        "defaults": {
+            "id": lambda: str(uuid.uuid4()),
+            "seq": itertools.count(1).__next__,
+            "image_data": None,
+            "extra_image_data": None,
+            "message_id": None,
+            "merged_message_ids": None,
+            "session_id": 0,
+            "created_at": now_iso,
+        },
+    },
+    "conversation_state": {
+        "pk": ["user_id"],
+        "defaults": {
+            "pending_image_id": None,
+            "pending_image_unique_id": None,
+            "pending_extra_images": None,
+            "active_vector_store_id": None,
+            "session_id": 0,
+            "updated_at": now_iso,
+        },
+    },
+    "chat_history_archive": {
+        "pk": ["id"],
+        "generated": {"image_count": lambda row: _image_count(row)},
+        "defaults": {"archived_at": now_iso},
+    },
+    "response_cache": {"pk": ["key"], "defaults": {"created_at": now_iso}},
+    "usage_ledger": {
+        "pk": ["id"],
+        "defaults": {"id": itertools.count(1).__next__, "created_at": now_iso},
+    },
+    "batch_requests": {
+        "pk": ["id"],
+        "unique": [["user_id", "message_id"]],
+        "defaults": {
+            "id": itertools.count(1).__next__,
+            "session_id": 0,
+            "status": "queued",
+            "batch_id": None,
+            "response": None,
+            "error": None,
+            "input_tokens": 0,
+            "cached_tokens": 0,
+            "output_tokens": 0,
+            "created_at": now_iso,
+            "updated_at": now_iso,
+            "delivered_at": None,
+        },
+    },
+    "user_turn_locks": {"pk": ["user_id"], "defaults": {}},
+}
+
+
+def _start_new_session(db: "FakePostgrest", p_user_id: int) -> int:
+    state = db._conflicts("conversation_state", {"user_id": p_user_id})
+    if state is None:
+        state = db._with_defaults("conversation_state", {"user_id": p_user_id})
+        db.tables["conversation_state"].append(state)
+    state.update(session_id=state["session_id"] + 1, active_vector_store_id=None, updated_at=now_iso())
+    return state["session_id"]
+
+
+def _archive_chat_history(
+    db: "FakePostgrest",
+    p_before: str,
+    p_images_before: str,
+    p_keep_recent: int = 30,
+    p_batch_size: int = 500,
+) -> int:
+    before = datetime.fromisoformat(p_before).replace(tzinfo=None)
+    images_before = datetime.fromisoformat(p_images_before).replace(tzinfo=None)
+    sessions = {s["user_id"]: s["session_id"] for s in db.tables["conversation_state"]}
+
+    recent: dict[int, list[int]] = defaultdict(list)
+    for row in sorted(db.tables["chat_history"], key=lambda r: r["seq"], reverse=True):
+        if row["session_id"] == sessions.get(row["user_id"], 0) and len(recent[row["user_id"]]) < p_keep_recent:
+            recent[row["user_id"]].append(row["seq"])
+    kept = {seq for seqs in recent.values() for seq in seqs}
+
+    def qualifies(row: dict[str, Any]) -> bool:
+        created = datetime.fromisoformat(row["created_at"]).replace(tzinfo=None)
+        old = created < before or (row["image_data"] is not None and created < images_before)
+        return old and row["seq"] not in kept
+
+    moved = sorted((r for r in db.tables["chat_history"] if qualifies(r)), key=lambda r: r["seq"])[:p_batch_size]
+    doomed = {id(r) for r in moved}
+    db.tables["chat_history"] = [r for r in db.tables["chat_history"] if id(r) not in doomed]
+    db.seed("chat_history_archive", moved)
+    return len(moved)
+
+
+def _usage_summary(db: "FakePostgrest", p_since: str, p_user_id: int | None = None) -> list[dict[str, Any]]:
+    since = datetime.fromisoformat(p_since)
+    totals: dict[tuple[int, str], dict[str, Any]] = {}
+    for row in db.tables["usage_ledger"]:
+        if datetime.fromisoformat(row["created_at"]) < since:
+            continue
+        if p_user_id is not None and row["user_id"] != p_user_id:
+            continue
+        entry = totals.setdefault(
+            (row["user_id"], row["model"]),
+            {"user_id": row["user_id"], "model": row["model"], "requests": 0,
+             "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0},
+        )
+        entry["requests"] += 1
+        for column in ("input_tokens", "cached_tokens", "output_tokens"):
+            entry[column] += row[column]
+    return [totals[key] for key in sorted(totals)]
+
+
+def _claim_batch_requests(
+    db: "FakePostgrest", p_limit: int, p_stale_seconds: int = 900
+) -> list[dict[str, Any]]:
+    stale_before = datetime.now(timezone.utc).timestamp() - p_stale_seconds
+
+    def claimable(row: dict[str, Any]) -> bool:
+        if row["delivered_at"] is not None:
+            return False
+        if row["status"] == "queued":
+            return True
+        updated = datetime.fromisoformat(row["updated_at"]).timestamp()
+        return row["status"] == "submitting" and updated < stale_before
+
+    rows = [r for r in db.tables["batch_requests"] if claimable(r)]
+    claimed = sorted(rows, key=lambda r: r["id"])[:p_limit]
+    for row in claimed:
+        row.update(status="submitting", updated_at=now_iso())
+    return [dict(row) for row in claimed]
+
+
+def _acquire_turn_lock(db: "FakePostgrest", p_user_id: int, p_holder: str, p_ttl_seconds: int) -> bool:
+    now = datetime.now(timezone.utc)
+    expires_at = (now + timedelta(seconds=p_ttl_seconds)).isoformat()
+    lease = {"user_id": p_user_id, "holder": p_holder, "expires_at": expires_at}
+    existing = db._conflicts("user_turn_locks", lease)
+    if existing is None:
+        db.tables["user_turn_locks"].append(lease)
+        return True
+    if existing["holder"] == p_holder or datetime.fromisoformat(existing["expires_at"]) < now:
+        existing.update(lease)
+        return True
+    return False
+
+
+# SQL functions from schema.sql, called as handler(db, **arguments)
+RPCS: dict[str, Any] = {
+    "start_new_session": _start_new_session,
+    "archive_chat_history": _archive_chat_history,
+    "usage_summary": _usage_summary,
+    "claim_batch_requests": _claim_batch_requests,
+    "acquire_turn_lock": _acquire_turn_lock,
+}
+
+
+def _coerce(value: str, like: Any) -> Any:
+    """Convert a filter operand to the type of the stored value."""
+    if value == "null":
+        return None
+    if isinstance(like, bool):
+        return value == "true"
+    if isinstance(like, int):
+        return int(value)
+    if isinstance(like, float):
+        return float(value)
+    return value
+
+
+def _matches(row: dict[str, Any], column: str, expression: str) -> bool:
+    op, _, operand = expression.partition(".")
+    value = row.get(column)
+    if op == "is":
+        return value is None if operand == "null" else value == (operand == "true")
+    if op == "in":
+        options = operand.strip("()").split(",")
+        return any(value == _coerce(o, value) for o in options)
+    if op in ("cs", "ov"):
+        items = [o for o in operand.strip("{}").split(",") if o]
+        contained = [any(str(v) == o for v in value or []) for o in items]
+        return all(contained) if op == "cs" else any(contained)
+    if value is None:
+        return False
+    target = _coerce(operand, value)
+    return {
+        "eq": value == target,
+        "neq": value != target,
+        "gt": value > target,
+        "gte": value >= target,
+        "lt": value < target,
+        "lte": value <= target,
+    }.get(op, False)
+
+
+def _split_top_level(expression: str) -> list[str]:
+    """Split an or=(...) body on commas outside parentheses and braces."""
+    parts, depth, current = [], 0, ""
+    for char in expression:
+        if char in "({":
+            depth += 1
+        elif char in ")}":
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += char
+    return parts + [current] if current else parts
+
+
+def _matches_any(row: dict[str, Any], expression: str) -> bool:
+    """Evaluate an `or` filter such as (message_id.eq.5,merged_message_ids.cs.{5})."""
+    for condition in _split_top_level(expression[1:-1]):
+        column, _, rest = condition.partition(".")
+        if _matches(row, column, rest):
+            return True
+    return False
+
+
+class FakePostgrest:
+    """In-memory tables behind a PostgREST-compatible HTTP surface."""
+
+    RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+    def __init__(self, stats: CallStats, latency: Latency):
+        self.stats = stats
+        self.latency = latency
+        self.tables: dict[str, list[dict[str, Any]]] = defaultdict(list)
+        self.rpcs: dict[str, Any] = dict(RPCS)
+        self.lock = threading.Lock()
+        self.app = self._build_app()
+
+    # -- helpers -------------------------------------------------------------
+
+    def seed(self, table: str, rows: list[dict[str, Any]]) -> None:
+        for row in rows:
+            self.tables[table].append(self._with_defaults(table, row))
+
+    def _with_defaults(self, table: str, row: dict[str, Any]) -> dict[str, Any]:
+        full = {}
+        for column, default in TABLES.get(table, {}).get("defaults", {}).items():
+            full[column] = default() if callable(default) else default
+        for column, value in row.items():
+            full[column] = now_iso() if value == "now()" else value
+        for column, compute in TABLES.get(table, {}).get("generated", {}).items():
+            full[column] = compute(full)
+        return full
+
+    def _filter(self, table: str, params: dict[str, list[str]]) -> list[dict[str, Any]]:
+        rows = self.tables[table]
+        for column, expressions in params.items():
+            if column in self.RESERVED:
+                continue
+            for expression in expressions:
+                if column == "or":
+                    rows = [r for r in rows if _matches_any(r, expression)]
+                else:
+                    rows = [r for r in rows if _matches(r, column, expression)]
+        return rows
+
+    @staticmethod
+    def _project(rows: list[dict[str, Any]], select: str | None) -> list[dict[str, Any]]:
+        if not select or select.strip() == "*":
+            return [dict(r) for r in rows]
+        columns = [c.strip() for c in select.split(",")]
+        return [{c: r.get(c) for c in columns} for r in rows]
+
+    @staticmethod
+    def _order(rows: list[dict[str, Any]], order: str | None) -> list[dict[str, Any]]:
+        if not order:
+            return rows
+        for term in reversed(order.split(",")):
+            column, _, direction = term.partition(".")
+            desc = direction.startswith("desc")
+            rows = sorted(rows, key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        return rows
+
+    def _conflicts(self, table: str, row: dict[str, Any]) -> dict[str, Any] | None:
+        spec = TABLES.get(table, {})
+        keys = [spec.get("pk", [])] + spec.get("unique", [])
+        for columns in keys:
+            if not columns or any(row.get(c) is None for c in columns):
+                continue
+            for existing in self.tables[table]:
+                if all(existing.get(c) == row.get(c) for c in columns):
+                    return existing
+        return None
+
+    # -- HTTP ----------------------------------------------------------------
+
+    def _build_app(self) -> FastAPI:
+        app = make_app()
+
+        @app.api_route("/rest/v1/rpc/{name}", methods=["POST", "GET"])
+        async def rpc(name: str, request: Request):
+            started = time.perf_counter()
+            await self.latency.sleep()
+            body = await request.body()
+            args = json.loads(body) if body else {}
+            with self.lock:
+                handler = self.rpcs.get(name)
+                if handler is None:
+                    return JSONResponse({"message": f"function {name} not found"}, status_code=404)
+                result = handler(self, **args)
+            self.stats.record("db", f"rpc:{name}", time.perf_counter() - started)
+            return JSONResponse(result)
+
+        @app.api_route("/rest/v1/{table}", methods=["GET", "POST", "PATCH", "DELETE"])
+        async def table_endpoint(table: str, request: Request):
+            started = time.perf_counter()
+            await self.latency.sleep()
+            params = parse_qs(request.url.query, keep_blank_values=True)
+            prefer = request.headers.get("prefer", "")
+            body = await request.body()
+            payload = json.loads(body) if body else None
+
+            with self.lock:
+                response = self._handle(table, request.method, params, prefer, payload)
+            self.stats.record("db", f"{request.method} {table}", time.perf_counter() - started)
+            return response
+
+        return app
+
+    def _handle(
+        self,
+        table: str,
+        method: str,
+        params: dict[str, list[str]],
+        prefer: str,
+        payload: Any,
+    ) -> Response:
+        select = params.get("select", [None])[0]
+        headers = {}
+
+        if method == "GET":
+            rows = self._order(self._filter(table, params), params.get("order", [None])[0])
+            total = len(rows)
+            offset = int(params.get("offset", ["0"])[0])
+            if "limit" in params:
+                rows = rows[offset:offset + int(params["limit"][0])]
+            if "count=" in prefer:
+                headers["content-range"] = f"0-{max(0, len(rows) - 1)}/{total}"
+            return JSONResponse(self._project(rows, select), headers=headers)
+
+        if method == "POST":
+            rows = payload if isinstance(payload, list) else [payload]
+            upsert = "merge-duplicates" in prefer
+            written = []
+            for row in rows:
+                existing = self._conflicts(table, row)
+                if existing is not None and not upsert:
+                    return JSONResponse(
+                        {"code": "23505", "message": "duplicate key value violates unique constraint"},
+                        status_code=409,
+                    )
+                if existing is not None:
+                    existing.update({k: (now_iso() if v == "now()" else v) for k, v in row.items()})
+                    written.append(existing)
+                else:
+                    full = self._with_defaults(table, row)
+                    self.tables[table].append(full)
+                    written.append(full)
+            body = self._project(written, select) if "return=minimal" not in prefer else []
+            return JSONResponse(body, status_code=201)
+
+        if method == "PATCH":
+            rows = self._filter(table, params)
+            for row in rows:
+                row.update({k: (now_iso() if v == "now()" else v) for k, v in payload.items()})
+            body = self._project(rows, select) if "return=minimal" not in prefer else []
+            return JSONResponse(body)
+
+        if method == "DELETE":
+            rows = self._filter(table, params)
+            doomed = {id(r) for r in rows}
+            self.tables[table] = [r for r in self.tables[table] if id(r) not in doomed]
+            if "count=" in prefer:
+                headers["content-range"] = f"*/{len(rows)}"
+            body = self._project(rows, select) if "return=minimal" not in prefer else []
+            return JSONResponse(body, headers=headers)
+
+        return JSONResponse({"message": "method not allowed"}, status_code=405)
+
+
+# =============================================================================
+# Fake OpenAI
+# =============================================================================
+
+DATA_URL = re.compile(r"data:image/[a-z]+;base64,[A-Za-z0-9+/=]+")
+IMAGE_TOKENS = 765
+
+
+def _multipart_file(content_type: str, body: bytes) -> bytes:
+    """Content of the `file` field of a multipart/form-data upload."""
+    message = email.message_from_bytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body, policy=email.policy.HTTP
+    )
+    for part in message.iter_parts():
+        if part.get_param("name", header="content-disposition") == "file":
+            return part.get_payload(decode=True) or b""
+    return b""
+
+
+class FakeOpenAI:
+    """Responses, Chat Completions, Files, Batches and Vector Stores endpoints.
+
+    Prompt caching is simulated per `prompt_cache_key`: the cached token count
+    is the common prefix with the previous request sharing that key, so prompt
+    layout changes show up in the reported cache ratios. With `effort_scale`,
+    reasoning takes longer: a Responses call at "medium" effort is
+    (1 + effort_scale) times slower than at "low", at "high" (1 + 3 * effort_scale).
+    """
+
+    def __init__(
+        self,
+        stats: CallStats,
+        latency: Latency,
+        error_rate: float = 0.0,
+        reply_chars: int = 600,
+        model_latency: dict[str, Latency] | None = None,
+        batch_delay: float = 0.0,
+        effort_scale: float = 0.0,
+    ):
+        self.stats = stats
+        self.latency = latency
+        self.error_rate = error_rate
+        self.reply_chars = reply_chars
+        self.model_latency = model_latency or {}
+        self.effort_scale = effort_scale
+        self._last_prompt: dict[str, str] = {}
+        # Uploaded and generated files; batches complete `batch_delay` seconds after creation
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict[str, Any]] = {}
+        self.batch_delay = batch_delay
+        self._batch_ready_at: dict[str, float] = {}
+        self.app = self._build_app()
+
+    def _reply_text(self) -> str:
+        paragraph = "This is a synthetic answer from the benchmark stand-in. " * 4
+        text = ""
+        while len(text) < self.reply_chars:
+            text += paragraph.strip() + "\n\n"
+        return text[: self.reply_chars]
+
+    def _cached_tokens(self, cache_key: str | None, prompt: str) -> int:
+        if not cache_key:
+            return 0
+        previous = self._last_prompt.get(cache_key, "")
+        self._last_prompt[cache_key] = prompt
+        common = 0
+        for a, b in zip(previous, prompt):
+            if a != b:
+                break
+            common += 1
+        # Providers cache in 128-token increments above a 1024-token minimum
+        tokens = common // 4
+        return tokens - tokens % 128 if tokens >= 1024 else 0
+
+    async def _simulate(self, model: str | None, effort: str | None = None) -> Response | None:
+        latency = self.model_latency.get(model or "", self.latency)
+        factor = 1.0 + self.effort_scale * {"medium": 1, "high": 3}.get(effort or "", 0)
+        await Latency(latency.base * factor, latency.jitter * factor).sleep()
+        if self.error_rate and random.random() < self.error_rate:
+            return JSONResponse(
+                {"error": {"message": "Injected failure", "type": "server_error"}},
+                status_code=500,
+            )
+        return None
+
+    def _response(self, body: dict[str, Any]) -> dict[str, Any]:
+        """Responses API answer to a request body."""
+        prompt = json.dumps([body.get("instructions"), body.get("input")], sort_keys=True)
+        # Images are billed per tile, not per base64 character
+        images = len(DATA_URL.findall(prompt))
+        prompt = DATA_URL.sub(lambda m: hashlib.sha1(m.group().encode()).hexdigest(), prompt)
+        input_tokens = len(prompt) // 4 + images * IMAGE_TOKENS
+        cached = self._cached_tokens(body.get("prompt_cache_key"), prompt)
+        text = self._reply_text()
+        return {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": body.get("model"),
+            "status": "completed",
+            "output": [
+                {
+                    "type": "message",
+                    "id": f"msg_{uuid.uuid4().hex}",
+                    "status": "completed",
+                    "role": "assistant",
+                    "content": [{"type": "output_text", "text": text, "annotations": []}],
+                }
+            ],
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {
+                "input_tokens": input_tokens,
+                "input_tokens_details": {"cached_tokens": cached},
+                "output_tokens": len(text) // 4,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": input_tokens + len(text) // 4,
+            },
+        }
+
+    def _run_batch(self, batch: dict[str, Any]) -> None:
+        """Answer every line of a batch's input file and attach the output file."""
+        output = []
+        for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines():
+            request = json.loads(line)
+            output.append({
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "request_id": uuid.uuid4().hex,
+                    "body": self._response(request["body"]),
+                },
+                "error": None,
+            })
+        output_file_id = f"file-{uuid.uuid4().hex}"
+        self.files[output_file_id] = "\n".join(json.dumps(line) for line in output).encode("utf-8")
+        batch.update(
+            status="completed",
+            output_file_id=output_file_id,
+            completed_at=int(time.time()),
+            request_counts={"total": len(output), "completed": len(output), "failed": 0},
+        )
+
+    def _build_app(self) -> FastAPI:
+        app = make_app()
+
+        @app.post("/v1/responses")
+        async def responses(request: Request):
+            started = time.perf_counter()
+            body = await request.json()
+            effort = (body.get("reasoning") or {}).get("effort")
+            error = await self._simulate(body.get("model"), effort)
+            self.stats.record("openai", "POST /responses", time.perf_counter() - started)
+            if error:
+                return error
+            return self._response(body)
+
+        @app.post("/v1/chat/completions")
+        async def chat_completions(request: Request):
+            started = time.perf_counter()
+            body = await request.json()
+            model = body.get("model")
+            error = await self._simulate(model)
+            self.stats.record("openai", "POST /chat/completions", time.perf_counter() - started)
+            if error:
+                return error
+
+            text = self._reply_text()
+            prompt_tokens = len(json.dumps(body.get("messages"))) // 4
+            return {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": text},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(text) // 4,
+                    "total_tokens": prompt_tokens + len(text) // 4,
+                },
+            }
+
+        @app.post("/v1/files")
+        async def create_file(request: Request):
+            started = time.perf_counter()
+            await self.latency.sleep()
+            content = _multipart_file(request.headers.get("content-type", ""), await request.body())
+            self.stats.record("openai", "POST /files", time.perf_counter() - started)
+            file_id = f"file-{uuid.uuid4().hex}"
+            self.files[file_id] = content
+            return {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(content),
+                "created_at": int(time.time()),
+                "filename": "upload",
+                "purpose": "assistants",
+                "status": "processed",
+            }
+
+        @app.get("/v1/files/{file_id}/content")
+        async def file_content(file_id: str):
+            started = time.perf_counter()
+            await self.latency.sleep()
+            self.stats.record("openai", "GET /files/content", time.perf_counter() - started)
+            if file_id not in self.files:
+                return JSONResponse(
+                    {"error": {"message": "No such file", "type": "invalid_request_error"}}, status_code=404
+                )
+            return Response(content=self.files[file_id], media_type="application/octet-stream")
+
+        @app.post("/v1/batches")
+        async def create_batch(request: Request):
+            started = time.perf_counter()
+            await self.latency.sleep()
+            body = await request.json()
+            self.stats.record("openai", "POST /batches", time.perf_counter() - started)
+            batch = {
+                "id": f"batch_{uuid.uuid4().hex}",
+                "object": "batch",
+                "endpoint": body["endpoint"],
+                "input_file_id": body["input_file_id"],
+                "completion_window": body["completion_window"],
+                "status": "in_progress",
+                "output_file_id": None,
+                "error_file_id": None,
+                "created_at": int(time.time()),
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            }
+            self.batches[batch["id"]] = batch
+            self._batch_ready_at[batch["id"]] = time.monotonic() + self.batch_delay
+            return batch
+
+        @app.get("/v1/batches/{batch_id}")
+        async def retrieve_batch(batch_id: str):
+            started = time.perf_counter()
+            await self.latency.sleep()
+            self.stats.record("openai", "GET /batches", time.perf_counter() - started)
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return JSONResponse(
+                    {"error": {"message": "No such batch", "type": "invalid_request_error"}}, status_code=404
+                )
+            if batch["status"] == "in_progress" and time.monotonic() >= self._batch_ready_at[batch_id]:
+                self._run_batch(batch)
+            return batch
+
+        @app.post("/v1/vector_stores")
+        async def create_vector_store():
+            started = time.perf_counter()
+            await self.latency.sleep()
+            self.stats.record("openai", "POST /vector_stores", time.perf_counter() - started)
+            return self._vector_store(f"vs_{uuid.uuid4().hex}")
+
+        @app.post("/v1/vector_stores/{vector_store_id}/files")
+        async def add_vector_store_file(vector_store_id: str, request: Request):
+            started = time.perf_counter()
+            await self.latency.sleep()
+            body = await request.json()
+            self.stats.record("openai", "POST /vector_stores/files", time.perf_counter() - started)
+            return {
+                "id": body.get("file_id"),
+                "object": "vector_store.file",
+                "created_at": int(time.time()),
+                "vector_store_id": vector_store_id,
+                "status": "completed",
+                "usage_bytes": 0,
+            }
+
+        @app.get("/v1/vector_stores/{vector_store_id}")
+        async def retrieve_vector_store(vector_store_id: str):
+            started = time.perf_counter()
+            await self.latency.sleep()
+            self.stats.record("openai", "GET /vector_stores", time.perf_counter() - started)
+            return self._vector_store(vector_store_id)
+
+        return app
+
+    @staticmethod
+    def _vector_store(vector_store_id: str) -> dict[str, Any]:
+        return {
+            "id": vector_store_id,
+            "object": "vector_store",
+            "created_at": int(time.time()),
+            "name": "bench",
+            "status": "completed",
+            "usage_bytes": 0,
+            "file_counts": {"in_progress": 0, "completed": 1, "failed": 0, "cancelled": 0, "total": 1},
+        }
+
+
+# =============================================================================
+# Fake Telegram Bot API
+# =============================================================================
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Voroojak", "username": "voroojak_bot"}
+
+
+class FakeTelegram:
+    """Bot API methods used by the handlers, plus file downloads.
+
+    Payloads appended to `updates` are served by getUpdates (without waiting
+    for new ones) until an offset confirms them.
+    """
+
+    def __init__(self, stats: CallStats, latency: Latency, file_size: int = 150_000):
+        self.stats = stats
+        self.latency = latency
+        self.file_size = file_size
+        self._file_bytes = random.randbytes(file_size)
+        self._message_ids = iter(range(10_000_000, 100_000_000))
+        self.updates: list[dict[str, Any]] = []
+        self.app = self._build_app()
+
+    def _message(self, chat_id: Any, **extra: Any) -> dict[str, Any]:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id or 0), "type": "private"},
+            "from": BOT_USER,
+            **extra,
+        }
+
+    async def _params(self, request: Request) -> dict[str, Any]:
+        content_type = request.headers.get("content-type", "")
+        body = await request.body()
+        if not body or content_type.startswith("multipart/"):
+            return {}
+        if content_type.startswith("application/json"):
+            return json.loads(body)
+        return {k: v[0] for k, v in parse_qs(body.decode("utf-8")).items()}
+
+    def _build_app(self) -> FastAPI:
+        app = make_app()
+
+        @app.post("/bot{token}/{method}")
+        async def bot_method(token: str, method: str, request: Request):
+            started = time.perf_counter()
+            await self.latency.sleep()
+            params = await self._params(request)
+            result = self._dispatch(method, params)
+            self.stats.record("telegram", method, time.perf_counter() - started)
+            return {"ok": True, "result": result}
+
+        @app.get("/file/bot{token}/{path:path}")
+        async def download(token: str, path: str):
+            started = time.perf_counter()
+            await self.latency.sleep()
+            self.stats.record("telegram", "download", time.perf_counter() - started)
+            return Response(self._file_bytes, media_type="application/octet-stream")
+
+        return app
+
+    def _dispatch(self, method: str, params: dict[str, Any]) -> Any:
+        if method == "getMe":
+            return {**BOT_USER, "can_join_groups": False, "can_read_all_group_messages": False,
+                    "supports_inline_queries": False}
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(params.get("chat_id"), text=params.get("text", ""))
+        if method == "sendDocument":
+            return self._message(
+                params.get("chat_id"),
+                document={"file_id": "doc", "file_unique_id": "doc"},
+            )
+        if method == "getFile":
+            file_id = params.get("file_id", "file")
+            return {
+                "file_id": file_id,
+                "file_unique_id": f"u-{file_id}",
+                "file_size": self.file_size,
+                "file_path": f"files/{file_id}",
+            }
+        if method == "getUpdates":
+            offset = int(params.get("offset") or 0)
+            # Updates below the offset are confirmed and forgotten
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            return self.updates[: int(params.get("limit") or 100)]
+        # setWebhook, deleteWebhook, sendChatAction, answerCallbackQuery, ...
+        return True
+
+
+# =============================================================================
+# Serving
+# =============================================================================
+
+class BackgroundServer:
+    """Run an ASGI app with uvicorn on its own thread and event loop.
+
+    The bot's Supabase client is synchronous, so the fakes must not share the
+    event loop of the app under test.
+    """
+
+    def __init__(self, app: FastAPI, port: int):
+        config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.port = port
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> None:
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Fake server on port {self.port} did not start")
+            time.sleep(0.01)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
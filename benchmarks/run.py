@@ -0,0 +1,317 @@
+"""End-to-end load test of the webhook against local fakes.
+
+Usage:
+    python -m benchmarks.run --updates 500 --concurrency 16 --openai-latency 0.3
+
+The FastAPI app in api/webhook.py is driven in-process over ASGI. Telegram,
+OpenAI and Supabase are replaced by the stand-ins in benchmarks/fakes.py,
+served on local ports. The report covers throughput, end-to-end latency
+percentiles per update kind, per-endpoint latency of the fakes and
+upstream calls per update. With --trace, per-stage latency is collected
+from the app's own spans (see src/tracing.py). With --polling-workers, the
+updates are served through getUpdates to the long-polling runner
+(src/bot/polling.py) instead, and only throughput is reported.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any
+
+from benchmarks.fakes import (
+    BackgroundServer,
+    CallStats,
+    FakeOpenAI,
+    FakePostgrest,
+    FakeTelegram,
+    Latency,
+)
+from benchmarks.workload import UpdateStream
+
+BOT_TOKEN = "123456:BENCHMARK"
+CRON_SECRET = "benchmark-cron"
+
+
+def percentile(samples: list[float], q: float) -> float:
+    """Nearest-rank percentile (0-100)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=300, help="Number of updates to replay")
+    parser.add_argument("--concurrency", type=int, default=16, help="Updates in flight at once")
+    parser.add_argument("--users", type=int, default=20, help="Distinct synthetic users")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--db-latency", type=float, default=0.005, help="Seconds per PostgREST call")
+    parser.add_argument("--openai-latency", type=float, default=0.3, help="Seconds per model call")
+    parser.add_argument("--telegram-latency", type=float, default=0.02, help="Seconds per Bot API call")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Random extra latency, as a fraction of base")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0, help="Fraction of model calls that fail")
+    parser.add_argument("--effort-scale", type=float, default=0.0,
+                        help="Extra model latency per reasoning step above low (see FakeOpenAI)")
+    parser.add_argument("--user-model", type=str, default=None, help="Model selected by every user")
+    parser.add_argument("--user-effort", type=str, default=None,
+                        help="Reasoning effort of every user")
+    parser.add_argument("--auto-route", action="store_true",
+                        help="Turn on auto routing for every user")
+    parser.add_argument("--mix", type=str, default=None, help='JSON weights, e.g. \'{"text": 1}\'')
+    parser.add_argument("--port", type=int, default=18080, help="First port for the fakes")
+    parser.add_argument("--json", type=str, default=None, help="Also write the report to this file")
+    parser.add_argument("--trace", action="store_true", help="Report per-stage latency from app spans")
+    parser.add_argument("--polling-workers", type=int, default=0,
+                        help="Run the long-polling runner with this many worker processes")
+    return parser.parse_args(argv)
+
+
+def latency(base: float, jitter: float) -> Latency:
+    return Latency(base=base, jitter=base * jitter)
+
+
+def configure_environment(args: argparse.Namespace, db: str, openai: str, telegram: str) -> None:
+    """Point the app's settings at the fakes. Must run before importing the app."""
+    os.environ.update(
+        {
+            "TELEGRAM_TOKEN": BOT_TOKEN,
+            "WEBHOOK_URL": "http://127.0.0.1/api/webhook",
+            "TELEGRAM_BASE_URL": f"{telegram}/bot",
+            "TELEGRAM_BASE_FILE_URL": f"{telegram}/file/bot",
+            "OPENAI_API_KEY": "sk-benchmark",
+            "OPENAI_BASE_URL": f"{openai}/v1",
+            "SUPABASE_URL": db,
+            "SUPABASE_KEY": "benchmark-key",
+            "CRON_SECRET": CRON_SECRET,
+        }
+    )
+
+
+class StageRecorder:
+    """Span exporter that keeps durations per span name."""
+
+    def __init__(self):
+        self.durations: dict[str, list[float]] = defaultdict(list)
+
+    def on_start(self, span) -> None:
+        pass
+
+    def on_end(self, span) -> None:
+        self.durations[span.name].append(span.duration)
+
+
+async def drive(app: Any, updates: list, concurrency: int) -> tuple[float, dict[str, list[float]], int]:
+    """POST every update to the webhook with bounded concurrency."""
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    timings: dict[str, list[float]] = defaultdict(list)
+    failures = 0
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def send(update) -> None:
+            nonlocal failures
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/api/webhook", json=update.payload)
+                timings[update.kind].append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(u) for u in updates))
+        elapsed = time.perf_counter() - started
+
+    return elapsed, timings, failures
+
+
+async def drive_polling(
+    telegram: FakeTelegram, updates: list, workers: int, concurrency: int
+) -> tuple[float, int, int]:
+    """Serve the updates through getUpdates to the polling runner and wait until all are handled.
+
+    getUpdates never repeats an update, so duplicate deliveries are left out.
+    Throughput is timed from the first finished update, so worker start-up is
+    not counted. Returns (elapsed, updates served, updates not handled).
+    """
+    os.environ.update(
+        {
+            "POLLING_WORKER_CONCURRENCY": str(math.ceil(concurrency / workers)),
+            "POLLING_OFFSET_PATH": os.path.join(tempfile.mkdtemp(), "offset.json"),
+            "POLLING_SHUTDOWN_TIMEOUT_SECONDS": "30",
+        }
+    )
+    from src.bot.polling import Checkpoint, Poller
+    from src.config import settings
+
+    poller = Poller(
+        workers,
+        Checkpoint(settings.polling_offset_path),
+        timeout=0,
+        shutdown_timeout=settings.polling_shutdown_timeout_seconds,
+        worker_concurrency=settings.polling_worker_concurrency,
+    )
+    payloads = {update.payload["update_id"]: update.payload for update in updates}
+    telegram.updates.extend(payload for _, payload in sorted(payloads.items()))
+    running = asyncio.create_task(poller.run())
+    first_done = None
+    # Bound for a stuck run
+    deadline = time.perf_counter() + 120 + len(payloads)
+    while poller.finished < len(payloads) and not running.done() and time.perf_counter() < deadline:
+        if first_done is None and poller.finished:
+            first_done = time.perf_counter()
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - (first_done or time.perf_counter())
+    poller.stop()
+    await running
+    return elapsed, len(payloads), len(payloads) - poller.finished
+
+
+async def run_batch_cron(app: Any) -> dict[str, int]:
+    """Two runs of the batch job: submit what /later queued, then collect and deliver it."""
+    import httpx
+
+    totals: dict[str, int] = defaultdict(int)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(2):
+            response = await client.get(
+                "/api/cron/batches", headers={"authorization": f"Bearer {CRON_SECRET}"}
+            )
+            response.raise_for_status()
+            for name, count in response.json().items():
+                totals[name] += count
+    return dict(totals)
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    stats = CallStats()
+    db = FakePostgrest(stats, latency(args.db_latency, args.jitter))
+    openai = FakeOpenAI(
+        stats,
+        latency(args.openai_latency, args.jitter),
+        error_rate=args.openai_error_rate,
+        effort_scale=args.effort_scale,
+    )
+    telegram = FakeTelegram(stats, latency(args.telegram_latency, args.jitter))
+
+    servers = [
+        BackgroundServer(db.app, args.port),
+        BackgroundServer(openai.app, args.port + 1),
+        BackgroundServer(telegram.app, args.port + 2),
+    ]
+    for server in servers:
+        server.start()
+
+    try:
+        configure_environment(args, servers[0].url, servers[1].url, servers[2].url)
+        if not args.polling_workers:
+            from api.webhook import app
+        from src.tracing import tracer
+
+        stages = StageRecorder()
+        if args.trace:
+            tracer.add_exporter(stages)
+
+        mix = json.loads(args.mix) if args.mix else None
+        stream = UpdateStream(args.users, mix=mix, seed=args.seed)
+        db.seed("allowed_users", [{"telegram_id": uid, "username": f"bench{uid}"} for uid in stream.user_ids()])
+        user_settings = {"auto_route": args.auto_route}
+        if args.user_model:
+            user_settings["selected_model"] = args.user_model
+        if args.user_effort:
+            user_settings["reasoning_effort"] = args.user_effort
+        db.seed("user_settings", [{"user_id": uid, **user_settings} for uid in stream.user_ids()])
+        updates = stream.take(args.updates)
+
+        if args.polling_workers:
+            stats.reset()
+            elapsed, served, failures = await drive_polling(
+                telegram, updates, args.polling_workers, args.concurrency
+            )
+            timings, batch_jobs = {}, {}
+        else:
+            served = len(updates)
+            async with app.router.lifespan_context(app):
+                stats.reset()
+                stages.durations.clear()
+                elapsed, timings, failures = await drive(app, updates, args.concurrency)
+                batch_jobs = await run_batch_cron(app)
+    finally:
+        for server in servers:
+            server.stop()
+
+    all_samples = [s for samples in timings.values() for s in samples]
+    counts = stats.counts_by_service()
+    return {
+        "updates": served,
+        "concurrency": args.concurrency,
+        "elapsed_s": elapsed,
+        "updates_per_s": served / elapsed if elapsed else 0.0,
+        "failures": failures,
+        "batch_jobs": batch_jobs,
+        "end_to_end": summarize(all_samples),
+        "by_kind": {kind: summarize(samples) for kind, samples in sorted(timings.items())},
+        "calls_per_update": {service: n / served for service, n in sorted(counts.items())},
+        "upstream": {
+            f"{service} {endpoint}": summarize(samples)
+            for (service, endpoint), samples in sorted(stats.snapshot().items())
+        },
+        "stages": {name: summarize(samples) for name, samples in sorted(stages.durations.items())},
+    }
+
+
+def print_report(report: dict[str, Any]) -> None:
+    print()
+    print(f"Updates:      {report['updates']} at concurrency {report['concurrency']}")
+    print(f"Elapsed:      {report['elapsed_s']:.2f}s  ({report['updates_per_s']:.1f} updates/s)")
+    print(f"Failures:     {report['failures']}")
+    print("Batch jobs:   " + ", ".join(f"{k}={v}" for k, v in report["batch_jobs"].items()))
+    print("Calls/update: " + ", ".join(f"{k}={v:.2f}" for k, v in report["calls_per_update"].items()))
+
+    def table(title: str, rows: dict[str, dict[str, float]]) -> None:
+        print()
+        print(f"{title:<40} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for name, row in rows.items():
+            print(
+                f"{name:<40} {row['count']:>7} {row['p50_ms']:>9.1f} "
+                f"{row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}"
+            )
+
+    table("End-to-end by update kind", {"all": report["end_to_end"], **report["by_kind"]})
+    table("Upstream endpoint (server side)", report["upstream"])
+    if report["stages"]:
+        table("Pipeline stage (app spans)", report["stages"])
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""Synthetic Telegram update streams for the benchmark harness."""
+
+import itertools
+import random
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any
+
+# Relative frequency of each update kind
+DEFAULT_MIX = {
+    "text": 70,
+    "photo_caption": 8,
+    "photo_bare": 5,
+    "album": 2,
+    "burst": 4,
+    "document": 2,
+    "callback": 10,
+    "export": 1,
+    "usage": 1,
+    "later": 1,
+    "duplicate": 5,
+}
+
+PROMPTS = [
+    "Translate this to French: good morning, how are you?",
+    "Summarize the plot of Hamlet in three sentences.",
+    "What's the difference between a list and a tuple in Python?",
+    "thanks!",
+    "Write a haiku about serverless functions.",
+    "Explain TCP slow start like I'm five.",
+    "```python\ndef f(x):\n    return x * 2\n```\nWhy does this return a string when x is '3'?",
+]
+
+# Fraction of photos that repeat an earlier one
+PHOTO_REUSE = 0.3
+
+CALLBACKS = [
+    "model:gpt-5-mini",
+    "model:gpt-4.1",
+    "reasoning:low",
+    "reasoning:medium",
+    "newchat:confirm",
+    "noop",
+]
+
+
+@dataclass
+class SyntheticUpdate:
+    """One webhook payload and the kind of traffic it represents."""
+
+    kind: str
+    payload: dict[str, Any]
+
+
+class UpdateStream:
+    """Deterministic generator of webhook payloads for `users` users."""
+
+    def __init__(self, users: int, mix: dict[str, int] | None = None, seed: int = 7):
+        self.users = users
+        self.mix = mix or DEFAULT_MIX
+        self.random = random.Random(seed)
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1000)
+        self._sent: list[SyntheticUpdate] = []
+        self._photo_ids: list[str] = []
+
+    def user_ids(self) -> list[int]:
+        return [100_000 + i for i in range(self.users)]
+
+    def __iter__(self) -> Iterator[SyntheticUpdate]:
+        kinds = list(self.mix)
+        weights = [self.mix[k] for k in kinds]
+        while True:
+            kind = self.random.choices(kinds, weights)[0]
+            if kind == "duplicate":
+                if not self._sent:
+                    continue
+                # Telegram retries resend the identical payload
+                original = self.random.choice(self._sent[-50:])
+                yield SyntheticUpdate("duplicate", original.payload)
+                continue
+            if kind in ("album", "burst"):
+                # Several updates from one user, sent back to back
+                for payload in self._album() if kind == "album" else self._burst():
+                    update = SyntheticUpdate(kind, payload)
+                    self._sent.append(update)
+                    yield update
+                continue
+
+            update = SyntheticUpdate(kind, self._build(kind))
+            self._sent.append(update)
+            yield update
+
+    def take(self, count: int) -> list[SyntheticUpdate]:
+        return list(itertools.islice(self, count))
+
+    # -- payload builders ----------------------------------------------------
+
+    def _user(self, user_id: int) -> dict[str, Any]:
+        return {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"bench{user_id}"}
+
+    def _message(self, user_id: int, **extra: Any) -> dict[str, Any]:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            **extra,
+        }
+
+    def _photo(self) -> list[dict[str, Any]]:
+        # Some photos are re-sent or forwarded: same file_unique_id again
+        if self._photo_ids and self.random.random() < PHOTO_REUSE:
+            file_id = self.random.choice(self._photo_ids[-20:])
+        else:
+            file_id = f"photo-{self.random.getrandbits(32):08x}"
+            self._photo_ids.append(file_id)
+        return [
+            {"file_id": f"{file_id}-s", "file_unique_id": f"{file_id}-s", "width": 90, "height": 90},
+            {"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 960},
+        ]
+
+    def _album(self) -> list[dict[str, Any]]:
+        user_id = self.random.choice(self.user_ids())
+        group_id = str(self.random.getrandbits(48))
+        updates = []
+        for i in range(self.random.randint(2, 4)):
+            extra: dict[str, Any] = {"caption": "Compare these pictures."} if i == 0 else {}
+            message = self._message(user_id, photo=self._photo(), media_group_id=group_id, **extra)
+            updates.append({"update_id": next(self._update_ids), "message": message})
+        return updates
+
+    def _burst(self) -> list[dict[str, Any]]:
+        """A long paste split by Telegram, or a few quick thoughts."""
+        user_id = self.random.choice(self.user_ids())
+        return [
+            {"update_id": next(self._update_ids), "message": self._message(user_id, text=self.random.choice(PROMPTS))}
+            for _ in range(self.random.randint(2, 3))
+        ]
+
+    def _build(self, kind: str) -> dict[str, Any]:
+        user_id = self.random.choice(self.user_ids())
+        update: dict[str, Any] = {"update_id": next(self._update_ids)}
+
+        if kind == "text":
+            update["message"] = self._message(user_id, text=self.random.choice(PROMPTS))
+        elif kind == "photo_caption":
+            update["message"] = self._message(
+                user_id, photo=self._photo(), caption="What is in this picture?"
+            )
+        elif kind == "photo_bare":
+            update["message"] = self._message(user_id, photo=self._photo())
+        elif kind == "document":
+            file_id = f"doc-{self.random.getrandbits(32):08x}"
+            update["message"] = self._message(
+                user_id,
+                document={
+                    "file_id": file_id,
+                    "file_unique_id": file_id,
+                    "file_name": "report.pdf",
+                    "mime_type": "application/pdf",
+                },
+            )
+        elif kind in ("export", "usage"):
+            command = f"/{kind}"
+            update["message"] = self._message(
+                user_id,
+                text=command,
+                entities=[{"type": "bot_command", "offset": 0, "length": len(command)}],
+            )
+        elif kind == "later":
+            command = "/later"
+            update["message"] = self._message(
+                user_id,
+                text=f"{command} {self.random.choice(PROMPTS)}",
+                entities=[{"type": "bot_command", "offset": 0, "length": len(command)}],
+            )
+        elif kind == "callback":
+            update["callback_query"] = {
+                "id": str(self.random.getrandbits(48)),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": self.random.choice(CALLBACKS),
+                "message": self._message(user_id, text="⚙️ Settings"),
+            }
+        return update
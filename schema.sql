@@ -23,6 +23,8 @@ CREATE TABLE IF NOT EXISTS user_settings (
     user_id BIGINT PRIMARY KEY REFERENCES allowed_users(telegram_id) ON DELETE CASCADE,
     selected_model TEXT DEFAULT 'gpt-5-mini',
     reasoning_effort TEXT DEFAULT 'medium',
+    cache_responses BOOLEAN DEFAULT TRUE,
+    auto_route BOOLEAN DEFAULT FALSE,  -- Pick model and reasoning per message
     updated_at TIMESTAMP DEFAULT NOW(),
     CHECK (reasoning_effort IN ('low', 'medium', 'high'))
 );
@@ -33,38 +35,365 @@ CREATE TABLE IF NOT EXISTS user_settings (
 -- =============================================================================
 CREATE TABLE IF NOT EXISTS chat_history (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    -- Insertion order; unique and strictly increasing, used for ordering and keyset pagination
+    seq BIGINT GENERATED ALWAYS AS IDENTITY,
     user_id BIGINT REFERENCES allowed_users(telegram_id) ON DELETE CASCADE,
     role TEXT NOT NULL,
     content TEXT NOT NULL,
     image_data TEXT,
+    -- Further images of an album, after the one in image_data
+    extra_image_data TEXT[],
+    has_image BOOLEAN GENERATED ALWAYS AS (image_data IS NOT NULL) STORED,
+    -- Number of images (image_data plus extra_image_data), for listings without the payload
+    image_count SMALLINT GENERATED ALWAYS AS (
+        (image_data IS NOT NULL)::INT + COALESCE(CARDINALITY(extra_image_data), 0)
+    ) STORED,
     message_id BIGINT,
+    -- Further Telegram messages answered in the same turn (coalesced bursts)
+    merged_message_ids BIGINT[],
+    session_id INTEGER NOT NULL DEFAULT 0,
     created_at TIMESTAMP DEFAULT NOW(),
     CHECK (role IN ('user', 'assistant'))
 );
 
+-- =============================================================================
+-- Table: chat_history_archive
+-- Purpose: Cold storage for chat_history rows moved out by archive_chat_history.
+-- Large text columns use lz4 TOAST compression (PostgreSQL 14+).
+-- =============================================================================
+CREATE TABLE IF NOT EXISTS chat_history_archive (
+    id UUID PRIMARY KEY,
+    seq BIGINT NOT NULL,
+    user_id BIGINT REFERENCES allowed_users(telegram_id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    content TEXT COMPRESSION lz4 NOT NULL,
+    image_data TEXT COMPRESSION lz4,
+    extra_image_data TEXT[] COMPRESSION lz4,
+    image_count SMALLINT GENERATED ALWAYS AS (
+        (image_data IS NOT NULL)::INT + COALESCE(CARDINALITY(extra_image_data), 0)
+    ) STORED,
+    message_id BIGINT,
+    merged_message_ids BIGINT[],
+    session_id INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP,
+    archived_at TIMESTAMP DEFAULT NOW()
+);
+
 -- =============================================================================
 -- Table: conversation_state
 -- Purpose: Store ephemeral state for conversation flow (e.g. pending images)
+-- and the user's current session: /newchat bumps session_id, and only
+-- chat_history rows of the current session are used as context
 -- =============================================================================
 CREATE TABLE IF NOT EXISTS conversation_state (
     user_id BIGINT PRIMARY KEY REFERENCES allowed_users(telegram_id) ON DELETE CASCADE,
     pending_image_id TEXT,
+    pending_image_unique_id TEXT,
+    -- Further images of a pending album: [{"file_id": ..., "file_unique_id": ...}]
+    pending_extra_images JSONB,
     active_vector_store_id TEXT,
+    session_id INTEGER NOT NULL DEFAULT 0,
     updated_at TIMESTAMP DEFAULT NOW()
 );
 
+-- =============================================================================
+-- Table: response_cache
+-- Purpose: Shared cache of model answers for repeated prompts (RESPONSE_CACHE_BACKEND=postgres)
+-- =============================================================================
+CREATE TABLE IF NOT EXISTS response_cache (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- =============================================================================
+-- Table: usage_ledger
+-- Purpose: Token usage per model call, for per-user quotas and usage reports.
+-- Rows are append-only and written in batches.
+-- =============================================================================
+CREATE TABLE IF NOT EXISTS usage_ledger (
+    id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    user_id BIGINT REFERENCES allowed_users(telegram_id) ON DELETE CASCADE,
+    model TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- =============================================================================
+-- Table: batch_requests
+-- Purpose: Non-interactive requests (/later) answered through the OpenAI
+-- Batch API. Lifecycle: queued -> submitting -> submitted -> completed or
+-- failed; delivered_at is set once the user has been sent the outcome.
+-- =============================================================================
+CREATE TABLE IF NOT EXISTS batch_requests (
+    id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    user_id BIGINT REFERENCES allowed_users(telegram_id) ON DELETE CASCADE,
+    chat_id BIGINT NOT NULL,
+    message_id BIGINT NOT NULL,  -- The /later message; answers reply to it
+    session_id INTEGER NOT NULL DEFAULT 0,
+    prompt TEXT NOT NULL,  -- The question, as saved to chat_history
+    model TEXT NOT NULL,
+    body JSONB NOT NULL,  -- Responses API request body
+    status TEXT NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'submitting', 'submitted', 'completed', 'failed')),
+    batch_id TEXT,
+    response TEXT,
+    error TEXT,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    delivered_at TIMESTAMPTZ,
+    -- Telegram retries of the same /later message queue it once
+    UNIQUE (user_id, message_id)
+);
+
+-- =============================================================================
+-- Table: user_turn_locks
+-- Purpose: Per-user turn lock shared by all instances. A turn holds the lease
+-- from reading its context until its answer is saved, so turns of one user
+-- read and write history in order. Advisory locks do not fit PostgREST (each
+-- request runs in its own transaction on a pooled connection), so the lock is
+-- a row with an expiry: a lease left by a crashed instance simply runs out.
+-- =============================================================================
+CREATE TABLE IF NOT EXISTS user_turn_locks (
+    user_id BIGINT PRIMARY KEY,
+    holder TEXT NOT NULL,  -- Random ID of the turn holding the lock
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+-- =============================================================================
+-- Upgrading an existing database: add columns introduced after the first release
+-- =============================================================================
+ALTER TABLE user_settings ADD COLUMN IF NOT EXISTS cache_responses BOOLEAN DEFAULT TRUE;
+ALTER TABLE user_settings ADD COLUMN IF NOT EXISTS auto_route BOOLEAN DEFAULT FALSE;
+ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS session_id INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE conversation_state ADD COLUMN IF NOT EXISTS session_id INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE conversation_state ADD COLUMN IF NOT EXISTS pending_image_unique_id TEXT;
+-- Existing rows are numbered in physical order, close to insertion order
+ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS seq BIGINT GENERATED ALWAYS AS IDENTITY;
+ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS has_image BOOLEAN
+    GENERATED ALWAYS AS (image_data IS NOT NULL) STORED;
+ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS extra_image_data TEXT[];
+ALTER TABLE chat_history_archive ADD COLUMN IF NOT EXISTS extra_image_data TEXT[] COMPRESSION lz4;
+ALTER TABLE conversation_state ADD COLUMN IF NOT EXISTS pending_extra_images JSONB;
+ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS merged_message_ids BIGINT[];
+ALTER TABLE chat_history_archive ADD COLUMN IF NOT EXISTS merged_message_ids BIGINT[];
+ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS image_count SMALLINT GENERATED ALWAYS AS (
+    (image_data IS NOT NULL)::INT + COALESCE(CARDINALITY(extra_image_data), 0)
+) STORED;
+ALTER TABLE chat_history_archive ADD COLUMN IF NOT EXISTS image_count SMALLINT GENERATED ALWAYS AS (
+    (image_data IS NOT NULL)::INT + COALESCE(CARDINALITY(extra_image_data), 0)
+) STORED;
+
 -- =============================================================================
 -- Indexes for Performance & Deduplication
 -- =============================================================================
-CREATE INDEX IF NOT EXISTS idx_chat_history_user_id ON chat_history(user_id);
 CREATE INDEX IF NOT EXISTS idx_chat_history_created_at ON chat_history(created_at);
-CREATE INDEX IF NOT EXISTS idx_chat_history_user_created ON chat_history(user_id, created_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_chat_history_seq ON chat_history(seq);
+-- Keyset pagination over one user's history (also serves user_id lookups)
+CREATE INDEX IF NOT EXISTS idx_chat_history_user_seq ON chat_history(user_id, seq);
+-- Context window lookups: current session of one user, newest first
+CREATE INDEX IF NOT EXISTS idx_chat_history_user_session_seq
+ON chat_history(user_id, session_id, seq);
+
+-- Superseded by the seq-based indexes above
+DROP INDEX IF EXISTS idx_chat_history_user_id;
+DROP INDEX IF EXISTS idx_chat_history_user_created;
+DROP INDEX IF EXISTS idx_chat_history_user_session_created;
+
+CREATE INDEX IF NOT EXISTS idx_chat_history_archive_user_seq ON chat_history_archive(user_id, seq);
+
+CREATE INDEX IF NOT EXISTS idx_response_cache_expires_at ON response_cache(expires_at);
+
+-- Per-user usage over a time range (/usage, quota reconciliation)
+CREATE INDEX IF NOT EXISTS idx_usage_ledger_user_created ON usage_ledger(user_id, created_at);
+-- All users over a time range (admin report)
+CREATE INDEX IF NOT EXISTS idx_usage_ledger_created_at ON usage_ledger(created_at);
+
+-- Open batch requests by state (the job never scans delivered rows)
+CREATE INDEX IF NOT EXISTS idx_batch_requests_open
+ON batch_requests(status, id)
+WHERE delivered_at IS NULL;
 
 -- Unique index to prevent duplicate message processing from Telegram retries
 CREATE UNIQUE INDEX IF NOT EXISTS idx_chat_history_user_message_id 
 ON chat_history(user_id, message_id) 
 WHERE message_id IS NOT NULL;
 
+-- Duplicate check for messages merged into another message's turn
+CREATE INDEX IF NOT EXISTS idx_chat_history_merged_message_ids
+ON chat_history USING GIN (merged_message_ids)
+WHERE merged_message_ids IS NOT NULL;
+
+-- =============================================================================
+-- Function: start_new_session
+-- Purpose: Begin a new conversation session in one round trip (/newchat).
+-- Bumps the session epoch and drops the document context; history rows are
+-- kept and simply fall out of the context window.
+-- =============================================================================
+CREATE OR REPLACE FUNCTION start_new_session(p_user_id BIGINT)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    INSERT INTO conversation_state (user_id, session_id, updated_at)
+    VALUES (p_user_id, 1, NOW())
+    ON CONFLICT (user_id) DO UPDATE
+    SET session_id = conversation_state.session_id + 1,
+        active_vector_store_id = NULL,
+        updated_at = NOW()
+    RETURNING session_id;
+$$;
+
+-- =============================================================================
+-- Function: archive_chat_history
+-- Purpose: Retention job. Moves one batch of old rows into chat_history_archive
+-- and returns how many were moved; call repeatedly until it returns 0.
+-- A row qualifies when it is older than p_before (or p_images_before if it
+-- carries image_data), unless it is one of the p_keep_recent newest rows of
+-- its user's current session (the model's context window).
+-- =============================================================================
+CREATE OR REPLACE FUNCTION archive_chat_history(
+    p_before TIMESTAMP,
+    p_images_before TIMESTAMP,
+    p_keep_recent INTEGER DEFAULT 30,
+    p_batch_size INTEGER DEFAULT 500
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    moved_count INTEGER;
+BEGIN
+    WITH candidates AS (
+        SELECT h.seq
+        FROM chat_history h
+        LEFT JOIN conversation_state s ON s.user_id = h.user_id
+        WHERE (h.created_at < p_before
+               OR (h.image_data IS NOT NULL AND h.created_at < p_images_before))
+          AND (
+              h.session_id <> COALESCE(s.session_id, 0)
+              OR h.seq < (
+                  SELECT MIN(recent.seq)
+                  FROM (
+                      SELECT r.seq FROM chat_history r
+                      WHERE r.user_id = h.user_id AND r.session_id = h.session_id
+                      ORDER BY r.seq DESC
+                      LIMIT p_keep_recent
+                  ) recent
+              )
+          )
+        ORDER BY h.seq
+        LIMIT p_batch_size
+        FOR UPDATE OF h SKIP LOCKED
+    ),
+    moved AS (
+        DELETE FROM chat_history h
+        USING candidates c
+        WHERE h.seq = c.seq
+        RETURNING h.id, h.seq, h.user_id, h.role, h.content, h.image_data,
+                  h.extra_image_data, h.message_id, h.merged_message_ids,
+                  h.session_id, h.created_at
+    )
+    INSERT INTO chat_history_archive
+        (id, seq, user_id, role, content, image_data, extra_image_data,
+         message_id, merged_message_ids, session_id, created_at)
+    SELECT * FROM moved
+    ON CONFLICT (id) DO NOTHING;
+
+    GET DIAGNOSTICS moved_count = ROW_COUNT;
+    RETURN moved_count;
+END;
+$$;
+
+-- =============================================================================
+-- Function: usage_summary
+-- Purpose: Token usage since p_since per user and model, for one user or
+-- (p_user_id NULL) everyone. Aggregates server-side in one round trip.
+-- =============================================================================
+CREATE OR REPLACE FUNCTION usage_summary(
+    p_since TIMESTAMPTZ,
+    p_user_id BIGINT DEFAULT NULL
+)
+RETURNS TABLE (
+    user_id BIGINT,
+    model TEXT,
+    requests BIGINT,
+    input_tokens BIGINT,
+    cached_tokens BIGINT,
+    output_tokens BIGINT
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT u.user_id, u.model, COUNT(*), SUM(u.input_tokens), SUM(u.cached_tokens), SUM(u.output_tokens)
+    FROM usage_ledger u
+    WHERE u.created_at >= p_since
+      AND (p_user_id IS NULL OR u.user_id = p_user_id)
+    GROUP BY u.user_id, u.model
+    ORDER BY u.user_id, u.model;
+$$;
+
+-- =============================================================================
+-- Function: claim_batch_requests
+-- Purpose: Batch job. Marks up to p_limit queued requests as 'submitting' and
+-- returns them, so concurrent runs never submit a request twice. Requests
+-- left in 'submitting' for p_stale_seconds (a run that died before the
+-- batch was created) are claimed again.
+-- =============================================================================
+CREATE OR REPLACE FUNCTION claim_batch_requests(
+    p_limit INTEGER,
+    p_stale_seconds INTEGER DEFAULT 900
+)
+RETURNS SETOF batch_requests
+LANGUAGE sql
+AS $$
+    UPDATE batch_requests b
+    SET status = 'submitting', updated_at = NOW()
+    WHERE b.id IN (
+        SELECT c.id
+        FROM batch_requests c
+        WHERE c.delivered_at IS NULL
+          AND (c.status = 'queued'
+               OR (c.status = 'submitting'
+                   AND c.updated_at < NOW() - make_interval(secs => p_stale_seconds)))
+        ORDER BY c.id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING b.*;
+$$;
+
+-- =============================================================================
+-- Function: acquire_turn_lock
+-- Purpose: Takes the user's turn lock for p_holder if it is free, expired or
+-- already held by p_holder (which extends the lease). Returns whether
+-- p_holder holds it; never waits (callers retry).
+-- =============================================================================
+CREATE OR REPLACE FUNCTION acquire_turn_lock(
+    p_user_id BIGINT,
+    p_holder TEXT,
+    p_ttl_seconds INTEGER
+)
+RETURNS BOOLEAN
+LANGUAGE sql
+AS $$
+    WITH taken AS (
+        INSERT INTO user_turn_locks (user_id, holder, expires_at)
+        VALUES (p_user_id, p_holder, NOW() + make_interval(secs => p_ttl_seconds))
+        ON CONFLICT (user_id) DO UPDATE
+            SET holder = EXCLUDED.holder, expires_at = EXCLUDED.expires_at
+            WHERE user_turn_locks.expires_at < NOW()
+               OR user_turn_locks.holder = EXCLUDED.holder
+        RETURNING 1
+    )
+    SELECT EXISTS (SELECT 1 FROM taken);
+$$;
+
 -- =============================================================================
 -- Sample Data: Add yourself as the first user
 -- Replace YOUR_TELEGRAM_ID with the ID from @userinfobot
@@ -85,6 +414,10 @@ WHERE message_id IS NOT NULL;
 -- View recent chat history
 -- SELECT * FROM chat_history WHERE user_id = YOUR_TELEGRAM_ID ORDER BY created_at DESC LIMIT 20;
 
+-- View a user's current session
+-- SELECT h.* FROM chat_history h JOIN conversation_state s USING (user_id, session_id)
+-- WHERE h.user_id = YOUR_TELEGRAM_ID ORDER BY h.created_at;
+
 -- Clear a user's chat history
 -- DELETE FROM chat_history WHERE user_id = YOUR_TELEGRAM_ID;
 
@@ -0,0 +1,67 @@
+"""The Telegram application shared by the webhook and the polling runner."""
+
+from typing import Any
+
+from telegram import Update
+from telegram.ext import (
+    Application,
+    CallbackQueryHandler,
+    CommandHandler,
+    MessageHandler,
+    filters,
+)
+
+from src import metrics
+from src.config import settings
+from src.llm.deadline import deadline_scope
+from src.tracing import span
+
+from .handlers import (
+    export_command,
+    handle_callback_query,
+    handle_document,
+    handle_message,
+    handle_photo,
+    later_command,
+    newchat_command,
+    settings_command,
+    start_command,
+    usage_command,
+)
+from .request import InstrumentedRequest
+
+
+def build_application() -> Application:
+    """Telegram application with every command and message handler registered."""
+    application = (
+        Application.builder()
+        .token(settings.telegram_token)
+        .base_url(settings.telegram_base_url)
+        .base_file_url(settings.telegram_base_file_url)
+        .request(InstrumentedRequest())
+        .build()
+    )
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("settings", settings_command))
+    application.add_handler(CommandHandler("newchat", newchat_command))
+    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(CommandHandler("usage", usage_command))
+    application.add_handler(CommandHandler("later", later_command))
+    application.add_handler(CallbackQueryHandler(handle_callback_query))
+    application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
+    application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return application
+
+
+async def process_update(
+    application: Application, data: dict[str, Any], span_name: str = "webhook.update"
+) -> None:
+    """Handle one raw update within the per-update time budget, with metrics and a root span."""
+    update = Update.de_json(data, application.bot)
+    with (
+        metrics.observe_update(),
+        span(span_name, update_id=update.update_id),
+        deadline_scope(settings.webhook_deadline_seconds),
+    ):
+        await application.process_update(update)
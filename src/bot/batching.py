@@ -0,0 +1,70 @@
+"""Grouping of related updates that arrive as separate webhook calls.
+
+The first update for a key becomes the leader: it waits until the group has
+been quiet for `window` seconds (at most `max_wait` in total), then receives
+every item added meanwhile and handles them as one turn. Later updates for
+the same key only add their item and return.
+
+Groups live in process memory, so they only form among updates handled by
+the same process. Updates spread over several instances form one group per
+instance, which is no worse than handling each update on its own.
+"""
+
+import asyncio
+import time
+from collections.abc import Hashable
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class _Group(Generic[T]):
+    __slots__ = ("items", "arrived")
+
+    def __init__(self, item: T):
+        self.items = [item]
+        self.arrived = asyncio.Event()
+
+
+class KeyedBatcher(Generic[T]):
+    """Collects items by key for a short window."""
+
+    def __init__(self, window: float, max_wait: float, max_items: int | None = None):
+        self.window = window
+        self.max_wait = max_wait
+        self.max_items = max_items
+        self._groups: dict[Hashable, _Group[T]] = {}
+
+    def pending(self) -> int:
+        """Number of groups still collecting items."""
+        return len(self._groups)
+
+    async def add(self, key: Hashable, item: T) -> list[T] | None:
+        """Add an item to the group for `key`.
+
+        Returns:
+            All items of the group, in arrival order, for the leader; None for
+            every other caller.
+        """
+        group = self._groups.get(key)
+        if group is not None:
+            group.items.append(item)
+            group.arrived.set()
+            return None
+
+        group = _Group(item)
+        self._groups[key] = group
+        try:
+            give_up_at = time.monotonic() + self.max_wait
+            while self.max_items is None or len(group.items) < self.max_items:
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                group.arrived.clear()
+                try:
+                    await asyncio.wait_for(group.arrived.wait(), min(self.window, remaining))
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            del self._groups[key]
+        return group.items
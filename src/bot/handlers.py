@@ -1,30 +1,113 @@
 
+import asyncio
 import base64
+import os
 
-from telegram import Update
+from telegram import InlineKeyboardMarkup, Message, Update
 from telegram.ext import ContextTypes
 
+from src import metrics
+from src.config import settings as app_settings
 from src.db import (
     check_user_access,
-    delete_chat_history,
     get_chat_history,
+    get_conversation_state,
     get_user_settings,
     is_message_processed,
-    save_message,
+    get_processed_message_ids,
+    save_turn,
     update_user_settings,
     set_pending_image,
-    get_pending_image,
     clear_pending_image,
-    get_active_vector_store,
     set_active_vector_store,
+    start_new_session,
 )
+from src.db.models import ConversationState
+from src.llm.cancellation import GenerationCancelledError
+from src.llm.registry import registry
+from src.db.records import SettingsRecord
+from src.services.batch_service import TooManyOpenRequestsError, queue_request
+from src.services.export_service import export_filename, write_export
+from src.services.file_cache import fetch_file
 from src.services.file_service import create_vector_store_from_file
-from src.services.openai_service import generate_response
+from src.services.image_prefetch import pending_images
+from src.services.openai_service import cancel_generation, generate_response
+from src.services.turn_lock import turn_locks
+from src.services.usage import QuotaExceededError, admin_report, usage_ledger, user_report
 from src.utils import markdown_to_telegram_html
 
+from .batching import KeyedBatcher
+from .prefetch import TaskGraph, in_thread
 from .keyboards import build_main_keyboard, build_newchat_keyboard, build_settings_keyboard
 
 
+def _settings_keyboard(settings: SettingsRecord) -> InlineKeyboardMarkup:
+    """Settings keyboard for a user, with the cache toggle when caching is enabled."""
+    cache_responses = settings.cache_responses if app_settings.response_cache_enabled else None
+    return build_settings_keyboard(
+        settings.selected_model, settings.reasoning_effort, cache_responses, settings.auto_route
+    )
+
+
+async def _download_images(
+    context: ContextTypes.DEFAULT_TYPE, files: list[tuple[str, str | None]]
+) -> list[str]:
+    """Download (file_id, file_unique_id) pairs concurrently, as base64 in the same order."""
+    contents = await asyncio.gather(
+        *(fetch_file(context.bot, file_id, unique_id) for file_id, unique_id in files)
+    )
+    return [base64.b64encode(data).decode("utf-8") for data in contents]
+
+
+async def _pending_images(context: ContextTypes.DEFAULT_TYPE, state: ConversationState) -> list[str]:
+    """Download the pending detached image (or album), if any, as base64.
+    
+    A failed download is logged and the turn continues with text only.
+    """
+    if not state.pending_image_id:
+        return []
+    pending = [(state.pending_image_id, state.pending_image_unique_id)] + [
+        (image["file_id"], image.get("file_unique_id"))
+        for image in state.pending_extra_images or []
+    ]
+    # Usually prepared when the photo arrived (see handle_photo)
+    images = await pending_images.take(state.user_id, tuple(pending))
+    if images is not None:
+        return images
+    try:
+        return await _download_images(context, pending)
+    except Exception as e:
+        print(f"Failed to retrieve pending image: {e}")
+        return []
+
+
+# Message IDs of the turns this process is answering, per user. A Telegram
+# redelivery of one of them is dropped instead of superseding the original.
+_answering: dict[int, set[int]] = {}
+
+
+def _claim_messages(user_id: int, message_ids: list[int]) -> list[int]:
+    """Mark the messages as being answered here; returns those that were not already."""
+    answering = _answering.setdefault(user_id, set())
+    claimed = [message_id for message_id in message_ids if message_id not in answering]
+    answering.update(claimed)
+    return claimed
+
+
+def _unclaim_messages(user_id: int, message_ids: list[int]) -> None:
+    answering = _answering.get(user_id)
+    if answering is not None:
+        answering.difference_update(message_ids)
+        if not answering:
+            del _answering[user_id]
+
+
+async def _supersede(user_id: int, new_message: bool) -> None:
+    """Cancel the answer still being generated for the user, for a genuinely new message."""
+    if new_message:
+        cancel_generation(user_id, "new_message")
+
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle /start command - check access and introduce the bot."""
     user_id = update.effective_user.id
@@ -43,7 +126,10 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         "I'm your AI assistant powered by OpenAI models.\n\n"
         "Use the buttons below or commands:\n"
         "• ⚙️ Settings - Change model & reasoning\n"
-        "• ✨ New Chat - Clear conversation history\n\n"
+        "• ✨ New Chat - Clear conversation history\n"
+        "• /export - Download your chat history\n"
+        "• /later - Get a cheaper answer within 24 hours\n"
+        "• /usage - See your token usage\n\n"
         "Just send me a message to start chatting!"
     )
     
@@ -72,7 +158,7 @@ async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         f"🧠 Reasoning: <code>{settings.reasoning_effort}</code>"
     )
     
-    keyboard = build_settings_keyboard(settings.selected_model, settings.reasoning_effort)
+    keyboard = _settings_keyboard(settings)
     
     await update.message.reply_text(
         message_text,
@@ -93,7 +179,7 @@ async def newchat_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     await update.message.reply_text(
         "✨ <b>Start a fresh conversation?</b>\n\n"
-        "This will clear your chat history. The bot won't have access to "
+        "This starts a new session. The bot won't have access to "
         "previous messages in the new session.\n\n"
         "💡 Your history is stored in the database, but won't be used for AI context.",
         reply_markup=keyboard,
@@ -101,6 +187,140 @@ async def newchat_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     )
 
 
+# Bot API limit for documents uploaded by bots
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle /export [markdown|jsonl] - send the user's full history as a file."""
+    user_id = update.effective_user.id
+    
+    if not check_user_access(user_id):
+        return
+    
+    fmt = "jsonl" if context.args and context.args[0].lower() == "jsonl" else "markdown"
+    status_msg = await update.message.reply_text("⏳ Preparing your export...")
+    
+    path = None
+    try:
+        # Pages are fetched with blocking DB calls: keep them off the event loop
+        path, count = await asyncio.to_thread(write_export, user_id, fmt)
+        
+        if count == 0:
+            await status_msg.edit_text("📭 No messages to export yet.")
+            return
+        if os.path.getsize(path) > MAX_UPLOAD_BYTES:
+            await status_msg.edit_text(
+                "❌ Your history is too large to send as one file (Telegram's limit is 50 MB)."
+            )
+            return
+        
+        with open(path, "rb") as f:
+            await update.message.reply_document(
+                document=f,
+                filename=export_filename(fmt),
+                caption=f"📦 {count} message{'s' if count != 1 else ''}",
+            )
+        await status_msg.delete()
+    
+    except Exception as e:
+        print(f"Export failed for user {user_id}: {e}")
+        await status_msg.edit_text(f"❌ Error exporting history: {e}")
+    
+    finally:
+        if path:
+            os.remove(path)
+
+
+async def usage_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle /usage - the user's token usage; admins can add 'all' for every user."""
+    user_id = update.effective_user.id
+    
+    if not check_user_access(user_id):
+        return
+    
+    everyone = bool(context.args) and context.args[0].lower() == "all"
+    if everyone and user_id not in app_settings.admin_user_ids:
+        await update.message.reply_text("⛔️ Only admins can see everyone's usage.")
+        return
+    
+    try:
+        # Blocking DB reads (and a flush of pending usage records)
+        if everyone:
+            report = await asyncio.to_thread(admin_report)
+        else:
+            report = await asyncio.to_thread(user_report, user_id)
+        await update.message.reply_text(report, parse_mode="HTML")
+    except Exception as e:
+        print(f"Usage report failed for user {user_id}: {e}")
+        await update.message.reply_text(f"❌ Error loading usage: {e}")
+
+
+async def later_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle /later <question> - answer through the Batch API, within 24 hours, at half the cost."""
+    user_id = update.effective_user.id
+    
+    if not check_user_access(user_id):
+        return
+    
+    # Everything after the command, newlines included
+    parts = update.message.text.split(None, 1)
+    question = parts[1].strip() if len(parts) > 1 else ""
+    if not question:
+        await update.message.reply_text(
+            "🕓 <b>Ask now, get the answer later</b>\n\n"
+            "<code>/later your question</code>\n\n"
+            "The answer arrives within 24 hours and costs half as much.",
+            parse_mode="HTML",
+        )
+        return
+    
+    try:
+        graph = TaskGraph("later.prefetch")
+        graph.add("settings", in_thread(get_user_settings, user_id))
+        graph.add("quota", lambda: usage_ledger.check_quota(user_id))
+        graph.add("state", in_thread(get_conversation_state, user_id))
+        graph.add("history", lambda state: asyncio.to_thread(
+            get_chat_history, user_id, limit=app_settings.history_limit, session_id=state.session_id
+        ), after=("state",))
+        inputs = await graph.run()
+        
+        queued = await asyncio.to_thread(
+            queue_request,
+            user_id,
+            update.effective_chat.id,
+            update.message.message_id,
+            question,
+            inputs["history"],
+            inputs["settings"],
+            inputs["state"].session_id,
+        )
+        if queued:
+            await update.message.reply_text(
+                "🕓 Queued. I'll reply to this message when the answer is ready (within 24 hours)."
+            )
+    
+    except TooManyOpenRequestsError:
+        await update.message.reply_text(
+            f"⏳ You already have {app_settings.batch_max_open_per_user} questions waiting. "
+            "Try again once some have been answered."
+        )
+    
+    except QuotaExceededError as e:
+        await update.message.reply_text(_quota_message(e), parse_mode="HTML")
+    
+    except Exception as e:
+        print(f"Queueing /later failed for user {user_id}: {e}")
+        await update.message.reply_text(f"❌ Error queueing your question: {e}")
+
+
+def _quota_message(error: QuotaExceededError) -> str:
+    return (
+        f"⏳ <b>Daily {error.kind} limit reached</b> ({error.used}/{error.limit}).\n\n"
+        "It resets at midnight UTC. Use /usage to see your usage."
+    )
+
+
 async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle button clicks from inline keyboards."""
     query = update.callback_query
@@ -121,21 +341,32 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
     
     elif data.startswith("model:"):
         model = data.split(":")[1]
+        spec = registry.get(model)
+        if not spec.selectable:
+            return
         
-        # Validation: gpt-5.2-chat-latest does not support "high" reasoning
-        # If user switches to this model while on "high", auto-downgrade to "medium"
+        # Validation: keep the reasoning level within what the new model accepts
+        # (e.g. "high" becomes "medium" on gpt-5.2-chat-latest)
         current_settings = get_user_settings(user_id)
         msg_extra = ""
+        effort = spec.effort(current_settings.reasoning_effort)
         
-        if model == "gpt-5.2-chat-latest" and current_settings.reasoning_effort == "high":
-            update_user_settings(user_id, selected_model=model, reasoning_effort="medium")
-            msg_extra = "\n⚠️ <i>Reasoning set to medium (High not supported)</i>"
+        if effort is not None and effort != current_settings.reasoning_effort:
+            update_user_settings(user_id, selected_model=model, reasoning_effort=effort)
+            msg_extra = (
+                f"\n⚠️ <i>Reasoning set to {effort} "
+                f"({current_settings.reasoning_effort.capitalize()} not supported)</i>"
+            )
         else:
             update_user_settings(user_id, selected_model=model)
         
+        # An answer still being generated with the old model is no longer wanted
+        if model != current_settings.selected_model:
+            cancel_generation(user_id, "settings_changed")
+        
         # Refresh keyboard & text
         settings = get_user_settings(user_id)
-        keyboard = build_settings_keyboard(settings.selected_model, settings.reasoning_effort)
+        keyboard = _settings_keyboard(settings)
         
         await query.edit_message_text(
             f"✅ Model changed to <b>{model}</b>{msg_extra}\n\n"
@@ -151,11 +382,13 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
         settings = get_user_settings(user_id)
         
         update_user_settings(user_id, reasoning_effort=level)
+        if level != settings.reasoning_effort:
+            cancel_generation(user_id, "settings_changed")
         
         # Refresh keyboard
         # Re-fetch settings after update
         settings = get_user_settings(user_id)
-        keyboard = build_settings_keyboard(settings.selected_model, settings.reasoning_effort)
+        keyboard = _settings_keyboard(settings)
         
         await query.edit_message_text(
             f"✅ Reasoning level changed to <b>{level}</b>\n\n"
@@ -166,29 +399,57 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
             parse_mode="HTML"
         )
     
+    elif data.startswith("auto:"):
+        enabled = data.split(":")[1] == "on"
+        update_user_settings(user_id, auto_route=enabled)
+        
+        settings = get_user_settings(user_id)
+        keyboard = _settings_keyboard(settings)
+        
+        await query.edit_message_text(
+            f"✅ Auto routing {'enabled' if enabled else 'disabled'}\n\n"
+            "🪄 Simple messages get a faster model and less reasoning; "
+            "your selection is the upper limit for everything else.\n\n"
+            "⚙️ <b>Settings</b>\n"
+            f"🤖 Model: <code>{settings.selected_model}</code>\n"
+            f"🧠 Reasoning: <code>{settings.reasoning_effort}</code>",
+            reply_markup=keyboard,
+            parse_mode="HTML"
+        )
+    
+    elif data.startswith("cache:"):
+        enabled = data.split(":")[1] == "on"
+        update_user_settings(user_id, cache_responses=enabled)
+        
+        settings = get_user_settings(user_id)
+        keyboard = _settings_keyboard(settings)
+        
+        await query.edit_message_text(
+            f"✅ Cached answers {'enabled' if enabled else 'disabled'}\n\n"
+            "⚙️ <b>Settings</b>\n"
+            f"🤖 Model: <code>{settings.selected_model}</code>\n"
+            f"🧠 Reasoning: <code>{settings.reasoning_effort}</code>",
+            reply_markup=keyboard,
+            parse_mode="HTML"
+        )
+    
     elif data == "newchat:confirm":
         try:
-            deleted_count = delete_chat_history(user_id)
-            # Clear document context
-            set_active_vector_store(user_id, None)
+            # Bump the session epoch (also clears document context); old
+            # messages stay stored but drop out of the AI context
+            start_new_session(user_id)
+            # An answer for the old session would land in the new one
+            cancel_generation(user_id, "new_session")
             
-            if deleted_count > 0:
-                await query.edit_message_text(
-                    f"✅ <b>History cleared!</b>\n\n"
-                    f"Deleted {deleted_count} message{'s' if deleted_count != 1 else ''}.\n"
-                    f"You can now start a fresh conversation.",
-                    parse_mode="HTML"
-                )
-            else:
-                await query.edit_message_text(
-                    "✨ <b>Fresh start!</b>\n\n"
-                    "No previous history found. You're all set!",
-                    parse_mode="HTML"
-                )
+            await query.edit_message_text(
+                "✨ <b>Fresh start!</b>\n\n"
+                "New session started. You can now start a fresh conversation.",
+                parse_mode="HTML"
+            )
         except Exception as e:
             print(f"Error in newchat:confirm: {e}")
             await query.edit_message_text(
-                f"❌ Error clearing history: {e}",
+                f"❌ Error starting a new session: {e}",
                 parse_mode="HTML"
             )
     
@@ -196,6 +457,18 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
         await query.edit_message_text("❌ Cancelled. Your chat history is preserved.")
 
 
+# Text messages a user sends in quick succession (e.g. a long paste that
+# Telegram splits) are answered as one turn by the first of them
+message_batcher: KeyedBatcher[Message] | None = (
+    KeyedBatcher(
+        window=app_settings.message_coalesce_window_seconds,
+        max_wait=app_settings.message_coalesce_max_wait_seconds,
+    )
+    if app_settings.message_coalesce_window_seconds > 0
+    else None
+)
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle regular text messages - detect button clicks or send to AI."""
     user_id = update.effective_user.id
@@ -216,62 +489,115 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await newchat_command(update, context)
         return
     
+    messages = [update.message]
+    if message_batcher is not None:
+        messages = await message_batcher.add(user_id, update.message)
+        if messages is None:
+            # Merged into the turn of an earlier message
+            return
+        # Telegram retries may deliver a message twice within the window
+        messages = sorted({m.message_id: m for m in messages}.values(), key=lambda m: m.message_id)
+    
     # Send typing indicator
     await update.message.chat.send_action("typing")
     
+    message_ids = _claim_messages(user_id, [message.message_id for message in messages])
+    if not message_ids:
+        print(f"Skipping redelivered message {messages[0].message_id} for user {user_id} (being answered)")
+        return
+    messages = [message for message in messages if message.message_id in message_ids]
+    
+    # Held from reading state and history until the turn is saved, so another
+    # instance answering this user meanwhile cannot interleave with this turn
+    lease = turn_locks.lease(user_id)
     try:
+        # Read everything the turn needs concurrently. The conversation state
+        # (pending image, document context, current session) is the only
+        # dependency: history and the pending image download wait for it.
+        # History is read BEFORE saving the new message to avoid context duplication.
+        # A new message supersedes the answer still being generated for this
+        # user, once the duplicate check shows it is not a redelivery. The
+        # check is repeated under the lease: a retry handled by another
+        # instance may have been answered meanwhile.
+        graph = TaskGraph("turn.prefetch")
+        graph.add("settings", in_thread(get_user_settings, user_id))
+        graph.add("quota", lambda: usage_ledger.check_quota(user_id))
+        graph.add("duplicate", in_thread(get_processed_message_ids, user_id, message_ids))
+        graph.add("supersede", lambda processed: _supersede(
+            user_id, not processed.issuperset(message_ids)
+        ), after=("duplicate",))
+        graph.add("lock", lease.acquire)
+        graph.add("processed", lambda _: asyncio.to_thread(
+            get_processed_message_ids, user_id, message_ids
+        ), after=("lock",))
+        graph.add("state", lambda _: asyncio.to_thread(
+            get_conversation_state, user_id
+        ), after=("lock",))
+        graph.add("history", lambda state: asyncio.to_thread(
+            get_chat_history, user_id, limit=app_settings.history_limit, session_id=state.session_id
+        ), after=("state",))
+        graph.add("images", lambda state: _pending_images(context, state), after=("state",))
+        inputs = await graph.run()
+        
         # Check for duplicate messages (idempotency)
-        message_id = update.message.message_id
-        if is_message_processed(user_id, message_id):
-            print(f"Skipping duplicate message {message_id} for user {user_id}")
-            return
-            
-        # Get user settings
-        settings = get_user_settings(user_id)
+        processed = inputs["duplicate"] | inputs["processed"]
+        if processed:
+            print(f"Skipping duplicate messages {sorted(processed)} for user {user_id}")
+            messages = [message for message in messages if message.message_id not in processed]
+            if not messages:
+                return
+        
+        # One turn for all merged messages, stored under the first one
+        message_id = messages[0].message_id
+        merged_message_ids = [message.message_id for message in messages[1:]]
+        user_message = "\n\n".join(message.text for message in messages)
+        
+        settings = inputs["settings"]
+        state = inputs["state"]
+        history = inputs["history"]
         
         image_base64 = None
-        
-        # Check for pending detached image
-        pending_image_id = get_pending_image(user_id)
-        if pending_image_id:
-            try:
-                # Retrieve and download the pending image
-                file = await context.bot.get_file(pending_image_id)
-                photo_bytes = await file.download_as_bytearray()
-                image_base64 = base64.b64encode(photo_bytes).decode("utf-8")
-                
-                # Clear pending image state
-                clear_pending_image(user_id)
-                
-            except Exception as e:
-                print(f"Failed to retrieve pending image: {e}")
-                # Log error but continue with text only
+        extra_images: list[str] = []
+        if inputs["images"]:
+            image_base64, *extra_images = inputs["images"]
         
         # Check for active file context (vector store)
-        vector_store_id = get_active_vector_store(user_id)
+        vector_store_id = state.active_vector_store_id
         
-        # Get history BEFORE saving new message to avoid context duplication
-        history = get_chat_history(user_id, limit=30)
+        # Generate AI response (Now in standard Markdown)
+        ai_response = await generate_response(
+            history, 
+            user_message, 
+            settings, 
+            image_base64=image_base64,
+            vector_store_id=vector_store_id,
+            extra_images=extra_images,
+        )
         
-        # Save user message immediately to mark as processed
+        # Save the turn only now, so a failed or superseded turn leaves nothing behind
         # If we attached an image, mark it in the text for history context
         log_content = f"[📷 Attached Image] {user_message}" if image_base64 else user_message
         if vector_store_id:
              log_content += " [📄 File Context Active]"
         
-        save_message(user_id, "user", log_content, message_id=message_id, image_data=image_base64)
-        
-        # Generate AI response (Now in standard Markdown)
-        ai_response = generate_response(
-            history, 
-            user_message, 
-            settings, 
-            image_base64=image_base64,
-            vector_store_id=vector_store_id
+        saved = save_turn(
+            user_id,
+            log_content,
+            ai_response,
+            message_id=message_id,
+            image_data=image_base64,
+            session_id=state.session_id,
+            extra_image_data=extra_images,
+            merged_message_ids=merged_message_ids,
         )
+        if not saved:
+            print(f"Skipping duplicate message {message_id} for user {user_id} (answered concurrently)")
+            return
         
-        # Save assistant response
-        save_message(user_id, "assistant", ai_response)
+        if image_base64:
+            # Clear pending image state (unless a newer photo replaced it meanwhile)
+            clear_pending_image(user_id, state.pending_image_id)
+        await lease.release()
         
         # Convert Markdown -> Telegram HTML
         html_response = markdown_to_telegram_html(ai_response)
@@ -288,6 +614,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 print(f"Chunk send failed (HTML={as_html}): {e}")
                 if as_html:
                     # Retry as plain text
+                    metrics.telegram_fallbacks.inc()
                     await update.message.reply_text(text_chunk)
 
         # Check length (Telegram limit is 4096, using 4000 for safety)
@@ -296,6 +623,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 await update.message.reply_text(html_response, parse_mode="HTML")
             except Exception as e:
                 print(f"HTML send failed: {e}")
+                metrics.telegram_fallbacks.inc()
                 await update.message.reply_text(ai_response)
         else:
             # Message too long: Split standard Markdown by paragraphs to preserve formatting safety
@@ -332,11 +660,22 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 if chunk.strip():
                     await _send_chunk(chunk)
     
+    except GenerationCancelledError:
+        # Superseded by a newer message or a settings change; nothing to send
+        return
+    
+    except QuotaExceededError as e:
+        await update.message.reply_text(_quota_message(e), parse_mode="HTML")
+    
     except Exception as e:
         await update.message.reply_text(
             f"❌ Error generating response:\n\n<code>{str(e)}</code>",
             parse_mode="HTML"
         )
+    
+    finally:
+        await lease.release()
+        _unclaim_messages(user_id, message_ids)
 
 
 # Static prompt when user sends image without caption
@@ -347,6 +686,15 @@ IMAGE_WITHOUT_CAPTION_PROMPT = (
 )
 
 
+# Albums arrive as one update per photo (at most 10); the first update of an
+# album collects the rest and answers them as one turn
+album_batcher: KeyedBatcher[Message] = KeyedBatcher(
+    window=app_settings.media_group_window_seconds,
+    max_wait=app_settings.media_group_max_wait_seconds,
+    max_items=10,
+)
+
+
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle photo messages - process images with optional caption for AI analysis."""
     user_id = update.effective_user.id
@@ -358,16 +706,31 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         )
         return
     
-    # Get caption (question about the image)
-    caption = update.message.caption
+    messages = [update.message]
+    media_group_id = update.message.media_group_id
+    if media_group_id:
+        messages = await album_batcher.add((user_id, media_group_id), update.message)
+        if messages is None:
+            # Another update of this album answers it
+            return
+        messages.sort(key=lambda message: message.message_id)
+    
+    # Highest resolution of each photo; the album caption is set on one of them
+    photos = [message.photo[-1] for message in messages]
+    caption = next((message.caption for message in messages if message.caption), None)
     
     # If no caption, save file_id and prompt user
     if not caption:
-        # Get pending image file ID
-        file_id = update.message.photo[-1].file_id
-        
         # Save to user settings so we remember it for the next text message
-        set_pending_image(user_id, file_id)
+        extra_images = [
+            {"file_id": photo.file_id, "file_unique_id": photo.file_unique_id}
+            for photo in photos[1:]
+        ]
+        set_pending_image(user_id, photos[0].file_id, photos[0].file_unique_id, extra_images or None)
+        
+        # Download and encode now, so the follow-up question starts without image I/O
+        pending = [(photo.file_id, photo.file_unique_id) for photo in photos]
+        pending_images.prepare(user_id, tuple(pending), lambda: _download_images(context, pending))
         
         await update.message.reply_text(
             IMAGE_WITHOUT_CAPTION_PROMPT,
@@ -378,45 +741,80 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     # Send typing indicator
     await update.message.chat.send_action("typing")
     
+    # An album is stored under its first message
+    message_id = messages[0].message_id
+    if not _claim_messages(user_id, [message_id]):
+        print(f"Skipping redelivered photo message {message_id} for user {user_id} (being answered)")
+        return
+    
+    # Held from reading state and history until the turn is saved (see handle_message)
+    lease = turn_locks.lease(user_id)
     try:
+        # Download photos to memory (skipped for files seen before) while
+        # reading settings, state and history (BEFORE saving the new message).
+        # A new question supersedes the answer still being generated, and the
+        # duplicate check is repeated under the lease (see handle_message).
+        graph = TaskGraph("turn.prefetch")
+        graph.add("settings", in_thread(get_user_settings, user_id))
+        graph.add("quota", lambda: usage_ledger.check_quota(user_id))
+        graph.add("duplicate", in_thread(is_message_processed, user_id, message_id))
+        graph.add("supersede", lambda processed: _supersede(
+            user_id, not processed
+        ), after=("duplicate",))
+        graph.add("lock", lease.acquire)
+        graph.add("processed", lambda _: asyncio.to_thread(
+            is_message_processed, user_id, message_id
+        ), after=("lock",))
+        graph.add("state", lambda _: asyncio.to_thread(
+            get_conversation_state, user_id
+        ), after=("lock",))
+        graph.add("history", lambda state: asyncio.to_thread(
+            get_chat_history, user_id, limit=app_settings.history_limit, session_id=state.session_id
+        ), after=("state",))
+        graph.add("images", lambda: _download_images(
+            context, [(photo.file_id, photo.file_unique_id) for photo in photos]
+        ))
+        inputs = await graph.run()
+        
         # Check for duplicate messages (idempotency)
-        message_id = update.message.message_id
-        if is_message_processed(user_id, message_id):
+        if inputs["duplicate"] or inputs["processed"]:
             print(f"Skipping duplicate photo message {message_id} for user {user_id}")
             return
         
         # Clear any pending image since a new one is provided
-        clear_pending_image(user_id)
-        
-        # Get the highest resolution photo
-        photo = update.message.photo[-1]
+        pending_images.discard(user_id)
+        if inputs["state"].pending_image_id:
+            clear_pending_image(user_id, inputs["state"].pending_image_id)
         
-        # Download photo to memory
-        file = await photo.get_file()
-        photo_bytes = await file.download_as_bytearray()
+        settings = inputs["settings"]
+        session_id = inputs["state"].session_id
+        history = inputs["history"]
+        images = inputs["images"]
         
-        # Convert to base64
-        image_base64 = base64.b64encode(photo_bytes).decode("utf-8")
-        
-        # Get user settings
-        settings = get_user_settings(user_id)
-        
-        # Get history BEFORE saving new message
-        history = get_chat_history(user_id, limit=30)
-        
-        # Save user message (caption only, image is ephemeral)
-        save_message(user_id, "user", f"[📷 Image] {caption}", message_id=message_id, image_data=image_base64)
-        
-        # Generate AI response with image
-        ai_response = generate_response(
+        # Generate AI response with the image(s) in one request
+        ai_response = await generate_response(
             history,
             caption,
             settings,
-            image_base64=image_base64
+            image_base64=images[0],
+            extra_images=images[1:],
         )
         
-        # Save assistant response
-        save_message(user_id, "assistant", ai_response)
+        # Save the turn only now, so a failed or superseded turn leaves nothing behind
+        label = "[📷 Image]" if len(images) == 1 else f"[📷 {len(images)} Images]"
+        saved = save_turn(
+            user_id,
+            f"{label} {caption}",
+            ai_response,
+            message_id=message_id,
+            image_data=images[0],
+            session_id=session_id,
+            extra_image_data=images[1:],
+        )
+        if not saved:
+            print(f"Skipping duplicate photo message {message_id} for user {user_id} (answered concurrently)")
+            return
+        await lease.release()
         
         # Convert Markdown -> Telegram HTML
         html_response = markdown_to_telegram_html(ai_response)
@@ -426,13 +824,25 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             await update.message.reply_text(html_response, parse_mode="HTML")
         except Exception as e:
             print(f"HTML send failed: {e}")
+            metrics.telegram_fallbacks.inc()
             await update.message.reply_text(ai_response)
     
+    except GenerationCancelledError:
+        # Superseded by a newer message or a settings change; nothing to send
+        return
+    
+    except QuotaExceededError as e:
+        await update.message.reply_text(_quota_message(e), parse_mode="HTML")
+    
     except Exception as e:
         await update.message.reply_text(
             f"❌ Error processing image:\n\n<code>{str(e)}</code>",
             parse_mode="HTML"
         )
+    
+    finally:
+        await lease.release()
+        _unclaim_messages(user_id, [message_id])
 
 
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -463,11 +873,10 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     )
     
     try:
-        file = await document.get_file()
-        file_bytes = await file.download_as_bytearray()
+        file_bytes = await fetch_file(context.bot, document.file_id, document.file_unique_id)
         
         # Create Vector Store (async)
-        vector_store_id = await create_vector_store_from_file(bytes(file_bytes), file_name)
+        vector_store_id = await create_vector_store_from_file(file_bytes, file_name)
         
         # Update user state
         set_active_vector_store(user_id, vector_store_id)
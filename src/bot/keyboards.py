@@ -1,15 +1,7 @@
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
 
-# Available models
-MODELS = [
-    ("GPT-5.2 Chat", "gpt-5.2-chat-latest"),
-    ("GPT-5 Mini", "gpt-5-mini"),
-    ("GPT-4.1", "gpt-4.1"),
-]
-
-# Models that support reasoning_effort parameter
-REASONING_MODELS = {"gpt-5.2-chat-latest", "gpt-5-mini"}
+from src.llm.registry import registry
 
 # Reasoning levels
 REASONING_LEVELS = [
@@ -40,12 +32,19 @@ def build_main_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
-def build_settings_keyboard(selected_model: str, reasoning_effort: str) -> InlineKeyboardMarkup:
+def build_settings_keyboard(
+    selected_model: str,
+    reasoning_effort: str,
+    cache_responses: bool | None = None,
+    auto_route: bool = False,
+) -> InlineKeyboardMarkup:
     """Build the settings keyboard with current selections highlighted.
     
     Args:
         selected_model: Currently selected model.
         reasoning_effort: Current reasoning effort level.
+        cache_responses: Current response cache preference, or None to hide the toggle.
+        auto_route: Whether model and reasoning are chosen per message (Auto).
         
     Returns:
         Inline keyboard markup.
@@ -54,10 +53,10 @@ def build_settings_keyboard(selected_model: str, reasoning_effort: str) -> Inlin
     
     # Model selection (2 buttons per row)
     model_row = []
-    for label, model_id in MODELS:
+    for spec in registry.selectable():
         # Add checkmark if selected
-        text = f"✓ {label}" if model_id == selected_model else label
-        model_row.append(InlineKeyboardButton(text, callback_data=f"model:{model_id}"))
+        text = f"✓ {spec.label}" if spec.id == selected_model else spec.label
+        model_row.append(InlineKeyboardButton(text, callback_data=f"model:{spec.id}"))
         
         # Create new row after every 2 buttons
         if len(model_row) == 2:
@@ -69,12 +68,12 @@ def build_settings_keyboard(selected_model: str, reasoning_effort: str) -> Inlin
         keyboard.append(model_row)
     
     # Only show reasoning options if current model supports it
-    if selected_model in REASONING_MODELS:
-        # Reasoning level selection (3 buttons in one row)
+    spec = registry.get(selected_model)
+    if spec.supports_reasoning:
+        # Reasoning level selection (one row, levels the model accepts)
         reasoning_row = []
         for label, level in REASONING_LEVELS:
-            # Skip "high" for models that don't support it (e.g. gpt-5.2)
-            if level == "high" and selected_model == "gpt-5.2-chat-latest":
+            if level not in spec.reasoning_efforts:
                 continue
                 
             text = f"✓ {label}" if level == reasoning_effort else label
@@ -86,6 +85,18 @@ def build_settings_keyboard(selected_model: str, reasoning_effort: str) -> Inlin
         keyboard.append([
             InlineKeyboardButton("ℹ️ No reasoning controls available", callback_data="noop")
         ])
+
+    # Auto: simple messages go to a faster model / lower effort; the selections
+    # above are the ceiling
+    label = f"🪄 Auto for simple messages: {'On' if auto_route else 'Off'}"
+    toggle = "off" if auto_route else "on"
+    keyboard.append([InlineKeyboardButton(label, callback_data=f"auto:{toggle}")])
+
+    # Response cache opt-out (only shown when the cache is enabled server-side)
+    if cache_responses is not None:
+        label = "🗄 Reuse cached answers: On" if cache_responses else "🗄 Reuse cached answers: Off"
+        toggle = "off" if cache_responses else "on"
+        keyboard.append([InlineKeyboardButton(label, callback_data=f"cache:{toggle}")])
     
     return InlineKeyboardMarkup(keyboard)
 
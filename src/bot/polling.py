@@ -0,0 +1,310 @@
+"""Self-hosted runner: long polling with a pool of worker processes.
+
+    python -m src.bot.polling [--workers N]
+
+The parent process fetches updates with getUpdates and hands each one to a
+worker process chosen by the sender's user ID, so all updates of a user are
+handled by the same process (album and burst merging, cancellation of
+superseded answers and the pending image prefetch are per process). Each
+worker runs its own event loop, Telegram application and HTTP/database
+connection pools, so one machine can use all its cores.
+
+Fetching the next batch confirms the previous one to Telegram, so updates
+handed out but not finished yet are kept in a checkpoint file together with
+the next offset, and handed out again after a restart (the handlers' duplicate
+checks skip any that were in fact answered). SIGINT/SIGTERM stop polling,
+let the workers finish their updates (up to POLLING_SHUTDOWN_TIMEOUT_SECONDS)
+and write the final checkpoint.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from typing import Any
+
+from telegram import Bot
+from telegram.error import TelegramError
+
+from src.config import settings
+
+# Longest pause between getUpdates attempts after errors
+MAX_RETRY_DELAY_SECONDS = 30.0
+
+
+def shard(data: dict[str, Any], workers: int) -> int:
+    """Worker index for a raw update: by sender, so one user's updates share a process."""
+    for value in data.values():
+        if isinstance(value, dict):
+            sender = value.get("from") or value.get("user") or {}
+            if "id" in sender:
+                return sender["id"] % workers
+    return data["update_id"] % workers
+
+
+class Checkpoint:
+    """Next getUpdates offset plus the updates handed out but not finished, as a JSON file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset: int | None = None
+        self.pending: dict[int, dict[str, Any]] = {}
+        self._dirty = False
+
+    def load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable polling checkpoint {self.path}: {e}")
+            return
+        self.offset = saved.get("offset")
+        self.pending = {update["update_id"]: update for update in saved.get("pending", [])}
+
+    def handed_out(self, data: dict[str, Any]) -> None:
+        update_id = data["update_id"]
+        self.pending[update_id] = data
+        self.offset = max(self.offset or 0, update_id + 1)
+        self._dirty = True
+
+    def finished(self, update_id: int) -> None:
+        if self.pending.pop(update_id, None) is not None:
+            self._dirty = True
+
+    def save(self) -> None:
+        """Write the checkpoint if it changed (atomically: a crash never leaves half a file)."""
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"offset": self.offset, "pending": list(self.pending.values())}, f)
+        os.replace(temporary, self.path)
+        self._dirty = False
+
+
+def _worker(index: int, inbox: Queue, outbox: Queue) -> None:
+    """Worker process: handle the updates from `inbox` until it yields None."""
+    # Shutdown is coordinated by the parent (Ctrl+C in a terminal reaches every process)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_work(index, inbox, outbox))
+
+
+async def _work(index: int, inbox: Queue, outbox: Queue) -> None:
+    # Imported here: the parent process only polls and never loads the bot
+    from src.services.usage import usage_ledger
+    from src.tracing import configure_tracing
+
+    from .app import build_application, process_update
+
+    configure_tracing(settings.tracing_exporters, settings.tracing_json_path)
+    application = build_application()
+    await application.initialize()
+    slots = asyncio.Semaphore(settings.polling_worker_concurrency)
+    running: set[asyncio.Task] = set()
+
+    async def handle(data: dict[str, Any]) -> None:
+        try:
+            await process_update(application, data, span_name="polling.update")
+        except Exception as e:
+            print(f"Worker {index}: error processing update {data['update_id']}: {e}")
+        finally:
+            slots.release()
+            outbox.put(data["update_id"])
+
+    try:
+        while True:
+            await slots.acquire()
+            data = await asyncio.to_thread(inbox.get)
+            if data is None:
+                break
+            task = asyncio.create_task(handle(data))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        if running:
+            await asyncio.gather(*running)
+    finally:
+        # Write usage records still buffered in this process
+        await asyncio.to_thread(usage_ledger.flush)
+        await application.shutdown()
+    print(f"Worker {index} stopped")
+
+
+class Poller:
+    """Fetches updates and dispatches them to worker processes until `stop` is called."""
+
+    def __init__(
+        self,
+        workers: int,
+        checkpoint: Checkpoint,
+        timeout: int = 25,
+        shutdown_timeout: float = 60.0,
+        worker_concurrency: int = 32,
+    ):
+        self.workers = workers
+        self.checkpoint = checkpoint
+        self.timeout = timeout
+        self.shutdown_timeout = shutdown_timeout
+        # Updates handed out but not finished before polling pauses for the workers
+        self.max_pending = workers * worker_concurrency * 2
+        # Updates finished by the workers since `run` started
+        self.finished = 0
+        self._stop = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    async def run(self) -> None:
+        context = multiprocessing.get_context("spawn")
+        outbox: Queue = context.Queue()
+        inboxes: list[Queue] = [context.Queue() for _ in range(self.workers)]
+        processes = [
+            context.Process(
+                target=_worker,
+                args=(index, inbox, outbox),
+                name=f"voroojak-worker-{index}",
+                daemon=True,
+            )
+            for index, inbox in enumerate(inboxes)
+        ]
+        for process in processes:
+            process.start()
+        collector = asyncio.create_task(self._collect(outbox))
+        print(f"Polling with {self.workers} worker processes")
+
+        bot = Bot(settings.telegram_token, base_url=settings.telegram_base_url)
+        try:
+            async with bot:
+                # getUpdates is refused while a webhook is set
+                await bot.delete_webhook()
+                if self.checkpoint.pending:
+                    print(f"Resuming {len(self.checkpoint.pending)} unfinished updates")
+                for data in self.checkpoint.pending.values():
+                    inboxes[shard(data, self.workers)].put(data)
+
+                await self._poll(bot, inboxes, processes)
+                await self._drain(inboxes, processes)
+                outbox.put(None)
+                await collector
+                self.checkpoint.save()
+                # Let Telegram forget what was handed out (unfinished updates are in the checkpoint)
+                if self.checkpoint.offset is not None:
+                    await bot.get_updates(offset=self.checkpoint.offset, timeout=0, limit=1)
+        finally:
+            if not collector.done():
+                outbox.put(None)
+                await collector
+            self.checkpoint.save()
+            print(f"Stopped; {len(self.checkpoint.pending)} unfinished updates kept for next run")
+
+    async def _poll(self, bot: Bot, inboxes: list[Queue], processes: list[BaseProcess]) -> None:
+        retry_delay = 1.0
+        while not self._stop.is_set():
+            dead = [process.name for process in processes if not process.is_alive()]
+            if dead:
+                print(f"Worker processes exited unexpectedly: {', '.join(dead)}")
+                return
+            if len(self.checkpoint.pending) >= self.max_pending:
+                # The workers are behind; let them catch up before fetching more
+                await self._sleep(0.1)
+                continue
+
+            # Saved before the next getUpdates confirms the updates handed out so far
+            self.checkpoint.save()
+            fetch = asyncio.create_task(
+                bot.get_updates(offset=self.checkpoint.offset, timeout=self.timeout)
+            )
+            stopping = asyncio.create_task(self._stop.wait())
+            await asyncio.wait({fetch, stopping}, return_when=asyncio.FIRST_COMPLETED)
+            stopping.cancel()
+            if not fetch.done():
+                # Unconfirmed updates are delivered again by the next run
+                fetch.cancel()
+                await asyncio.gather(fetch, return_exceptions=True)
+                return
+            try:
+                updates = fetch.result()
+            except TelegramError as e:
+                print(f"getUpdates failed, retrying in {retry_delay:.0f}s: {e}")
+                await self._sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, MAX_RETRY_DELAY_SECONDS)
+                continue
+            retry_delay = 1.0
+
+            for update in updates:
+                data = update.to_dict()
+                self.checkpoint.handed_out(data)
+                inboxes[shard(data, self.workers)].put(data)
+
+    async def _drain(self, inboxes: list[Queue], processes: list[BaseProcess]) -> None:
+        """Let the workers finish the updates they have, then stop them."""
+        for inbox in inboxes:
+            inbox.put(None)
+        pending = len(self.checkpoint.pending)
+        print(f"Waiting up to {self.shutdown_timeout:.0f}s for {pending} unfinished updates")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.shutdown_timeout
+        for process in processes:
+            await asyncio.to_thread(process.join, max(0.0, deadline - loop.time()))
+        for process in processes:
+            if process.is_alive():
+                # Workers ignore SIGTERM (see _worker)
+                print(f"{process.name} did not stop in time, killing it")
+                process.kill()
+                await asyncio.to_thread(process.join)
+
+    async def _collect(self, outbox: Queue) -> None:
+        """Mark updates finished as the workers report them."""
+        while True:
+            update_id = await asyncio.to_thread(outbox.get)
+            if update_id is None:
+                return
+            self.checkpoint.finished(update_id)
+            self.finished += 1
+
+    async def _sleep(self, seconds: float) -> None:
+        """Sleep, waking early on `stop`."""
+        try:
+            await asyncio.wait_for(self._stop.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_polling(workers: int) -> None:
+    """Poll until SIGINT/SIGTERM, then shut down gracefully."""
+    checkpoint = Checkpoint(settings.polling_offset_path)
+    checkpoint.load()
+    poller = Poller(
+        workers,
+        checkpoint,
+        timeout=settings.polling_timeout_seconds,
+        shutdown_timeout=settings.polling_shutdown_timeout_seconds,
+        worker_concurrency=settings.polling_worker_concurrency,
+    )
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, poller.stop)
+    await poller.run()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the bot with long polling and workers")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.polling_workers,
+        help="Worker processes (0 = one per CPU)",
+    )
+    args = parser.parse_args(argv)
+    asyncio.run(run_polling(args.workers or os.cpu_count() or 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Concurrent preparation of a turn's inputs.
+
+Before the model call a turn reads settings, conversation state and history
+and may download images. Most of these do not depend on each other, so they
+run as a small dependency graph: every step starts as soon as the steps it
+needs have finished, and pre-LLM latency becomes the longest chain instead
+of the sum of all steps.
+"""
+
+import asyncio
+import functools
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from src import metrics
+from src.tracing import span
+
+
+def in_thread(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Callable[[], Awaitable[Any]]:
+    """Step running a blocking function (e.g. a database call) in a worker thread."""
+    return functools.partial(asyncio.to_thread, func, *args, **kwargs)
+
+
+class TaskGraph:
+    """Named async steps run concurrently, each after its dependencies.
+
+    A step is called with the results of its dependencies, in the order they
+    were listed. If any step fails, the steps still running are cancelled
+    and the error is raised from `run`.
+    """
+
+    def __init__(self, name: str = "prefetch"):
+        self.name = name
+        # Seconds each step took, filled in by `run`
+        self.timings: dict[str, float] = {}
+        self._steps: dict[str, tuple[Callable[..., Awaitable[Any]], tuple[str, ...]]] = {}
+
+    def add(self, name: str, step: Callable[..., Awaitable[Any]], after: tuple[str, ...] = ()) -> None:
+        for dependency in after:
+            if dependency not in self._steps:
+                raise ValueError(f"Step {name!r} depends on unknown step {dependency!r}")
+        self._steps[name] = (step, after)
+
+    async def run(self) -> dict[str, Any]:
+        """Run every step and return their results by name."""
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_step(name: str) -> Any:
+            step, after = self._steps[name]
+            inputs = [await tasks[dependency] for dependency in after]
+            with span(f"{self.name}.{name}"):
+                started = time.perf_counter()
+                try:
+                    return await step(*inputs)
+                finally:
+                    self.timings[name] = time.perf_counter() - started
+                    metrics.prefetch_duration.observe(self.timings[name], step=name)
+
+        with span(self.name, steps=len(self._steps)):
+            # Steps are added after their dependencies, so tasks exist before they are awaited
+            for name in self._steps:
+                tasks[name] = asyncio.create_task(run_step(name))
+
+            try:
+                done, _ = await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+            finally:
+                # On failure (or cancellation of the turn) stop the steps still running
+                pending = [task for task in tasks.values() if not task.done()]
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    await asyncio.gather(*pending, return_exceptions=True)
+
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+            return {name: task.result() for name, task in tasks.items()}
@@ -0,0 +1,34 @@
+"""Bot API transport with per-call tracing and error counts."""
+
+from telegram.request import HTTPXRequest, RequestData
+
+from src import metrics
+from src.tracing import span
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records a span and error metrics for every Bot API call."""
+
+    async def do_request(self, url: str, method: str, request_data: RequestData | None = None, **kwargs):
+        # URLs embed the bot token: label calls with the API method only
+        if "/file/bot" in url:
+            api_method = "download"
+        else:
+            api_method = url.rsplit("/", 1)[-1]
+
+        with span(f"telegram.{api_method}") as request_span:
+            if request_span.recording and request_data is not None:
+                size = len(request_data.json_payload)
+                for _, content, *_ in request_data.multipart_data.values():
+                    if isinstance(content, bytes):
+                        size += len(content)
+                request_span.set_attribute("request_bytes", size)
+            try:
+                status, payload = await super().do_request(url, method, request_data, **kwargs)
+            except Exception:
+                metrics.telegram_errors.inc(method=api_method)
+                raise
+            if status >= 400:
+                metrics.telegram_errors.inc(method=api_method)
+            request_span.set_attributes(status=status, response_bytes=len(payload))
+            return status, payload
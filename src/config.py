@@ -8,9 +8,139 @@ class Settings(BaseSettings):
     # Telegram
     telegram_token: str
     webhook_url: str
+    # API endpoints (overridable to point at local stand-ins, e.g. for benchmarks)
+    telegram_base_url: str = "https://api.telegram.org/bot"
+    telegram_base_file_url: str = "https://api.telegram.org/file/bot"
 
     # OpenAI
     openai_api_key: str
+    openai_base_url: str | None = None
+
+    # LLM routing: models tried after the user's model fails, in order.
+    # Append ":chat" to route a model through the Chat Completions API.
+    llm_fallback_chain: list[str] = ["gpt-5-mini", "gpt-4.1:chat"]
+    llm_request_timeout: float = 60.0
+    # Share of the remaining update deadline one route may use while other
+    # routes of the chain could still run (the last one gets all of it)
+    llm_attempt_deadline_share: float = 0.6
+    circuit_breaker_threshold: int = 3
+    circuit_breaker_cooldown: float = 30.0
+
+    # Hedging: once a call exceeds the model's recent latency percentile, race a
+    # duplicate against LLM_HEDGE_ROUTE (default: next route in the chain).
+    # Set LLM_HEDGE_PERCENTILE=0 to disable.
+    llm_hedge_percentile: float = 95.0
+    llm_hedge_min_samples: int = 20
+    llm_hedge_route: str | None = None
+
+    # Fallbacks whose recent calls failed at least this often (over at least
+    # LLM_UNHEALTHY_MIN_SAMPLES calls) are tried after the healthy ones
+    llm_unhealthy_error_rate: float = 0.5
+    llm_unhealthy_min_samples: int = 10
+
+    # "Auto" setting: model and effort for messages classified as simple
+    auto_route_fast_model: str = "gpt-5-mini"
+    auto_route_fast_effort: str = "low"
+
+    # USD per million tokens as [input, cached input, output], by model ID;
+    # overrides the list prices in src/llm/registry.py
+    llm_model_prices: dict[str, tuple[float, float, float]] = {}
+
+    # Scheduling: per-user in-flight cap and per-model concurrency / tokens-per-minute.
+    # Reasoning models get the smaller default concurrency; override per model by ID.
+    llm_user_max_inflight: int = 2
+    llm_default_concurrency: int = 16
+    llm_reasoning_concurrency: int = 8
+    llm_model_concurrency: dict[str, int] = {}
+    llm_tokens_per_minute: int = 400000
+    llm_model_tokens_per_minute: dict[str, int] = {}
+    llm_user_weights: dict[int, float] = {}
+
+    # Conversation context: at most HISTORY_LIMIT messages, with the window
+    # start advancing HISTORY_BLOCK messages at a time to keep prompt prefixes cacheable
+    history_limit: int = 30
+    history_block: int = 10
+
+    # Retention: messages older than these are moved to chat_history_archive
+    # (the newest HISTORY_LIMIT messages of each current session are kept)
+    history_retention_days: float = 180.0
+    history_image_retention_days: float = 30.0
+    history_archive_batch_size: int = 500
+
+    # Telegram user IDs allowed to see everyone's usage (/usage all); exempt from quotas
+    admin_user_ids: list[int] = []
+
+    # Token usage ledger: records are buffered and written in batches
+    usage_flush_batch_size: int = 50
+    usage_flush_interval_seconds: float = 30.0
+    # Per-user daily quotas (UTC days), 0 for unlimited
+    usage_daily_token_quota: int = 0
+    usage_daily_request_quota: int = 0
+    # How often a user's in-memory daily totals are refreshed from the ledger
+    usage_reconcile_seconds: float = 300.0
+
+    # Batch API (/later): requests per submitted batch, per user still waiting,
+    # and how long a claimed request may stay unsubmitted before it is retried
+    batch_max_requests: int = 1000
+    batch_max_open_per_user: int = 10
+    batch_claim_timeout_seconds: int = 900
+
+    # Shared secret for scheduled job endpoints (sent as "Authorization: Bearer <secret>")
+    cron_secret: str | None = None
+    # Token for /metrics and /api/stats (sent the same way); both are closed while unset
+    metrics_token: str | None = None
+
+    # Response cache (opt-in): backend is "memory" (per instance) or "postgres" (shared)
+    response_cache_enabled: bool = False
+    response_cache_backend: str = "memory"
+    response_cache_ttl: float = 3600.0
+    response_cache_turns: int = 4
+    response_cache_max_entries: int = 1024
+
+    # Telegram file cache keyed by file_unique_id: "memory", "disk" or "none"
+    file_cache_backend: str = "memory"
+    file_cache_dir: str = "/tmp/voroojak-files"
+    file_cache_max_bytes: int = 128 * 1024 * 1024
+
+    # Albums (media groups): photos arriving within the window are answered
+    # as one turn; the window restarts with each photo, up to the max wait
+    media_group_window_seconds: float = 0.8
+    media_group_max_wait_seconds: float = 3.0
+
+    # Text messages from one user arriving within the window (a long paste
+    # split by Telegram, a quick burst) are answered as one turn; the window
+    # restarts with each message, up to the max wait. 0 disables merging
+    message_coalesce_window_seconds: float = 0.6
+    message_coalesce_max_wait_seconds: float = 3.0
+
+    # Caption-less photos are downloaded right away and kept ready for the
+    # follow-up question for this long (per process)
+    pending_image_prefetch_ttl_seconds: float = 600.0
+
+    # Overall time budget for handling one webhook update
+    webhook_deadline_seconds: float = 55.0
+
+    # Per-user turn lock shared by all instances (user_turn_locks): a turn
+    # waits up to TURN_LOCK_WAIT_SECONDS for the previous turn of the same
+    # user, then runs anyway. The lease of a crashed instance expires after
+    # TURN_LOCK_TTL_SECONDS (keep it above the webhook deadline)
+    turn_lock_enabled: bool = True
+    turn_lock_wait_seconds: float = 30.0
+    turn_lock_ttl_seconds: int = 90
+
+    # Self-hosted long-polling runner (python -m src.bot.polling): worker
+    # processes (0 = one per CPU), updates in flight per worker, the file
+    # keeping the update offset and unfinished updates across restarts, and
+    # how long a shutdown waits for updates in flight
+    polling_workers: int = 0
+    polling_worker_concurrency: int = 32
+    polling_timeout_seconds: int = 25
+    polling_offset_path: str = "/var/tmp/voroojak-polling.json"
+    polling_shutdown_timeout_seconds: float = 60.0
+
+    # Tracing: exporters are "json" (stdout, or TRACING_JSON_PATH) and/or "otel"
+    tracing_exporters: list[str] = []
+    tracing_json_path: str | None = None
 
     # Supabase
     supabase_url: str
@@ -7,13 +7,34 @@ from .operations import (
     get_chat_history,
     get_user_settings,
     is_message_processed,
+    get_processed_message_ids,
     save_message,
+    save_turn,
     update_user_settings,
     set_pending_image,
     get_pending_image,
     clear_pending_image,
     get_active_vector_store,
     set_active_vector_store,
+    get_conversation_state,
+    start_new_session,
+    get_history_page,
+    iter_chat_history,
+    archive_chat_history,
+    insert_usage,
+    get_usage_summary,
+    queue_batch_request,
+    count_open_batch_requests,
+    claim_batch_requests,
+    mark_batch_submitted,
+    release_batch_requests,
+    get_submitted_batch_ids,
+    get_batch_requests,
+    finish_batch_request,
+    get_undelivered_batch_requests,
+    mark_batch_delivered,
+    acquire_turn_lock,
+    release_turn_lock,
 )
 
 
@@ -25,11 +46,32 @@ __all__ = [
     "update_user_settings",
     "get_chat_history",
     "is_message_processed",
+    "get_processed_message_ids",
     "save_message",
+    "save_turn",
     "delete_chat_history",
     "set_pending_image",
     "get_pending_image",
     "clear_pending_image",
     "get_active_vector_store",
     "set_active_vector_store",
+    "get_conversation_state",
+    "start_new_session",
+    "get_history_page",
+    "iter_chat_history",
+    "archive_chat_history",
+    "insert_usage",
+    "get_usage_summary",
+    "queue_batch_request",
+    "count_open_batch_requests",
+    "claim_batch_requests",
+    "mark_batch_submitted",
+    "release_batch_requests",
+    "get_submitted_batch_ids",
+    "get_batch_requests",
+    "finish_batch_request",
+    "get_undelivered_batch_requests",
+    "mark_batch_delivered",
+    "acquire_turn_lock",
+    "release_turn_lock",
 ]
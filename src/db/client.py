@@ -4,6 +4,7 @@ from functools import lru_cache
 from supabase import Client, create_client
 
 from src.config import settings
+from src.metrics import count_db_request
 
 
 @lru_cache(maxsize=1)
@@ -13,4 +14,7 @@ def get_supabase_client() -> Client:
     Returns:
         Configured Supabase client instance.
     """
-    return create_client(settings.supabase_url, settings.supabase_key)
+    client = create_client(settings.supabase_url, settings.supabase_key)
+    # Count every PostgREST round trip (see src/metrics.py)
+    client.postgrest.session.event_hooks["request"].append(count_db_request)
+    return client
@@ -20,6 +20,9 @@ class UserSettings(BaseModel):
     user_id: int
     selected_model: str = "gpt-5-mini"
     reasoning_effort: Literal["low", "medium", "high"] = "medium"
+    cache_responses: bool = True
+    # Choose model and reasoning effort per message (selected ones are the ceiling)
+    auto_route: bool = False
 
 
 class ConversationState(BaseModel):
@@ -27,7 +30,13 @@ class ConversationState(BaseModel):
     
     user_id: int
     pending_image_id: str | None = None
+    # Stable Telegram ID of the pending image, used as the file cache key
+    pending_image_unique_id: str | None = None
+    # Further images of a pending album ({"file_id", "file_unique_id"} each)
+    pending_extra_images: list[dict[str, str | None]] | None = None
     active_vector_store_id: str | None = None
+    # Current conversation session; bumped by /newchat
+    session_id: int = 0
     updated_at: datetime | None = None
 
 
@@ -35,15 +44,64 @@ class ChatMessage(BaseModel):
     """A single message in the chat history."""
 
     id: UUID | None = None
+    seq: int | None = None
     user_id: int
     role: Literal["user", "assistant"]
     content: str
     image_data: str | None = None
+    # Further images of an album, after the one in image_data
+    extra_image_data: list[str] | None = None
+    # Generated from image_data; lets listings skip the image payload
+    has_image: bool = False
+    # Generated: image_data plus extra_image_data (also in chat_history_archive)
+    image_count: int = 0
     message_id: int | None = None
+    # Further Telegram messages answered in the same turn
+    merged_message_ids: list[int] | None = None
+    session_id: int = 0
     created_at: datetime | None = None
 
 
-class ChatHistory(BaseModel):
-    """Collection of messages for context."""
+class UsageSummary(BaseModel):
+    """Token usage of one user with one model over a period."""
+
+    user_id: int
+    model: str
+    requests: int = 0
+    input_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+
+class BatchRequest(BaseModel):
+    """A request answered through the OpenAI Batch API (see batch_requests)."""
+
+    id: int | None = None
+    user_id: int
+    chat_id: int
+    message_id: int
+    session_id: int = 0
+    prompt: str
+    model: str
+    body: dict[str, Any]
+    status: Literal["queued", "submitting", "submitted", "completed", "failed"] = "queued"
+    batch_id: str | None = None
+    response: str | None = None
+    error: str | None = None
+    input_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    created_at: datetime | None = None
+    delivered_at: datetime | None = None
+
+
+class HistoryPage(BaseModel):
+    """One keyset page of a user's history, oldest first."""
 
     messages: list[ChatMessage] = Field(default_factory=list)
+    # Pass as `after_seq` to fetch the next page; None on the last page
+    next_after_seq: int | None = None
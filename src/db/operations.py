@@ -1,14 +1,41 @@
 
+import heapq
+from collections.abc import Iterator
 from datetime import datetime, timedelta, timezone
-from typing import Literal
+
+from postgrest.exceptions import APIError
+
+from src.tracing import current_span, traced
 
 from .client import get_supabase_client
-from .models import AllowedUser, ChatHistory, ChatMessage, UserSettings
+from .models import (
+    AllowedUser,
+    BatchRequest,
+    ChatMessage,
+    ConversationState,
+    HistoryPage,
+    UsageSummary,
+    UserSettings,
+)
+from .records import HistoryRecord, MessageRecord, SettingsRecord
 
 # Time in minutes before a pending image is considered "stale" and ignored
 PENDING_IMAGE_TIMEOUT_MINUTES = 60
 
+# Columns written for a new chat_history row
+MESSAGE_COLUMNS = {
+    "user_id", "role", "content", "message_id", "merged_message_ids",
+    "image_data", "extra_image_data", "session_id",
+}
+
+# Columns written for a new batch_requests row
+BATCH_REQUEST_COLUMNS = {"user_id", "chat_id", "message_id", "session_id", "prompt", "model", "body"}
 
+# PostgreSQL unique_violation
+UNIQUE_VIOLATION = "23505"
+
+
+@traced("db.check_user_access")
 def check_user_access(telegram_id: int) -> bool:
     """Check if user is whitelisted and active.
     
@@ -29,6 +56,7 @@ def check_user_access(telegram_id: int) -> bool:
     return len(response.data) > 0
 
 
+@traced("db.create_allowed_user")
 def create_allowed_user(telegram_id: int, username: str | None = None) -> AllowedUser:
     """Add a user to the whitelist.
     
@@ -45,30 +73,35 @@ def create_allowed_user(telegram_id: int, username: str | None = None) -> Allowe
     return AllowedUser(**response.data[0])
 
 
-def get_user_settings(user_id: int) -> UserSettings:
+@traced("db.get_user_settings")
+def get_user_settings(user_id: int) -> SettingsRecord:
     """Get user settings, creating defaults if not exists.
     
     Args:
         user_id: Telegram user ID.
         
     Returns:
-        User settings object.
+        User settings (lightweight read model).
     """
     client = get_supabase_client()
     response = client.table("user_settings").select("*").eq("user_id", user_id).execute()
 
     if response.data:
-        return UserSettings(**response.data[0])
+        return SettingsRecord.from_row(response.data[0])
 
-    # Create default settings
     # Create default settings
     default_settings = {"user_id": user_id, "selected_model": "gpt-5-mini", "reasoning_effort": "medium"}
     response = client.table("user_settings").insert(default_settings).execute()
-    return UserSettings(**response.data[0])
+    return SettingsRecord.from_row(response.data[0])
 
 
+@traced("db.update_user_settings")
 def update_user_settings(
-    user_id: int, selected_model: str | None = None, reasoning_effort: str | None = None
+    user_id: int,
+    selected_model: str | None = None,
+    reasoning_effort: str | None = None,
+    cache_responses: bool | None = None,
+    auto_route: bool | None = None,
 ) -> UserSettings:
     """Update user settings.
     
@@ -76,6 +109,8 @@ def update_user_settings(
         user_id: Telegram user ID.
         selected_model: New model selection (optional).
         reasoning_effort: New reasoning level (optional).
+        cache_responses: Whether answers may be served from the response cache (optional).
+        auto_route: Whether model and reasoning are chosen per message (optional).
         
     Returns:
         Updated settings.
@@ -86,6 +121,10 @@ def update_user_settings(
         updates["selected_model"] = selected_model
     if reasoning_effort:
         updates["reasoning_effort"] = reasoning_effort
+    if cache_responses is not None:
+        updates["cache_responses"] = cache_responses
+    if auto_route is not None:
+        updates["auto_route"] = auto_route
 
     response = (
         client.table("user_settings").update(updates).eq("user_id", user_id).execute()
@@ -93,27 +132,84 @@ def update_user_settings(
     return UserSettings(**response.data[0])
 
 
-def set_pending_image(user_id: int, file_id: str) -> None:
-    """Set a pending image for the user's conversation state."""
+@traced("db.set_pending_image")
+def set_pending_image(
+    user_id: int,
+    file_id: str,
+    file_unique_id: str | None = None,
+    extra_images: list[dict[str, str | None]] | None = None,
+) -> None:
+    """Set a pending image for the user's conversation state.
+    
+    Args:
+        user_id: Telegram user ID.
+        file_id: Telegram file ID of the image.
+        file_unique_id: Stable Telegram ID of the image (file cache key).
+        extra_images: Further images of an album, as
+            {"file_id": ..., "file_unique_id": ...} dicts.
+    """
     client = get_supabase_client()
+    # One statement: the upsert only sets the columns given, so the document
+    # context and session are kept without reading the row first (a read
+    # followed by a write could put back a value another instance just changed)
+    client.table("conversation_state").upsert(
+        {
+            "user_id": user_id,
+            "pending_image_id": file_id,
+            "pending_image_unique_id": file_unique_id,
+            "pending_extra_images": extra_images,
+            "updated_at": "now()",
+        },
+        returning="minimal",
+    ).execute()
+
+
+def _is_fresh_pending_image(updated_at: datetime) -> bool:
+    """Whether a pending image set at `updated_at` is still usable."""
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - updated_at <= timedelta(minutes=PENDING_IMAGE_TIMEOUT_MINUTES)
+
+
+@traced("db.get_conversation_state")
+def get_conversation_state(user_id: int) -> ConversationState:
+    """Get the user's conversation state in a single round trip.
+    
+    A stale pending image is left out of the returned state (the row itself is
+    not modified).
     
-    # Check if row exists to preserve other fields
-    existing = client.table("conversation_state").select("*").eq("user_id", user_id).execute()
+    Returns:
+        Conversation state, with defaults if the user has none yet.
+    """
+    client = get_supabase_client()
+    response = client.table("conversation_state").select("*").eq("user_id", user_id).execute()
     
-    data = {"user_id": user_id, "pending_image_id": file_id, "updated_at": "now()"}
+    if not response.data:
+        return ConversationState(user_id=user_id)
     
-    # If exists, merge (though upsert with ignore_duplicates=False usually works if we provide all keys, 
-    # but here we might only provide partial updates if we aren't careful. 
-    # To be safe, we just upsert. If active_vector_store_id exists, it might be overwritten if we don't include it.
-    if existing.data:
-        # Preserve existing active_vector_store_id
-        current = existing.data[0]
-        if current.get("active_vector_store_id"):
-            data["active_vector_store_id"] = current["active_vector_store_id"]
+    state = ConversationState(**response.data[0])
+    if state.pending_image_id and (not state.updated_at or not _is_fresh_pending_image(state.updated_at)):
+        state.pending_image_id = None
+        state.pending_extra_images = None
+    return state
+
 
-    client.table("conversation_state").upsert(data).execute()
+@traced("db.start_new_session")
+def start_new_session(user_id: int) -> int:
+    """Start a new conversation session (see `start_new_session` in schema.sql).
+    
+    Earlier messages stay in chat_history but are no longer used as context.
+    The active document context is cleared.
+    
+    Returns:
+        The new session ID.
+    """
+    client = get_supabase_client()
+    response = client.rpc("start_new_session", {"p_user_id": user_id}).execute()
+    return int(response.data)
 
 
+@traced("db.get_pending_image")
 def get_pending_image(user_id: int) -> str | None:
     """Get pending image ID if exists and is recent (< 60 mins)."""
     client = get_supabase_client()
@@ -140,12 +236,7 @@ def get_pending_image(user_id: int) -> str | None:
         # Supabase returns ISO strings
         updated_at = datetime.fromisoformat(updated_at_str.replace('Z', '+00:00'))
         
-        if updated_at.tzinfo is None:
-            updated_at = updated_at.replace(tzinfo=timezone.utc)
-        
-        time_diff = datetime.now(timezone.utc) - updated_at
-        
-        if time_diff > timedelta(minutes=PENDING_IMAGE_TIMEOUT_MINUTES):
+        if not _is_fresh_pending_image(updated_at):
             # Too old! Clean it up
             clear_pending_image(user_id)
             return None
@@ -156,29 +247,38 @@ def get_pending_image(user_id: int) -> str | None:
     return pending_id
 
 
-def clear_pending_image(user_id: int) -> None:
-    """Clear the pending image state."""
+@traced("db.clear_pending_image")
+def clear_pending_image(user_id: int, file_id: str | None = None) -> None:
+    """Clear the pending image state.
+    
+    Args:
+        user_id: Telegram user ID.
+        file_id: Only clear if this is still the pending image, so a photo
+            sent while the previous one was being answered is kept.
+    """
     client = get_supabase_client()
     # Update to None instead of delete to preserve vector_store_id
-    client.table("conversation_state").update({"pending_image_id": None}).eq("user_id", user_id).execute()
+    query = client.table("conversation_state").update(
+        {"pending_image_id": None, "pending_image_unique_id": None, "pending_extra_images": None},
+        returning="minimal",
+    ).eq("user_id", user_id)
+    if file_id is not None:
+        query = query.eq("pending_image_id", file_id)
+    query.execute()
 
 
+@traced("db.set_active_vector_store")
 def set_active_vector_store(user_id: int, vector_store_id: str | None) -> None:
     """Set the active vector store for the user."""
     client = get_supabase_client()
-    
-    # Fetch existing to preserve pending_image_id
-    existing = client.table("conversation_state").select("*").eq("user_id", user_id).execute()
-    data = {"user_id": user_id, "active_vector_store_id": vector_store_id, "updated_at": "now()"}
-    
-    if existing.data:
-        current = existing.data[0]
-        if current.get("pending_image_id"):
-            data["pending_image_id"] = current["pending_image_id"]
-            
-    client.table("conversation_state").upsert(data).execute()
+    # Only this column is written; the pending image and session are kept
+    client.table("conversation_state").upsert(
+        {"user_id": user_id, "active_vector_store_id": vector_store_id, "updated_at": "now()"},
+        returning="minimal",
+    ).execute()
 
 
+@traced("db.get_active_vector_store")
 def get_active_vector_store(user_id: int) -> str | None:
     """Get the active vector store ID."""
     client = get_supabase_client()
@@ -193,31 +293,111 @@ def get_active_vector_store(user_id: int) -> str | None:
     return None
 
 
-def get_chat_history(user_id: int, limit: int = 30) -> ChatHistory:
-    """Retrieve recent chat history for context.
+@traced("db.get_chat_history")
+def get_chat_history(user_id: int, limit: int = 30, session_id: int = 0) -> HistoryRecord:
+    """Retrieve recent chat history of one session for context.
     
     Args:
         user_id: Telegram user ID.
         limit: Maximum number of messages to retrieve.
+        session_id: Conversation session (see `get_conversation_state`).
         
     Returns:
-        Chat history object.
+        History (lightweight read model). `total` is left unset: counting the
+        session's rows would scan all of them on every turn.
     """
     client = get_supabase_client()
     response = (
         client.table("chat_history")
         .select("*")
         .eq("user_id", user_id)
-        .order("created_at", desc=True)
+        .eq("session_id", session_id)
+        .order("seq", desc=True)
         .limit(limit)
         .execute()
     )
     # Reverse to restore chronological order (oldest to newest)
     history_data = list(reversed(response.data))
-    messages = [ChatMessage(**msg) for msg in history_data]
-    return ChatHistory(messages=messages)
-
-
+    messages = [MessageRecord.from_row(msg) for msg in history_data]
+    current_span().set_attributes(rows=len(messages))
+    return HistoryRecord(messages=messages)
+
+
+@traced("db.get_history_page")
+def get_history_page(
+    user_id: int,
+    after_seq: int | None = None,
+    limit: int = 200,
+    session_id: int | None = None,
+    columns: str = "*",
+    archived: bool = False,
+) -> HistoryPage:
+    """Fetch one page of history in insertion order using keyset pagination.
+    
+    Each page is an index range scan on (user_id, seq), so cost does not grow
+    with how far into the history the page is.
+    
+    Args:
+        user_id: Telegram user ID.
+        after_seq: Cursor from the previous page's `next_after_seq` (None for the first page).
+        limit: Page size.
+        session_id: Restrict to one session (None for all sessions).
+        columns: PostgREST column list; must include `seq`.
+        archived: Read chat_history_archive instead of chat_history.
+        
+    Returns:
+        The page, with `next_after_seq` set if more rows may follow.
+    """
+    client = get_supabase_client()
+    table = "chat_history_archive" if archived else "chat_history"
+    query = client.table(table).select(columns).eq("user_id", user_id)
+    if session_id is not None:
+        query = query.eq("session_id", session_id)
+    if after_seq is not None:
+        query = query.gt("seq", after_seq)
+    response = query.order("seq").limit(limit).execute()
+    
+    messages = [ChatMessage(**row) for row in response.data]
+    next_after_seq = messages[-1].seq if len(messages) == limit else None
+    return HistoryPage(messages=messages, next_after_seq=next_after_seq)
+
+
+def iter_chat_history(
+    user_id: int,
+    page_size: int = 200,
+    session_id: int | None = None,
+    columns: str = "*",
+    include_archive: bool = False,
+) -> Iterator[ChatMessage]:
+    """Iterate over a user's whole history, oldest first, one page at a time.
+    
+    With `include_archive`, rows moved to chat_history_archive are merged in
+    by `seq` (retention moves image rows earlier than text, so the two tables
+    interleave). At most one page per table is held in memory.
+    """
+    if include_archive:
+        yield from heapq.merge(
+            _iter_history_table(user_id, page_size, session_id, columns, archived=False),
+            _iter_history_table(user_id, page_size, session_id, columns, archived=True),
+            key=lambda message: message.seq,
+        )
+    else:
+        yield from _iter_history_table(user_id, page_size, session_id, columns, archived=False)
+
+
+def _iter_history_table(
+    user_id: int, page_size: int, session_id: int | None, columns: str, archived: bool
+) -> Iterator[ChatMessage]:
+    after_seq = None
+    while True:
+        page = get_history_page(user_id, after_seq, page_size, session_id, columns, archived)
+        yield from page.messages
+        if page.next_after_seq is None:
+            return
+        after_seq = page.next_after_seq
+
+
+@traced("db.is_message_processed")
 def is_message_processed(user_id: int, message_id: int) -> bool:
     """Check if a message has already been processed.
     
@@ -228,24 +408,50 @@ def is_message_processed(user_id: int, message_id: int) -> bool:
     Returns:
         True if message exists, False otherwise.
     """
+    return message_id in get_processed_message_ids(user_id, [message_id])
+
+
+@traced("db.get_processed_message_ids")
+def get_processed_message_ids(user_id: int, message_ids: list[int]) -> set[int]:
+    """Which of the given messages have already been processed, in one round trip.
+    
+    A message counts as processed when it is stored under its own ID or was
+    merged into another message's turn (`merged_message_ids`).
+    
+    Args:
+        user_id: Telegram user ID.
+        message_ids: Telegram message IDs.
+        
+    Returns:
+        The subset of `message_ids` already processed.
+    """
     client = get_supabase_client()
+    ids = ",".join(str(message_id) for message_id in message_ids)
     response = (
         client.table("chat_history")
-        .select("id")
+        .select("message_id, merged_message_ids")
         .eq("user_id", user_id)
-        .eq("message_id", message_id)
+        .or_(f"message_id.in.({ids}),merged_message_ids.ov.{{{ids}}}")
         .execute()
     )
-    return len(response.data) > 0
+    processed = set()
+    for row in response.data:
+        processed.add(row["message_id"])
+        processed.update(row.get("merged_message_ids") or [])
+    return processed & set(message_ids)
 
 
+@traced("db.save_message")
 def save_message(
     user_id: int, 
     role: str, 
     content: str, 
     message_id: int | None = None,
-    image_data: str | None = None
-) -> ChatMessage:
+    image_data: str | None = None,
+    session_id: int = 0,
+    extra_image_data: list[str] | None = None,
+    merged_message_ids: list[int] | None = None,
+) -> None:
     """Save a message to chat history.
     
     Args:
@@ -254,23 +460,96 @@ def save_message(
         content: Message text content.
         message_id: Optional Telegram message ID for deduplication (only for user messages).
         image_data: Optional Base64 image data to persist.
+        session_id: Conversation session the message belongs to.
+        extra_image_data: Further Base64 images of an album, after `image_data`.
+        merged_message_ids: Further Telegram message IDs answered in the same
+            turn; they count as processed too.
+    """
+    client = get_supabase_client()
+    # Validate at the write boundary; the row is not echoed back (it may carry an image)
+    message = ChatMessage(
+        user_id=user_id,
+        role=role,
+        content=content,
+        message_id=message_id,
+        image_data=image_data,
+        extra_image_data=extra_image_data or None,
+        merged_message_ids=merged_message_ids or None,
+        session_id=session_id,
+    )
+    data = message.model_dump(include=MESSAGE_COLUMNS, exclude_none=True)
+    image_bytes = sum(len(image) for image in [image_data or "", *(extra_image_data or [])])
+    current_span().set_attributes(content_bytes=len(content), image_bytes=image_bytes)
+        
+    client.table("chat_history").insert(data, returning="minimal").execute()
+
+
+@traced("db.save_turn")
+def save_turn(
+    user_id: int,
+    user_content: str,
+    assistant_content: str,
+    message_id: int | None = None,
+    image_data: str | None = None,
+    session_id: int = 0,
+    extra_image_data: list[str] | None = None,
+    merged_message_ids: list[int] | None = None,
+) -> bool:
+    """Save a user message and the answer to it in one round trip.
+    
+    Called once the answer exists, so a turn that failed or was cancelled
+    leaves nothing behind. Both rows are inserted atomically, user message
+    first.
+    
+    Args:
+        user_id: Telegram user ID.
+        user_content: User message text content.
+        assistant_content: The model's answer.
+        message_id: Telegram message ID of the user message, for deduplication.
+        image_data: Optional Base64 image data sent with the user message.
+        session_id: Conversation session the turn belongs to.
+        extra_image_data: Further Base64 images of an album, after `image_data`.
+        merged_message_ids: Further Telegram message IDs answered in the same turn.
         
     Returns:
-        Saved message record.
+        False if `message_id` was already stored (a concurrent delivery of the
+        same message saved its turn first); nothing is saved then.
     """
     client = get_supabase_client()
-    data = {"user_id": user_id, "role": role, "content": content}
-    if message_id is not None:
-        data["message_id"] = message_id
-    if image_data is not None:
-        data["image_data"] = image_data
-        
-    response = client.table("chat_history").insert(data).execute()
-    return ChatMessage(**response.data[0])
+    messages = [
+        ChatMessage(
+            user_id=user_id,
+            role="user",
+            content=user_content,
+            message_id=message_id,
+            image_data=image_data,
+            extra_image_data=extra_image_data or None,
+            merged_message_ids=merged_message_ids or None,
+            session_id=session_id,
+        ),
+        ChatMessage(user_id=user_id, role="assistant", content=assistant_content, session_id=session_id),
+    ]
+    # Rows of one bulk insert must have the same keys, so nulls are sent explicitly
+    data = [message.model_dump(include=MESSAGE_COLUMNS) for message in messages]
+    image_bytes = sum(len(image) for image in [image_data or "", *(extra_image_data or [])])
+    current_span().set_attributes(
+        content_bytes=len(user_content) + len(assistant_content), image_bytes=image_bytes
+    )
+    
+    try:
+        client.table("chat_history").insert(data, returning="minimal").execute()
+    except APIError as e:
+        if e.code == UNIQUE_VIOLATION:
+            return False
+        raise
+    return True
 
 
+@traced("db.delete_chat_history")
 def delete_chat_history(user_id: int) -> int:
-    """Clear all chat history for a user.
+    """Permanently delete all chat history for a user.
+    
+    /newchat does not use this; it starts a new session instead.
     
     Args:
         user_id: Telegram user ID.
@@ -279,5 +558,321 @@ def delete_chat_history(user_id: int) -> int:
         Number of deleted records.
     """
     client = get_supabase_client()
-    response = client.table("chat_history").delete().eq("user_id", user_id).execute()
-    return len(response.data)
+    response = (
+        client.table("chat_history")
+        .delete(count="exact", returning="minimal")
+        .eq("user_id", user_id)
+        .execute()
+    )
+    return response.count or 0
+
+
+@traced("db.archive_chat_history")
+def archive_chat_history(
+    before: datetime,
+    images_before: datetime,
+    keep_recent: int = 30,
+    batch_size: int = 500,
+) -> int:
+    """Move one batch of old messages to chat_history_archive.
+    
+    See `archive_chat_history` in schema.sql for which rows qualify.
+    
+    Args:
+        before: Archive messages created before this time.
+        images_before: Archive messages with image data created before this time.
+        keep_recent: Newest messages of each user's current session to always keep.
+        batch_size: Maximum rows to move in this call.
+        
+    Returns:
+        Number of rows moved (0 when nothing is left to archive).
+    """
+    client = get_supabase_client()
+    response = client.rpc(
+        "archive_chat_history",
+        {
+            "p_before": before.isoformat(),
+            "p_images_before": images_before.isoformat(),
+            "p_keep_recent": keep_recent,
+            "p_batch_size": batch_size,
+        },
+    ).execute()
+    moved = int(response.data or 0)
+    current_span().set_attribute("rows", moved)
+    return moved
+
+
+@traced("db.get_cached_response")
+def get_cached_response(key: str) -> str | None:
+    """Get an unexpired cached response.
+    
+    Args:
+        key: Cache key (prompt hash).
+        
+    Returns:
+        Cached response text, or None on miss.
+    """
+    client = get_supabase_client()
+    response = (
+        client.table("response_cache")
+        .select("response")
+        .eq("key", key)
+        .gt("expires_at", datetime.now(timezone.utc).isoformat())
+        .execute()
+    )
+    if response.data:
+        return response.data[0]["response"]
+    return None
+
+
+@traced("db.set_cached_response")
+def set_cached_response(key: str, value: str, ttl_seconds: float) -> None:
+    """Store (or refresh) a cached response.
+    
+    Args:
+        key: Cache key (prompt hash).
+        value: Response text.
+        ttl_seconds: Time to live.
+    """
+    client = get_supabase_client()
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+    data = {"key": key, "response": value, "expires_at": expires_at.isoformat()}
+    client.table("response_cache").upsert(data).execute()
+
+
+@traced("db.purge_expired_responses")
+def purge_expired_responses() -> None:
+    """Delete expired response cache entries."""
+    client = get_supabase_client()
+    (
+        client.table("response_cache")
+        .delete(returning="minimal")
+        .lt("expires_at", datetime.now(timezone.utc).isoformat())
+        .execute()
+    )
+
+
+@traced("db.insert_usage")
+def insert_usage(rows: list[dict]) -> None:
+    """Append usage records to usage_ledger in one request.
+    
+    Args:
+        rows: Dicts with user_id, model, input_tokens, cached_tokens,
+            output_tokens and created_at.
+    """
+    client = get_supabase_client()
+    current_span().set_attribute("rows", len(rows))
+    client.table("usage_ledger").insert(rows, returning="minimal").execute()
+
+
+@traced("db.get_usage_summary")
+def get_usage_summary(since: datetime, user_id: int | None = None) -> list[UsageSummary]:
+    """Token usage since `since`, per user and model (see `usage_summary` in schema.sql).
+    
+    Args:
+        since: Start of the period.
+        user_id: Only this user; None for everyone.
+        
+    Returns:
+        One entry per (user, model) with any usage in the period.
+    """
+    client = get_supabase_client()
+    response = client.rpc(
+        "usage_summary", {"p_since": since.isoformat(), "p_user_id": user_id}
+    ).execute()
+    return [UsageSummary(**row) for row in response.data or []]
+
+
+@traced("db.queue_batch_request")
+def queue_batch_request(request: BatchRequest) -> bool:
+    """Queue a request for the next batch submission.
+    
+    Returns:
+        False if a request for the same (user_id, message_id) is already
+        queued (a Telegram retry); nothing is saved then.
+    """
+    client = get_supabase_client()
+    data = request.model_dump(include=BATCH_REQUEST_COLUMNS)
+    try:
+        client.table("batch_requests").insert(data, returning="minimal").execute()
+    except APIError as e:
+        if e.code == UNIQUE_VIOLATION:
+            return False
+        raise
+    return True
+
+
+@traced("db.count_open_batch_requests")
+def count_open_batch_requests(user_id: int) -> int:
+    """Requests of a user that have not been answered yet."""
+    client = get_supabase_client()
+    response = (
+        client.table("batch_requests")
+        .select("id", count="exact")
+        .eq("user_id", user_id)
+        .in_("status", ["queued", "submitting", "submitted"])
+        .limit(1)
+        .execute()
+    )
+    return response.count or 0
+
+
+@traced("db.claim_batch_requests")
+def claim_batch_requests(limit: int, stale_seconds: int = 900) -> list[BatchRequest]:
+    """Claim up to `limit` queued requests for submission (see schema.sql).
+    
+    Claimed requests are in status 'submitting' until `mark_batch_submitted`
+    or `release_batch_requests`.
+    """
+    client = get_supabase_client()
+    response = client.rpc(
+        "claim_batch_requests", {"p_limit": limit, "p_stale_seconds": stale_seconds}
+    ).execute()
+    claimed = [BatchRequest(**row) for row in response.data or []]
+    current_span().set_attribute("rows", len(claimed))
+    return claimed
+
+
+@traced("db.mark_batch_submitted")
+def mark_batch_submitted(ids: list[int], batch_id: str) -> None:
+    """Record that claimed requests were submitted as part of `batch_id`."""
+    client = get_supabase_client()
+    (
+        client.table("batch_requests")
+        .update(
+            {
+                "status": "submitted",
+                "batch_id": batch_id,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            },
+            returning="minimal",
+        )
+        .in_("id", ids)
+        .execute()
+    )
+
+
+@traced("db.release_batch_requests")
+def release_batch_requests(ids: list[int]) -> None:
+    """Put claimed requests back in the queue after a failed submission."""
+    client = get_supabase_client()
+    (
+        client.table("batch_requests")
+        .update(
+            {"status": "queued", "updated_at": datetime.now(timezone.utc).isoformat()},
+            returning="minimal",
+        )
+        .in_("id", ids)
+        .eq("status", "submitting")
+        .execute()
+    )
+
+
+@traced("db.get_submitted_batch_ids")
+def get_submitted_batch_ids() -> list[str]:
+    """IDs of the batches that still have requests waiting for results, oldest first."""
+    client = get_supabase_client()
+    response = (
+        client.table("batch_requests")
+        .select("batch_id")
+        .eq("status", "submitted")
+        .is_("delivered_at", "null")
+        .order("id")
+        .execute()
+    )
+    return list(dict.fromkeys(row["batch_id"] for row in response.data or []))
+
+
+@traced("db.get_batch_requests")
+def get_batch_requests(batch_id: str) -> list[BatchRequest]:
+    """Requests submitted as part of `batch_id` that have no outcome yet."""
+    client = get_supabase_client()
+    response = (
+        client.table("batch_requests")
+        .select("*")
+        .eq("batch_id", batch_id)
+        .eq("status", "submitted")
+        .execute()
+    )
+    return [BatchRequest(**row) for row in response.data or []]
+
+
+@traced("db.finish_batch_request")
+def finish_batch_request(
+    request_id: int,
+    response: str | None = None,
+    error: str | None = None,
+    input_tokens: int = 0,
+    cached_tokens: int = 0,
+    output_tokens: int = 0,
+) -> None:
+    """Store the outcome of a request: its answer, or `error` if it failed."""
+    client = get_supabase_client()
+    data = {
+        "status": "failed" if error else "completed",
+        "response": response,
+        "error": error,
+        "input_tokens": input_tokens,
+        "cached_tokens": cached_tokens,
+        "output_tokens": output_tokens,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+    client.table("batch_requests").update(data, returning="minimal").eq("id", request_id).execute()
+
+
+@traced("db.get_undelivered_batch_requests")
+def get_undelivered_batch_requests(limit: int = 100) -> list[BatchRequest]:
+    """Completed or failed requests whose outcome has not been sent yet, oldest first."""
+    client = get_supabase_client()
+    response = (
+        client.table("batch_requests")
+        .select("*")
+        .in_("status", ["completed", "failed"])
+        .is_("delivered_at", "null")
+        .order("id")
+        .limit(limit)
+        .execute()
+    )
+    return [BatchRequest(**row) for row in response.data or []]
+
+
+@traced("db.mark_batch_delivered")
+def mark_batch_delivered(request_id: int) -> None:
+    """Record that the user has been sent the outcome of a request."""
+    client = get_supabase_client()
+    now = datetime.now(timezone.utc).isoformat()
+    (
+        client.table("batch_requests")
+        .update({"delivered_at": now, "updated_at": now}, returning="minimal")
+        .eq("id", request_id)
+        .execute()
+    )
+
+
+@traced("db.acquire_turn_lock")
+def acquire_turn_lock(user_id: int, holder: str, ttl_seconds: int) -> bool:
+    """Try to take the user's turn lock (see `acquire_turn_lock` in schema.sql).
+    
+    Returns:
+        True if `holder` now holds the lock for `ttl_seconds`, False if
+        another holder has an unexpired lease.
+    """
+    client = get_supabase_client()
+    response = client.rpc(
+        "acquire_turn_lock",
+        {"p_user_id": user_id, "p_holder": holder, "p_ttl_seconds": ttl_seconds},
+    ).execute()
+    return bool(response.data)
+
+
+@traced("db.release_turn_lock")
+def release_turn_lock(user_id: int, holder: str) -> None:
+    """Release the user's turn lock if `holder` still holds it."""
+    client = get_supabase_client()
+    (
+        client.table("user_turn_locks")
+        .delete(returning="minimal")
+        .eq("user_id", user_id)
+        .eq("holder", holder)
+        .execute()
+    )
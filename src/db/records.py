@@ -0,0 +1,74 @@
+"""Read models for the per-update hot path.
+
+Rows read on every turn (recent history, settings) are wrapped in slotted
+dataclasses instead of pydantic models: no validation pass, no per-instance
+__dict__, and timestamps are kept as the ISO strings PostgREST returns. The
+database schema (CHECK constraints, NOT NULL) already guarantees their shape.
+Records are not frozen (frozen dataclasses cost ~3x more to construct) but
+are treated as read-only.
+Pydantic models in models.py remain for writes and other trust boundaries.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass(slots=True)
+class MessageRecord:
+    """A chat_history row, as read for model context."""
+
+    id: str | None
+    user_id: int
+    role: str
+    content: str
+    image_data: str | None = None
+    extra_image_data: list[str] | None = None
+    seq: int | None = None
+    message_id: int | None = None
+    session_id: int = 0
+    created_at: str | None = None
+
+    @classmethod
+    def from_row(cls, row: dict[str, Any]) -> "MessageRecord":
+        return cls(
+            id=row.get("id"),
+            user_id=row["user_id"],
+            role=row["role"],
+            content=row["content"],
+            image_data=row.get("image_data"),
+            extra_image_data=row.get("extra_image_data"),
+            seq=row.get("seq"),
+            message_id=row.get("message_id"),
+            session_id=row.get("session_id", 0),
+            created_at=row.get("created_at"),
+        )
+
+
+@dataclass(slots=True)
+class HistoryRecord:
+    """Recent messages of a session, oldest first."""
+
+    messages: list[MessageRecord] = field(default_factory=list)
+    # Total messages in the session (messages may be a suffix of them)
+    total: int | None = None
+
+
+@dataclass(slots=True)
+class SettingsRecord:
+    """A user_settings row."""
+
+    user_id: int
+    selected_model: str = "gpt-5-mini"
+    reasoning_effort: str = "medium"
+    cache_responses: bool = True
+    auto_route: bool = False
+
+    @classmethod
+    def from_row(cls, row: dict[str, Any]) -> "SettingsRecord":
+        return cls(
+            user_id=row["user_id"],
+            selected_model=row.get("selected_model") or "gpt-5-mini",
+            reasoning_effort=row.get("reasoning_effort") or "medium",
+            cache_responses=row.get("cache_responses", True) is not False,
+            auto_route=row.get("auto_route") is True,
+        )
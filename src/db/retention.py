@@ -0,0 +1,78 @@
+"""Retention job for chat_history.
+
+Moves old messages into chat_history_archive in small batches so the hot
+table (and its indexes) stays roughly proportional to active usage.
+
+Run from a scheduler or by hand:
+    python -m src.db.retention --max-seconds 240
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from src.config import settings
+
+from .operations import archive_chat_history
+
+
+def run_retention(
+    retention_days: float | None = None,
+    image_retention_days: float | None = None,
+    keep_recent: int | None = None,
+    batch_size: int | None = None,
+    max_seconds: float | None = None,
+) -> int:
+    """Archive batches until nothing qualifies or `max_seconds` is used up.
+
+    Arguments default to the HISTORY_* settings.
+
+    Returns:
+        Total number of rows moved.
+    """
+    retention_days = settings.history_retention_days if retention_days is None else retention_days
+    image_retention_days = (
+        settings.history_image_retention_days if image_retention_days is None else image_retention_days
+    )
+    keep_recent = settings.history_limit if keep_recent is None else keep_recent
+    batch_size = batch_size or settings.history_archive_batch_size
+
+    now = datetime.now(timezone.utc)
+    before = now - timedelta(days=retention_days)
+    images_before = now - timedelta(days=image_retention_days)
+    started = time.monotonic()
+
+    total = 0
+    while True:
+        moved = archive_chat_history(before, images_before, keep_recent, batch_size)
+        total += moved
+        if moved < batch_size:
+            break
+        if max_seconds is not None and time.monotonic() - started >= max_seconds:
+            print(f"Retention stopped after {max_seconds:.0f}s; more rows remain")
+            break
+
+    print(f"Archived {total} chat_history rows in {time.monotonic() - started:.1f}s")
+    return total
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Archive old chat_history rows")
+    parser.add_argument("--retention-days", type=float, default=None)
+    parser.add_argument("--image-retention-days", type=float, default=None)
+    parser.add_argument("--keep-recent", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    run_retention(
+        retention_days=args.retention_days,
+        image_retention_days=args.image_retention_days,
+        keep_recent=args.keep_recent,
+        batch_size=args.batch_size,
+        max_seconds=args.max_seconds,
+    )
+
+
+if __name__ == "__main__":
+    main()
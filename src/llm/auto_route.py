@@ -0,0 +1,116 @@
+"""Per-message choice of model and reasoning effort ("Auto" setting).
+
+A cheap local classifier sorts each message into a tier:
+
+- simple:   short chit-chat, thanks, one-line translations and lookups. Sent
+            to AUTO_ROUTE_FAST_MODEL (unless it costs more than the user's
+            model) with AUTO_ROUTE_FAST_EFFORT.
+- standard: everything else. The user's model, with at most medium effort.
+- complex:  code, long or multi-part questions, and requests for analysis,
+            proofs or step-by-step work. The user's model and effort.
+
+The user's own model and effort are the ceiling: auto routing only ever
+makes a turn cheaper and faster, never more expensive.
+"""
+
+import re
+from dataclasses import dataclass
+
+from src import metrics
+from src.config import settings
+from src.db.records import SettingsRecord
+
+from .registry import REASONING_EFFORTS, registry
+
+# Longer messages are never "simple"; at least this long makes them "complex"
+SIMPLE_MAX_WORDS = 12
+# Messages this short are "simple" unless they ask a question
+TRIVIAL_MAX_WORDS = 4
+COMPLEX_MIN_CHARS = 600
+
+_ACK = re.compile(
+    r"^\W*(thanks?( you)?|thx|ty|ok(ay)?|cool|nice|great|perfect|got it|yes|no|yep|nope|"
+    r"hi|hello|hey|good (morning|night|evening)|bye)\b",
+    re.IGNORECASE,
+)
+_LOOKUP = re.compile(
+    r"^\W*(translate|define|spell|what('s| is| are| does)|who( is|'s)|when (is|was|did)|"
+    r"where (is|are)|how do you say|synonyms? (of|for))\b",
+    re.IGNORECASE,
+)
+_COMPLEX = re.compile(
+    r"\b(step[- ]by[- ]step|prove|proof|derive|analy[sz]e|analysis|compare|trade-?offs?|"
+    r"design|architect\w*|debug|optimi[sz]e|refactor|algorithm|complexity|"
+    r"why (does|do|is|are|would)|explain (in detail|thoroughly)|in depth|plan)\b",
+    re.IGNORECASE,
+)
+_CODE = re.compile(
+    r"```|^\s*(def|class|import|from \S+ import|function|const|let|var|public|#include)\b"
+    r"|Traceback \(most recent call last\)|[;{}]\s*$",
+    re.MULTILINE,
+)
+
+
+@dataclass(frozen=True, slots=True)
+class RouteChoice:
+    """Model and reasoning effort picked for one turn."""
+
+    model: str
+    effort: str | None
+    tier: str
+    reason: str
+
+
+def classify(message: str, images: int = 0, file_context: bool = False) -> tuple[str, str]:
+    """Tier ("simple", "standard" or "complex") of a message, with the deciding feature."""
+    text = message.strip()
+    if _CODE.search(text):
+        return "complex", "code"
+    if len(text) >= COMPLEX_MIN_CHARS:
+        return "complex", "long"
+    if _COMPLEX.search(text):
+        return "complex", "analysis"
+    if text.count("?") > 1:
+        return "complex", "multi-question"
+    if images or file_context:
+        # Reading an attachment takes more than a quick lookup
+        return "standard", "attachment"
+    words = len(text.split())
+    if words <= SIMPLE_MAX_WORDS:
+        if _ACK.search(text):
+            return "simple", "acknowledgement"
+        if _LOOKUP.search(text):
+            return "simple", "lookup"
+        if words <= TRIVIAL_MAX_WORDS and "?" not in text:
+            return "simple", "short"
+    return "standard", "default"
+
+
+def _at_most(effort: str | None, ceiling: str | None) -> str | None:
+    if effort is None or ceiling is None:
+        return effort
+    return min(effort, ceiling, key=REASONING_EFFORTS.index)
+
+
+def choose(
+    user_settings: SettingsRecord, message: str, images: int = 0, file_context: bool = False
+) -> RouteChoice:
+    """Model and effort for one turn of a user with the Auto setting on."""
+    tier, reason = classify(message, images, file_context)
+    model = user_settings.selected_model
+    effort = registry.get(model).effort(user_settings.reasoning_effort)
+
+    if tier == "simple":
+        fast = registry.get(settings.auto_route_fast_model)
+        if fast.output_price <= registry.get(model).output_price:
+            model = fast.id
+        effort = _at_most(registry.get(model).effort(settings.auto_route_fast_effort), effort)
+    elif tier == "standard":
+        effort = _at_most(effort, "medium")
+
+    metrics.auto_route_decisions.inc(tier=tier, model=model)
+    print(
+        f"Auto route for user {user_settings.user_id}: {tier} ({reason}) "
+        f"-> {model}/{effort or 'none'}"
+    )
+    return RouteChoice(model=model, effort=effort, tier=tier, reason=reason)
@@ -0,0 +1,20 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class GenerationResult:
+    """Outcome of a single backend call."""
+
+    text: str
+    model: str
+    api: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    # True if the model called a hosted tool (web/file search) for this answer
+    used_tools: bool = False
+
+    @property
+    def cached_ratio(self) -> float:
+        """Share of input tokens served from the provider's prompt cache."""
+        return self.cached_tokens / self.input_tokens if self.input_tokens else 0.0
@@ -1,21 +1,23 @@
-
 from typing import Any
-from openai import OpenAI
+from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletion
 
+from .base import GenerationResult
+
 class ChatCompletionBackend:
     """Backend for standard Chat Completions API."""
     
-    def __init__(self, client: OpenAI):
+    def __init__(self, client: AsyncOpenAI):
         self.client = client
 
-    def generate(
+    async def generate(
         self,
         model: str,
         messages: list[dict[str, Any]],
         reasoning_effort: str | None = None,
-        supports_reasoning: bool = False
-    ) -> str:
+        supports_reasoning: bool = False,
+        timeout: float | None = None,
+    ) -> GenerationResult:
         """Generate response using Chat Completions API.
         
         Args:
@@ -23,9 +25,10 @@ class ChatCompletionBackend:
             messages: List of messages in standard format.
             reasoning_effort: 'low', 'medium', 'high', or None.
             supports_reasoning: Whether the model supports the reasoning_effort param.
+            timeout: Request timeout in seconds (client default if None).
             
         Returns:
-            Generated text content.
+            Generated text content with the model that produced it.
         """
         params = {
             "model": model,
@@ -35,6 +38,21 @@ class ChatCompletionBackend:
         # Add reasoning_effort only if supported/requested
         if supports_reasoning and reasoning_effort:
             params["reasoning_effort"] = reasoning_effort
+
+        if timeout is not None:
+            params["timeout"] = timeout
             
-        response = self.client.chat.completions.create(**params)
-        return response.choices[0].message.content or ""
+        response: ChatCompletion = await self.client.chat.completions.create(**params)
+
+        result = GenerationResult(
+            text=response.choices[0].message.content or "",
+            model=model,
+            api="chat",
+        )
+        usage = getattr(response, "usage", None)
+        if usage:
+            result.input_tokens = usage.prompt_tokens
+            result.output_tokens = usage.completion_tokens
+            details = getattr(usage, "prompt_tokens_details", None)
+            result.cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        return result
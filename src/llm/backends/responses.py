@@ -1,22 +1,26 @@
 
 from typing import Any
-from openai import OpenAI
+from openai import AsyncOpenAI
+
+from .base import GenerationResult
 
 class ResponsesBackend:
     """Backend for the experimental Responses API."""
     
-    def __init__(self, client: OpenAI):
+    def __init__(self, client: AsyncOpenAI):
         self.client = client
 
-    def generate(
+    async def generate(
         self,
         model: str,
         input_messages: list[dict[str, Any]],
         instructions: str,
         reasoning_effort: str | None = None,
         enable_web_search: bool = False,
-        vector_store_id: str | None = None
-    ) -> str:
+        vector_store_id: str | None = None,
+        timeout: float | None = None,
+        prompt_cache_key: str | None = None,
+    ) -> GenerationResult:
         """Generate response using Responses API.
         
         Args:
@@ -26,13 +30,43 @@ class ResponsesBackend:
             reasoning_effort: Reasoning effort level if applicable.
             enable_web_search: Whether to enable web search tool.
             vector_store_id: ID of vector store for file search.
+            timeout: Request timeout in seconds (client default if None).
+            prompt_cache_key: Routing hint so requests sharing a prefix hit the same cache.
             
         Returns:
-            Generated text content.
+            Generated text content with the model that produced it.
         """
         if not hasattr(self.client, 'responses'):
              raise AttributeError("OpenAI client does not support 'responses' API")
              
+        params = self.request_body(
+            model,
+            input_messages,
+            instructions,
+            reasoning_effort=reasoning_effort,
+            enable_web_search=enable_web_search,
+            vector_store_id=vector_store_id,
+        )
+
+        if timeout is not None:
+            params["timeout"] = timeout
+
+        if prompt_cache_key:
+            params["extra_body"] = {"prompt_cache_key": prompt_cache_key}
+            
+        response = await self.client.responses.create(**params)
+        return self.parse_response(response, model)
+
+    @staticmethod
+    def request_body(
+        model: str,
+        input_messages: list[dict[str, Any]],
+        instructions: str,
+        reasoning_effort: str | None = None,
+        enable_web_search: bool = False,
+        vector_store_id: str | None = None,
+    ) -> dict[str, Any]:
+        """Request body for POST /v1/responses (also used for Batch API lines)."""
         params = {
             "model": model,
             "input": input_messages,
@@ -56,6 +90,20 @@ class ResponsesBackend:
         # Configure Reasoning
         if reasoning_effort:
             params["reasoning"] = {"effort": reasoning_effort}
-            
-        response = self.client.responses.create(**params)
-        return response.output_text
+        return params
+
+    @staticmethod
+    def parse_response(response: Any, model: str) -> GenerationResult:
+        """GenerationResult from a Responses API response object."""
+        result = GenerationResult(text=response.output_text, model=model, api="responses")
+        result.used_tools = any(
+            getattr(item, "type", None) in ("web_search_call", "file_search_call")
+            for item in getattr(response, "output", None) or []
+        )
+        usage = getattr(response, "usage", None)
+        if usage:
+            result.input_tokens = usage.input_tokens
+            result.output_tokens = usage.output_tokens
+            details = getattr(usage, "input_tokens_details", None)
+            result.cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        return result
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Protocol
+
+from src.db.operations import get_cached_response, purge_expired_responses, set_cached_response
+
+from .backends.base import GenerationResult
+
+
+class CacheBackend(Protocol):
+    """Storage for cached responses."""
+
+    async def get(self, key: str) -> str | None: ...
+
+    async def set(self, key: str, value: str, ttl: float) -> None: ...
+
+
+class InMemoryCacheBackend:
+    """Process-local LRU with per-entry TTL."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    async def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class PostgresCacheBackend:
+    """Shared cache in the `response_cache` table, visible to every instance.
+
+    The database calls block, so they run in worker threads.
+    """
+
+    def __init__(self, purge_every: int = 100):
+        self.purge_every = purge_every
+        self._writes = 0
+
+    async def get(self, key: str) -> str | None:
+        return await asyncio.to_thread(get_cached_response, key)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await asyncio.to_thread(set_cached_response, key, value, ttl)
+        # Evict expired rows every so often rather than on every write
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            await asyncio.to_thread(purge_expired_responses)
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Case- and whitespace-insensitive form used for cache keys."""
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def _normalize_message(message: dict[str, Any]) -> dict[str, Any]:
+    content = message["content"]
+    if isinstance(content, str):
+        return {"role": message["role"], "content": normalize_text(content)}
+    parts = [
+        {**part, "text": normalize_text(part["text"])} if "text" in part else part
+        for part in content
+    ]
+    return {"role": message["role"], "content": parts}
+
+
+class ResponseCache:
+    """Exact-match response cache over normalized prompts.
+
+    The key covers the model, reasoning effort, normalized instructions and the
+    last `turns` messages of input (including the new message and volatile
+    context), so identical questions in the same recent context share an answer.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float = 3600.0, turns: int = 4):
+        self.backend = backend
+        self.ttl = ttl
+        self.turns = turns
+
+    def make_key(
+        self,
+        model: str,
+        reasoning_effort: str | None,
+        instructions: str,
+        input_messages: list[dict[str, Any]],
+    ) -> str:
+        payload = {
+            "model": model,
+            "reasoning_effort": reasoning_effort,
+            "instructions": normalize_text(instructions),
+            "messages": [_normalize_message(m) for m in input_messages[-self.turns:]],
+        }
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    async def get(self, key: str, model: str) -> GenerationResult | None:
+        try:
+            text = await self.backend.get(key)
+        except Exception as e:
+            # The cache must never fail a turn
+            print(f"Response cache read failed: {e}")
+            return None
+        if text is None:
+            return None
+        return GenerationResult(text=text, model=model, api="cache")
+
+    async def set(self, key: str, result: GenerationResult) -> None:
+        try:
+            await self.backend.set(key, result.text, self.ttl)
+        except Exception as e:
+            print(f"Response cache write failed: {e}")
+
+
+def build_response_cache(
+    backend: str, ttl: float, turns: int, max_entries: int
+) -> ResponseCache:
+    """Create the cache for the configured backend ('memory' or 'postgres')."""
+    if backend == "postgres":
+        return ResponseCache(PostgresCacheBackend(), ttl=ttl, turns=turns)
+    return ResponseCache(InMemoryCacheBackend(max_entries), ttl=ttl, turns=turns)
@@ -0,0 +1,82 @@
+"""Per-user registry of in-flight generations.
+
+A generation that no longer matters (the user sent a new message, started a
+new session or changed model) is cancelled: the upstream request is aborted,
+its scheduler slot is released at once and the caller gets
+`GenerationCancelledError` instead of an answer to save and send.
+
+Generations run as their own tasks so that cancelling one never cancels the
+update handler waiting for it. The registry is per process; a generation
+running on another instance is not reached.
+"""
+
+import asyncio
+from collections.abc import Coroutine
+from typing import Any, TypeVar
+
+from src import metrics
+
+T = TypeVar("T")
+
+
+class GenerationCancelledError(Exception):
+    """The generation was superseded and cancelled."""
+
+    def __init__(self, user_id: int, reason: str):
+        super().__init__(f"Generation for user {user_id} cancelled: {reason}")
+        self.user_id = user_id
+        self.reason = reason
+
+
+class _Generation:
+    __slots__ = ("task", "reason")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        # Set by `cancel`; None while the generation is still wanted
+        self.reason: str | None = None
+
+
+class GenerationRegistry:
+    """In-flight generations by user, cancellable as a group."""
+
+    def __init__(self):
+        self._running: dict[int, set[_Generation]] = {}
+
+    def in_flight(self, user_id: int) -> int:
+        return len(self._running.get(user_id, ()))
+
+    async def run(self, user_id: int, coro: Coroutine[Any, Any, T]) -> T:
+        """Run `coro` as one of the user's generations.
+
+        Raises:
+            GenerationCancelledError: If `cancel` was called for the user meanwhile.
+        """
+        generation = _Generation(asyncio.create_task(coro))
+        self._running.setdefault(user_id, set()).add(generation)
+        try:
+            return await generation.task
+        except asyncio.CancelledError:
+            if generation.reason is None:
+                # The caller itself was cancelled (awaiting the task cancelled it too)
+                raise
+            raise GenerationCancelledError(user_id, generation.reason) from None
+        finally:
+            running = self._running.get(user_id)
+            if running is not None:
+                running.discard(generation)
+                if not running:
+                    del self._running[user_id]
+
+    def cancel(self, user_id: int, reason: str) -> int:
+        """Cancel the user's in-flight generations; returns how many were cancelled."""
+        cancelled = 0
+        for generation in self._running.get(user_id, ()):
+            if generation.reason is None and not generation.task.done():
+                generation.reason = reason
+                generation.task.cancel()
+                cancelled += 1
+        if cancelled:
+            metrics.generations_cancelled.inc(cancelled, reason=reason)
+            print(f"Cancelled {cancelled} generation(s) for user {user_id}: {reason}")
+        return cancelled
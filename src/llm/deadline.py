@@ -0,0 +1,51 @@
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+class Deadline:
+    """An absolute point in time by which a unit of work must finish."""
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        """Create a deadline `seconds` from now."""
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        """Seconds left before expiry (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def cap(self, timeout: float) -> float:
+        """Clamp a per-call timeout so it never outlives this deadline."""
+        return min(timeout, self.remaining())
+
+
+_current_deadline: ContextVar[Deadline | None] = ContextVar("current_deadline", default=None)
+
+
+def current_deadline() -> Deadline | None:
+    """Deadline of the update currently being processed, if any."""
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[Deadline]:
+    """Bind a deadline to the current context; nested scopes can only shorten it."""
+    deadline = Deadline.after(seconds)
+    outer = _current_deadline.get()
+    if outer is not None and outer.expires_at < deadline.expires_at:
+        deadline = outer
+
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
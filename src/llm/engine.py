@@ -1,34 +1,92 @@
+from collections.abc import Sequence
 
-from datetime import datetime
-from openai import OpenAI
+from openai import AsyncOpenAI
+from src import metrics
 from src.config import settings
-from src.db.models import ChatHistory, UserSettings
+from src.db.records import HistoryRecord, SettingsRecord
+from src.tracing import span
 
-from .formatters import to_responses_format, to_chat_completion_format
+from .auto_route import choose as choose_route
+from .backends.base import GenerationResult
 from .backends.responses import ResponsesBackend
 from .backends.chat_completion import ChatCompletionBackend
+from .cache import build_response_cache
+from .cancellation import GenerationRegistry
+from .deadline import Deadline, current_deadline
+from .prompt import build_prompt, without_images
+from .registry import registry
+from .router import GenerationRequest, ModelRouter, Route
+from .scheduler import FairScheduler, ModelBudget, estimate_tokens
 
 
-# Configuration
-REASONING_MODELS = {"gpt-5.2-chat-latest", "gpt-5-mini"}
-WEB_SEARCH_MODELS = {"gpt-5.2-chat-latest", "gpt-5-mini", "gpt-4.1"}
+def model_budget(model: str) -> ModelBudget:
+    """Concurrency and TPM budget for a model (reasoning models get less concurrency)."""
+    default_concurrency = (
+        settings.llm_reasoning_concurrency
+        if registry.get(model).supports_reasoning
+        else settings.llm_default_concurrency
+    )
+    return ModelBudget(
+        concurrency=settings.llm_model_concurrency.get(model, default_concurrency),
+        tokens_per_minute=settings.llm_model_tokens_per_minute.get(
+            model, settings.llm_tokens_per_minute
+        ),
+    )
+
 
 class LLMEngine:
     """Orchestrates LLM calls, handling routing, formatting, and fallbacks."""
 
     def __init__(self):
-        self.client = OpenAI(api_key=settings.openai_api_key)
+        # Retries are replaced by failover to the next route in the chain
+        self.client = AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            base_url=settings.openai_base_url,
+            max_retries=0,
+        )
         self._responses_backend = ResponsesBackend(self.client)
         self._chat_backend = ChatCompletionBackend(self.client)
+        self.router = ModelRouter(
+            responses_backend=self._responses_backend,
+            chat_backend=self._chat_backend,
+            fallback_chain=[Route.parse(spec) for spec in settings.llm_fallback_chain],
+            models=registry,
+            timeout=settings.llm_request_timeout,
+            deadline_share=settings.llm_attempt_deadline_share,
+            failure_threshold=settings.circuit_breaker_threshold,
+            cooldown=settings.circuit_breaker_cooldown,
+            hedge_route=Route.parse(settings.llm_hedge_route) if settings.llm_hedge_route else None,
+            hedge_percentile=settings.llm_hedge_percentile,
+            hedge_min_samples=settings.llm_hedge_min_samples,
+            unhealthy_error_rate=settings.llm_unhealthy_error_rate,
+            unhealthy_min_samples=settings.llm_unhealthy_min_samples,
+        )
+        self.scheduler = FairScheduler(
+            model_budget,
+            user_max_inflight=settings.llm_user_max_inflight,
+            user_weights=settings.llm_user_weights,
+        )
+        # In-flight generations per user, cancelled when superseded
+        self.generations = GenerationRegistry()
+        self.cache = None
+        if settings.response_cache_enabled:
+            self.cache = build_response_cache(
+                settings.response_cache_backend,
+                ttl=settings.response_cache_ttl,
+                turns=settings.response_cache_turns,
+                max_entries=settings.response_cache_max_entries,
+            )
 
-    def generate_response(
+    async def generate_response(
         self,
-        history: ChatHistory,
+        history: HistoryRecord,
         user_message: str,
-        user_settings: UserSettings,
+        user_settings: SettingsRecord,
         image_base64: str | None = None,
         vector_store_id: str | None = None,
-    ) -> str:
+        extra_images: Sequence[str] = (),
+        deadline: Deadline | None = None,
+    ) -> GenerationResult:
         """High-level method to generate a response for a user chat session.
         
         Handles:
@@ -36,47 +94,154 @@ class LLMEngine:
         2. System Instructions
         3. Backend Selection (Responses API vs Standard)
         4. Fallback Logic
+
+        The call is bounded by `deadline`, defaulting to the deadline of the
+        update being processed (see `deadline_scope`). It is tracked in
+        `generations`, so `cancel_generations` can abort it.
+
+        Raises:
+            AllRoutesFailedError: If the selected model and every fallback failed.
+            QueueTimeoutError: If the deadline passed while waiting for capacity.
+            GenerationCancelledError: If the generation was superseded.
         """
-        
-        # 1. Prepare Base Context (Responses Format)
-        messages_responses_fmt = to_responses_format(history, user_message, image_base64)
-        
-        # 2. Prepare System Instructions
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        instructions = (
-            f"You are a helpful Telegram bot. Today's date is {current_date}. "
-            "You can use standard Markdown for formatting such as **bold**, *italic*, `code`, and [links](url).\n\n"
-            "CRITICAL TOOL USAGE RULES:\n"
-            "1. ONLY use the 'web_search' tool if the user explicitly asks you to search the web, "
-            "get latest info, or find live data.\n"
-            "2. If a user asks about something outside your knowledge cutoff but does NOT explicitly "
-            "request a search, DO NOT search automatically. Instead, inform the user about your "
-            "cutoff and ASK if they would like you to perform a web search.\n"
-            "3. Be concise and cost-efficient."
+        return await self.generations.run(
+            user_settings.user_id,
+            self._generate_response(
+                history, user_message, user_settings, image_base64, vector_store_id, extra_images, deadline
+            ),
         )
 
+    def cancel_generations(self, user_id: int, reason: str) -> int:
+        """Abort the user's in-flight generations (their callers get GenerationCancelledError)."""
+        return self.generations.cancel(user_id, reason)
+
+    async def _generate_response(
+        self,
+        history: HistoryRecord,
+        user_message: str,
+        user_settings: SettingsRecord,
+        image_base64: str | None,
+        vector_store_id: str | None,
+        extra_images: Sequence[str],
+        deadline: Deadline | None,
+    ) -> GenerationResult:
         model = user_settings.selected_model
-        reasoning_effort = user_settings.reasoning_effort if model in REASONING_MODELS else None
+        requested_effort = user_settings.reasoning_effort
+        auto_tier = None
+        if user_settings.auto_route:
+            # "Auto" setting: a cheaper model and/or less effort for simple messages
+            choice = choose_route(
+                user_settings,
+                user_message,
+                images=(1 if image_base64 else 0) + len(extra_images),
+                file_context=bool(vector_store_id),
+            )
+            model, auto_tier = choice.model, choice.tier
+            # Fallback routes still get the user's level if the chosen model has none
+            requested_effort = choice.effort or requested_effort
+
+        with span("llm.generate", model=model) as generate_span:
+            if auto_tier:
+                generate_span.set_attribute("auto_tier", auto_tier)
+            # 1-2. Assemble static instructions + stable history prefix + volatile tail
+            prompt = build_prompt(
+                history,
+                user_message,
+                image_base64,
+                extra_images,
+                limit=settings.history_limit,
+                block=settings.history_block,
+            )
+
+            request = GenerationRequest(
+                input_messages=prompt.input_messages,
+                instructions=prompt.instructions,
+                reasoning_effort=requested_effort,
+                vector_store_id=vector_store_id,
+                prompt_cache_key=f"user-{user_settings.user_id}",
+            )
         
-        # 3. Execution
-        try:
-            return self._responses_backend.generate(
-                model=model,
-                input_messages=messages_responses_fmt,
-                instructions=instructions,
-                reasoning_effort=reasoning_effort,
-                enable_web_search=(model in WEB_SEARCH_MODELS),
-                vector_store_id=vector_store_id
+            # File-search turns depend on the user's document, never cache them
+            reasoning_effort = registry.get(model).effort(request.reasoning_effort)
+            cache_key = None
+            if self.cache and user_settings.cache_responses and not vector_store_id:
+                cache_key = self.cache.make_key(
+                    model, reasoning_effort, request.instructions, request.input_messages
+                )
+                cached = await self.cache.get(cache_key, model)
+                metrics.response_cache_lookups.inc(result="hit" if cached else "miss")
+                if cached:
+                    print(f"Response cache hit for user {user_settings.user_id} ({model})")
+                    generate_span.set_attribute("cache_hit", True)
+                    return cached
+
+            # 3. Execution: wait for a fair share of capacity, then walk the fallback chain
+            deadline = deadline or current_deadline()
+            async with self.scheduler.slot(
+                user_settings.user_id,
+                model,
+                estimate_tokens(request.input_messages, reasoning_effort),
+                deadline=deadline,
+            ) as ticket:
+                generate_span.set_attribute("queued_for", round(ticket.queued_for, 4))
+                metrics.scheduler_wait.observe(ticket.queued_for, model=model)
+                result = await self.router.generate(model, request, deadline=deadline)
+                if result.input_tokens:
+                    ticket.actual_tokens = result.input_tokens + result.output_tokens
+
+            generate_span.set_attributes(served_by=result.model, used_tools=result.used_tools)
+
+            # Web-search answers are live data; only cache answers from the chosen model
+            if cache_key and not result.used_tools and result.model == model:
+                await self.cache.set(cache_key, result)
+            print(
+                f"Usage {result.model}: {result.input_tokens} in "
+                f"({result.cached_tokens} cached, {result.cached_ratio:.0%}), "
+                f"{result.output_tokens} out"
             )
-        except Exception as e:
-            return f"System Error: {str(e)}"
+            return result
     
-    def generate_simple(self, prompt: str, model: str = "gpt-4o-mini") -> str:
+    def batch_request_body(
+        self,
+        history: HistoryRecord,
+        user_message: str,
+        user_settings: SettingsRecord,
+    ) -> dict:
+        """Responses API request body for answering a turn through the Batch API.
+
+        Same prompt as `generate_response`, but without hosted tools, fallback
+        or the response cache: the request is sent later, as a line of a batch.
+        History images are replaced by placeholders, so the body stored until
+        then (and uploaded in the batch file) holds no inline image data.
+        """
+        prompt = build_prompt(
+            without_images(history),
+            user_message,
+            None,
+            limit=settings.history_limit,
+            block=settings.history_block,
+        )
+        model = user_settings.selected_model
+        body = ResponsesBackend.request_body(
+            model,
+            prompt.input_messages,
+            prompt.instructions,
+            reasoning_effort=registry.get(model).effort(user_settings.reasoning_effort),
+        )
+        body["prompt_cache_key"] = f"user-{user_settings.user_id}"
+        return body
+
+    async def generate_simple(self, prompt: str, model: str = "gpt-4o-mini") -> str:
         """Simple generation helper for internal tasks (e.g. titling)."""
-        return self._chat_backend.generate(
+        result = await self._chat_backend.generate(
             model=model,
             messages=[{"role": "user", "content": prompt}]
         )
+        return result.text
+
+    def latency_report(self) -> dict:
+        """Per-model capabilities, prices, p50/p95/p99 latency, error and hedge rates."""
+        return registry.report()
 
 # Global Instance
 engine = LLMEngine()
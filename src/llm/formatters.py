@@ -1,48 +1,164 @@
-
+from collections import OrderedDict
+from collections.abc import Sequence
+from dataclasses import dataclass
 from typing import Any
-from uuid import UUID
 
-from src.db.models import ChatHistory, ChatMessage
+from src.db.records import HistoryRecord, MessageRecord
+
+# Bounds for the per-process formatted message cache. Entries hold the
+# data URLs of images, so the byte bound is the one that usually applies.
+FORMAT_CACHE_MAX_ENTRIES = 4096
+FORMAT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+@dataclass(frozen=True, slots=True)
+class FormattedMessage:
+    """A history message in both API shapes.
+
+    The two dicts share their strings (including the image data URL), so
+    holding both costs no more than one. They are shared across turns and
+    must be treated as read-only.
+    """
+
+    responses: dict[str, Any]
+    chat: dict[str, Any]
+    size: int
+
+
+def _image_url(image_base64: str) -> str:
+    return f"data:image/jpeg;base64,{image_base64}"
+
+
+def _responses_content(text: str, image_urls: Sequence[str]) -> Any:
+    if not image_urls:
+        return text
+    return [
+        {"type": "input_text", "text": text},
+        *({"type": "input_image", "image_url": url} for url in image_urls),
+    ]
+
+
+def _chat_content(content: Any) -> Any:
+    """Chat Completions content for Responses content, without copying payloads."""
+    if not isinstance(content, list):
+        return content
+    converted = []
+    for item in content:
+        item_type = item.get("type")
+        if item_type == "input_text":
+            converted.append({"type": "text", "text": item["text"]})
+        elif item_type == "input_image":
+            # Chat Completions expects image_url as a dict wrapper
+            converted.append({"type": "image_url", "image_url": {"url": item["image_url"]}})
+        else:
+            # Keep existing if already in correct format or unknown
+            converted.append(item)
+    return converted
+
+
+def format_message(msg: MessageRecord) -> FormattedMessage:
+    """Format one stored message for both APIs (uncached)."""
+    images = [msg.image_data, *(msg.extra_image_data or [])] if msg.image_data else []
+    image_urls = [_image_url(image) for image in images]
+    responses = {"role": msg.role, "content": _responses_content(msg.content, image_urls)}
+    chat = {"role": msg.role, "content": _chat_content(responses["content"])}
+    size = len(msg.content) + sum(len(url) for url in image_urls)
+    return FormattedMessage(responses=responses, chat=chat, size=size)
+
+
+class MessageFormatCache:
+    """LRU of formatted history messages, keyed by message ID and content.
+
+    History rows are append-only, so a message formatted on one turn is
+    reused verbatim on every later turn it stays in the window. The key adds
+    a cheap content fingerprint (text, image length and tail) so a reused ID
+    never serves stale content; hashing whole images would cost as much as
+    formatting them.
+    """
+
+    def __init__(self, max_entries: int = FORMAT_CACHE_MAX_ENTRIES, max_bytes: int = FORMAT_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, FormattedMessage] = OrderedDict()
+        # id() of each cached Responses dict -> entry, for Responses -> Chat lookups
+        self._by_identity: dict[int, FormattedMessage] = {}
+
+    @staticmethod
+    def key(msg: MessageRecord) -> tuple | None:
+        if msg.id is None:
+            return None
+        image = msg.image_data or ""
+        extra = len(msg.extra_image_data) if msg.extra_image_data else 0
+        return (msg.id, msg.content, len(image), image[-32:], extra)
+
+    def get(self, msg: MessageRecord) -> FormattedMessage:
+        """Formatted message, from the cache when possible."""
+        key = self.key(msg)
+        if key is None:
+            return format_message(msg)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = format_message(msg)
+        if entry.size <= self.max_bytes:
+            self._entries[key] = entry
+            self._by_identity[id(entry.responses)] = entry
+            self.size += entry.size
+            self._evict()
+        return entry
+
+    def chat_shape(self, responses_message: dict[str, Any]) -> dict[str, Any] | None:
+        """Cached Chat Completions shape of a Responses dict produced by this cache."""
+        entry = self._by_identity.get(id(responses_message))
+        if entry is not None and entry.responses is responses_message:
+            return entry.chat
+        return None
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_identity.clear()
+        self.size = 0
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._by_identity.pop(id(entry.responses), None)
+            self.size -= entry.size
+
+
+# Global Instance
+format_cache = MessageFormatCache()
 
 
 def to_responses_format(
-    history: ChatHistory,
+    history: HistoryRecord,
     current_message: str,
-    image_base64: str | None = None
+    image_base64: str | None = None,
+    extra_images: Sequence[str] = (),
 ) -> list[dict[str, Any]]:
-    """Convert chat history to OpenAI Responses API format (input_text/input_image)."""
-    formatted_messages = []
-    
-    # Process history
-    for msg in history.messages:
-        content: Any = msg.content
-        if msg.image_data:
-            # Reconstruct multi-part message with vision
-            content = [
-                {"type": "input_text", "text": msg.content},
-                {
-                    "type": "input_image",
-                    "image_url": f"data:image/jpeg;base64,{msg.image_data}",
-                },
-            ]
-            formatted_messages.append({"role": msg.role, "content": content})
-        else:
-            formatted_messages.append({"role": msg.role, "content": msg.content})
-            
+    """Convert chat history to OpenAI Responses API format (input_text/input_image).
+
+    `extra_images` are further images of an album sent with the current
+    message, after `image_base64`.
+
+    History entries come from `format_cache` and are shared between calls;
+    the returned list is new but its dicts must not be mutated.
+    """
+    formatted_messages = [format_cache.get(msg).responses for msg in history.messages]
+
     # Append current message
-    current_content: Any = current_message
-    if image_base64:
-        current_content = [
-            {"type": "input_text", "text": current_message},
-            {
-                "type": "input_image",
-                "image_url": f"data:image/jpeg;base64,{image_base64}",
-            },
-        ]
-        formatted_messages.append({"role": "user", "content": current_content})
-    else:
-        formatted_messages.append({"role": "user", "content": current_message})
-        
+    images = [image_base64, *extra_images] if image_base64 else []
+    image_urls = [_image_url(image) for image in images]
+    formatted_messages.append({"role": "user", "content": _responses_content(current_message, image_urls)})
+
     return formatted_messages
 
 
@@ -50,36 +166,17 @@ def to_chat_completion_format(
     messages: list[dict[str, Any]]
 ) -> list[dict[str, Any]]:
     """Convert Responses API format messages to Standard Chat Completion format.
-    
+
     Converts 'input_text' -> 'text' and 'input_image' -> 'image_url' (dict).
+    Messages produced by `format_cache` map to their cached Chat shape; others
+    get new containers around the same strings (payloads are never copied).
     """
-    import copy
-    
     standard_messages = []
     for msg in messages:
-        msg_copy = copy.deepcopy(msg)
-        content = msg_copy["content"]
-        
-        if isinstance(content, list):
-            new_content = []
-            for item in content:
-                item_type = item.get("type")
-                if item_type == "input_text":
-                    new_content.append({
-                        "type": "text", 
-                        "text": item["text"]
-                    })
-                elif item_type == "input_image":
-                    # Chat Completions expects image_url as a dict wrapper
-                    new_content.append({
-                        "type": "image_url",
-                        "image_url": {"url": item["image_url"]} 
-                    })
-                else:
-                    # Keep existing if already in correct format or unknown
-                    new_content.append(item)
-            msg_copy["content"] = new_content
-            
-        standard_messages.append(msg_copy)
-        
+        cached = format_cache.chat_shape(msg)
+        if cached is not None:
+            standard_messages.append(cached)
+        else:
+            standard_messages.append({**msg, "content": _chat_content(msg["content"])})
+
     return standard_messages
@@ -0,0 +1,74 @@
+from collections import defaultdict, deque
+
+
+class LatencyTracker:
+    """Rolling per-model latency samples, error rates and hedge counters."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: dict[str, deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+        # Outcome of each recent call (True for success), for the error rate
+        self._outcomes: dict[str, deque[bool]] = defaultdict(lambda: deque(maxlen=self.window))
+        self._requests: dict[str, int] = defaultdict(int)
+        self._hedges: dict[str, int] = defaultdict(int)
+        self._hedge_wins: dict[str, int] = defaultdict(int)
+
+    def record(self, model: str, seconds: float) -> None:
+        """Record the duration of a successful call."""
+        self._samples[model].append(seconds)
+        self._outcomes[model].append(True)
+
+    def record_error(self, model: str) -> None:
+        """Record a call that failed (timeout, connection or server error)."""
+        self._outcomes[model].append(False)
+
+    def record_request(self, model: str) -> None:
+        """Count a primary request (the denominator of the hedge rate)."""
+        self._requests[model] += 1
+
+    def record_hedge(self, model: str) -> None:
+        """Count a hedge issued because `model` was slower than its threshold."""
+        self._hedges[model] += 1
+
+    def record_hedge_win(self, model: str) -> None:
+        """Count a hedge issued for `model` that finished before the primary."""
+        self._hedge_wins[model] += 1
+
+    def sample_count(self, model: str) -> int:
+        return len(self._samples.get(model, ()))
+
+    def error_rate(self, model: str, min_samples: int = 1) -> float | None:
+        """Share of recent calls that failed, or None with fewer than `min_samples` calls."""
+        outcomes = self._outcomes.get(model)
+        if not outcomes or len(outcomes) < min_samples:
+            return None
+        return outcomes.count(False) / len(outcomes)
+
+    def percentile(self, model: str, q: float) -> float | None:
+        """Nearest-rank percentile (0-100) of recent latencies, or None without samples."""
+        samples = self._samples.get(model)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def report(self) -> dict[str, dict[str, float | int | None]]:
+        """Per-model p50/p95/p99 latency (seconds), error rate and hedge statistics."""
+        models = set(self._samples) | set(self._outcomes) | set(self._requests)
+        report = {}
+        for model in sorted(models):
+            requests = self._requests.get(model, 0)
+            hedges = self._hedges.get(model, 0)
+            report[model] = {
+                "samples": self.sample_count(model),
+                "p50": self.percentile(model, 50),
+                "p95": self.percentile(model, 95),
+                "p99": self.percentile(model, 99),
+                "error_rate": self.error_rate(model),
+                "requests": requests,
+                "hedges": hedges,
+                "hedge_wins": self._hedge_wins.get(model, 0),
+                "hedge_rate": hedges / requests if requests else 0.0,
+            }
+        return report
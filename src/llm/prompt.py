@@ -0,0 +1,143 @@
+"""Prompt assembly laid out for provider-side prefix caching.
+
+The provider caches the longest previously-seen prefix of a request, so the
+prompt is ordered from most to least stable:
+
+1. Static system preamble (`instructions`) - identical for every call.
+2. Conversation history - append-only; the window start only moves in whole
+   blocks, so consecutive turns share a byte-identical prefix.
+3. Volatile context (current date, etc.) - a developer message placed after
+   the history, right before the new user message.
+4. The new user message.
+"""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from src.db.records import HistoryRecord, MessageRecord
+
+from .formatters import to_responses_format
+
+SYSTEM_PREAMBLE = (
+    "You are a helpful Telegram bot. "
+    "You can use standard Markdown for formatting such as **bold**, *italic*, `code`, and [links](url).\n\n"
+    "CRITICAL TOOL USAGE RULES:\n"
+    "1. ONLY use the 'web_search' tool if the user explicitly asks you to search the web, "
+    "get latest info, or find live data.\n"
+    "2. If a user asks about something outside your knowledge cutoff but does NOT explicitly "
+    "request a search, DO NOT search automatically. Instead, inform the user about your "
+    "cutoff and ASK if they would like you to perform a web search.\n"
+    "3. Be concise and cost-efficient."
+)
+
+
+@dataclass
+class Prompt:
+    """Assembled request payload."""
+
+    instructions: str
+    input_messages: list[dict[str, Any]]
+
+
+def stable_window(history: HistoryRecord, limit: int, block: int) -> HistoryRecord:
+    """Trim history so the window start only advances in multiples of `block`.
+
+    A plain "last N messages" window slides by two messages every turn, which
+    changes the very first history entry and invalidates the cached prefix.
+    Aligning the start to a block boundary keeps the prefix identical until
+    `block` more messages have accumulated, at the cost of sending between
+    `limit - block` and `limit` messages.
+
+    Without `total`, boundaries are the messages whose `seq` is a multiple of
+    `block`: the window starts at the oldest one among its first `block`
+    messages, or slides as usual when there is none there. Sequence numbers
+    are shared by all users, so this matches the positional alignment only
+    when a user's messages are numbered consecutively.
+
+    Args:
+        history: Most recent messages, oldest first.
+        limit: Maximum number of messages to keep.
+        block: Step by which the window start advances.
+
+    Returns:
+        History restricted to the aligned window.
+    """
+    if history.total is None:
+        messages = history.messages[-limit:]
+        if len(messages) < limit or block <= 1:
+            return HistoryRecord(messages=messages)
+        for skip, message in enumerate(messages[:block]):
+            if message.seq is not None and message.seq % block == 0:
+                return HistoryRecord(messages=messages[skip:])
+        return HistoryRecord(messages=messages)
+
+    total = history.total
+    if total <= limit or block <= 1:
+        return history
+
+    # First absolute position that is block-aligned and keeps at most `limit` messages
+    start = -(-(total - limit) // block) * block
+    first_fetched = total - len(history.messages)
+    skip = max(0, start - first_fetched)
+    return HistoryRecord(messages=history.messages[skip:], total=total)
+
+
+def without_images(history: HistoryRecord) -> HistoryRecord:
+    """History with each message's images replaced by a text placeholder."""
+    messages = []
+    for message in history.messages:
+        if message.image_data:
+            count = 1 + len(message.extra_image_data or [])
+            omitted = "image omitted" if count == 1 else f"{count} images omitted"
+            message = MessageRecord(
+                id=message.id,
+                user_id=message.user_id,
+                role=message.role,
+                content=f"{message.content}\n\n[{omitted}]",
+                seq=message.seq,
+                message_id=message.message_id,
+                session_id=message.session_id,
+                created_at=message.created_at,
+            )
+        messages.append(message)
+    return HistoryRecord(messages=messages, total=history.total)
+
+
+def volatile_context(now: datetime | None = None) -> str:
+    """Per-call facts that must not appear in the cached prefix."""
+    current_date = (now or datetime.now()).strftime("%Y-%m-%d")
+    return f"Today's date is {current_date}."
+
+
+def build_prompt(
+    history: HistoryRecord,
+    user_message: str,
+    image_base64: str | None = None,
+    extra_images: Sequence[str] = (),
+    limit: int = 30,
+    block: int = 10,
+    now: datetime | None = None,
+) -> Prompt:
+    """Assemble instructions and input in cache-friendly order.
+
+    Args:
+        history: Previous conversation context (oldest first).
+        user_message: The new user message.
+        image_base64: Optional image attached to the new message.
+        extra_images: Further images of an album, after `image_base64`.
+        limit: Maximum number of history messages to include.
+        block: Granularity at which the history window start advances.
+        now: Override for the current time (for tests/benchmarks).
+
+    Returns:
+        Prompt with static instructions and ordered input messages.
+    """
+    window = stable_window(history, limit, block)
+    messages = to_responses_format(window, user_message, image_base64, extra_images)
+
+    # Insert the volatile note between the stable prefix and the new message
+    messages.insert(-1, {"role": "developer", "content": volatile_context(now)})
+
+    return Prompt(instructions=SYSTEM_PREAMBLE, input_messages=messages)
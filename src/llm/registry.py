@@ -0,0 +1,172 @@
+"""The models the bot knows: capabilities, context size, prices and live statistics.
+
+Everything that depends on what a model can do reads it from here: which
+reasoning efforts it accepts, whether it gets hosted web search, what the
+settings keyboard offers and what a call costs. The router records rolling
+latency and error rates per model into `ModelRegistry.stats` and uses them to
+order fallbacks and time hedges.
+"""
+
+from dataclasses import dataclass, replace
+
+from src.config import settings
+
+from .latency import LatencyTracker
+
+# Reasoning efforts, least to most effort
+REASONING_EFFORTS = ("low", "medium", "high")
+
+# Batch API requests cost half the interactive price
+BATCH_DISCOUNT = 0.5
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """Static description of one model."""
+
+    id: str
+    label: str
+    context_window: int = 0
+    # USD per million tokens (list prices; override with LLM_MODEL_PRICES)
+    input_price: float = 0.0
+    cached_input_price: float = 0.0
+    output_price: float = 0.0
+    # Accepted reasoning_effort values; empty if the parameter is not supported
+    reasoning_efforts: tuple[str, ...] = ()
+    web_search: bool = False
+    # Offered in the settings keyboard
+    selectable: bool = True
+
+    @property
+    def supports_reasoning(self) -> bool:
+        return bool(self.reasoning_efforts)
+
+    @property
+    def priced(self) -> bool:
+        return bool(self.input_price or self.output_price)
+
+    def effort(self, requested: str | None) -> str | None:
+        """The reasoning_effort to send for the user's setting, or None if unsupported.
+
+        A level the model does not accept becomes the closest lower one it does
+        (e.g. "high" -> "medium").
+        """
+        if not self.reasoning_efforts or requested is None:
+            return None
+        if requested in self.reasoning_efforts:
+            return requested
+        rank = REASONING_EFFORTS.index(requested) if requested in REASONING_EFFORTS else 0
+        lower = [e for e in self.reasoning_efforts if REASONING_EFFORTS.index(e) < rank]
+        return lower[-1] if lower else self.reasoning_efforts[0]
+
+    def cost(self, input_tokens: int, cached_tokens: int, output_tokens: int, batch: bool = False) -> float:
+        """Cost in USD of a call; `input_tokens` includes the cached ones."""
+        usd = (
+            (input_tokens - cached_tokens) * self.input_price
+            + cached_tokens * self.cached_input_price
+            + output_tokens * self.output_price
+        ) / 1_000_000
+        return usd * BATCH_DISCOUNT if batch else usd
+
+
+MODELS = (
+    ModelSpec(
+        id="gpt-5.2-chat-latest",
+        label="GPT-5.2 Chat",
+        context_window=128_000,
+        input_price=1.75,
+        cached_input_price=0.175,
+        output_price=14.00,
+        reasoning_efforts=("low", "medium"),
+        web_search=True,
+    ),
+    ModelSpec(
+        id="gpt-5-mini",
+        label="GPT-5 Mini",
+        context_window=400_000,
+        input_price=0.25,
+        cached_input_price=0.025,
+        output_price=2.00,
+        reasoning_efforts=("low", "medium", "high"),
+        web_search=True,
+    ),
+    ModelSpec(
+        id="gpt-4.1",
+        label="GPT-4.1",
+        context_window=1_047_576,
+        input_price=2.00,
+        cached_input_price=0.50,
+        output_price=8.00,
+        web_search=True,
+    ),
+    # Internal tasks only (see LLMEngine.generate_simple)
+    ModelSpec(
+        id="gpt-4o-mini",
+        label="GPT-4o Mini",
+        context_window=128_000,
+        input_price=0.15,
+        cached_input_price=0.075,
+        output_price=0.60,
+        selectable=False,
+    ),
+)
+
+
+class ModelRegistry:
+    """Model specs by ID, plus rolling per-model call statistics."""
+
+    def __init__(self, specs: tuple[ModelSpec, ...], stats: LatencyTracker | None = None):
+        self._specs = {spec.id: spec for spec in specs}
+        self.stats = stats or LatencyTracker()
+
+    def __contains__(self, model_id: str) -> bool:
+        return model_id in self._specs
+
+    def get(self, model_id: str) -> ModelSpec:
+        """Spec of a model; an unknown model gets no optional capabilities and no price."""
+        spec = self._specs.get(model_id)
+        if spec is None:
+            return ModelSpec(id=model_id, label=model_id, selectable=False)
+        return spec
+
+    def selectable(self) -> list[ModelSpec]:
+        """Models offered to users, in display order."""
+        return [spec for spec in self._specs.values() if spec.selectable]
+
+    def report(self) -> dict[str, dict]:
+        """Capabilities, prices and live statistics per model (for /api/stats)."""
+        stats = self.stats.report()
+        report = {}
+        for model_id in sorted(set(self._specs) | set(stats)):
+            spec = self.get(model_id)
+            report[model_id] = {
+                "context_window": spec.context_window,
+                "reasoning_efforts": list(spec.reasoning_efforts),
+                "web_search": spec.web_search,
+                "price_per_million": {
+                    "input": spec.input_price,
+                    "cached_input": spec.cached_input_price,
+                    "output": spec.output_price,
+                },
+                **stats.get(model_id, {}),
+            }
+        return report
+
+
+def _with_price_overrides(specs: tuple[ModelSpec, ...]) -> tuple[ModelSpec, ...]:
+    prices = settings.llm_model_prices
+    return tuple(
+        replace(
+            spec,
+            input_price=prices[spec.id][0],
+            cached_input_price=prices[spec.id][1],
+            output_price=prices[spec.id][2],
+        )
+        if spec.id in prices
+        else spec
+        for spec in specs
+    )
+
+
+# Global Instance
+registry = ModelRegistry(_with_price_overrides(MODELS))
@@ -0,0 +1,412 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Literal
+
+import openai
+
+from src import metrics
+from src.tracing import span
+
+from .backends.base import GenerationResult
+from .backends.chat_completion import ChatCompletionBackend
+from .backends.responses import ResponsesBackend
+from .deadline import Deadline
+from .formatters import to_chat_completion_format
+from .latency import LatencyTracker
+from .registry import ModelRegistry
+
+# Errors that indicate the provider (not the request) is unhealthy
+TRANSIENT_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+# Transient errors raised when a call used up its timeout
+TIMEOUT_ERRORS = (asyncio.TimeoutError, openai.APITimeoutError)
+
+# A timeout this close to the deadline was caused by the deadline (timers may
+# fire slightly early)
+DEADLINE_SLACK_SECONDS = 0.05
+
+
+def payload_size(input_messages: list[dict[str, Any]]) -> int:
+    """Total characters of text and inline image data in a request."""
+    total = 0
+    for message in input_messages:
+        content = message["content"]
+        if isinstance(content, str):
+            total += len(content)
+            continue
+        for part in content:
+            total += len(part.get("text") or part.get("image_url") or "")
+    return total
+
+
+@dataclass(frozen=True)
+class Route:
+    """A model paired with the API used to reach it."""
+
+    model: str
+    api: Literal["responses", "chat"] = "responses"
+
+    @classmethod
+    def parse(cls, spec: str) -> "Route":
+        """Parse a chain entry such as 'gpt-5-mini' or 'gpt-4.1:chat'."""
+        model, _, api = spec.strip().partition(":")
+        return cls(model=model, api="chat" if api == "chat" else "responses")
+
+
+@dataclass
+class GenerationRequest:
+    """Everything a backend needs to answer one turn, independent of the model."""
+
+    input_messages: list[dict[str, Any]]
+    instructions: str
+    reasoning_effort: str | None = None
+    vector_store_id: str | None = None
+    prompt_cache_key: str | None = None
+
+
+class CircuitBreaker:
+    """Per-route breaker that short-circuits calls after repeated failures.
+
+    closed    -> calls pass through; consecutive failures are counted.
+    open      -> calls are rejected until the cooldown has elapsed.
+    half-open -> a single probe call is allowed; success closes, failure re-opens.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def record_cancelled(self) -> None:
+        """A cancelled call says nothing about health; free the probe slot."""
+        self._probing = False
+
+
+class AllRoutesFailedError(Exception):
+    """Raised when every route in the fallback chain failed or was skipped."""
+
+    def __init__(self, errors: list[tuple[Route, str]]):
+        self.errors = errors
+        summary = "; ".join(f"{route.model}: {reason}" for route, reason in errors)
+        super().__init__(f"All models unavailable ({summary})")
+
+
+@dataclass
+class ModelRouter:
+    """Walks a fallback chain of routes, guarded by per-route circuit breakers.
+
+    If a route is slower than its recent `hedge_percentile` latency, a duplicate
+    request is sent to the hedge route; whichever finishes first wins and the
+    other is cancelled. Fallbacks that are currently failing (see
+    `unhealthy_error_rate`) are tried after the healthy ones.
+
+    Under a deadline, a route may use at most `deadline_share` of the time left
+    while other routes could still run, so a hanging model leaves time for the
+    fallbacks. Its timeout then counts as a failure; only a timeout caused by
+    the deadline itself does not.
+    """
+
+    responses_backend: ResponsesBackend
+    chat_backend: ChatCompletionBackend
+    fallback_chain: list[Route]
+    models: ModelRegistry
+    timeout: float = 60.0
+    deadline_share: float = 0.6
+    failure_threshold: int = 3
+    cooldown: float = 30.0
+    hedge_route: Route | None = None
+    hedge_percentile: float = 95.0
+    hedge_min_samples: int = 20
+    unhealthy_error_rate: float = 0.5
+    unhealthy_min_samples: int = 10
+    breakers: dict[Route, CircuitBreaker] = field(default_factory=dict)
+
+    @property
+    def latency(self) -> LatencyTracker:
+        """Rolling per-model statistics, kept with the model specs."""
+        return self.models.stats
+
+    def breaker(self, route: Route) -> CircuitBreaker:
+        if route not in self.breakers:
+            self.breakers[route] = CircuitBreaker(self.failure_threshold, self.cooldown)
+        return self.breakers[route]
+
+    def build_chain(self, model: str) -> list[Route]:
+        """The user's model via the Responses API, then the configured fallbacks.
+
+        Fallbacks keep their configured order, except that unhealthy ones go last.
+        """
+        fallbacks = [route for route in self.fallback_chain if route != Route(model)]
+        fallbacks = list(dict.fromkeys(fallbacks))
+        fallbacks.sort(key=self.is_unhealthy)
+        return [Route(model), *fallbacks]
+
+    def is_unhealthy(self, route: Route) -> bool:
+        """Whether the model failed at least `unhealthy_error_rate` of its recent calls."""
+        rate = self.latency.error_rate(route.model, self.unhealthy_min_samples)
+        return rate is not None and rate >= self.unhealthy_error_rate
+
+    async def generate(
+        self,
+        model: str,
+        request: GenerationRequest,
+        deadline: Deadline | None = None,
+    ) -> GenerationResult:
+        """Try each route in turn, skipping any whose breaker is open.
+
+        Args:
+            model: The user's selected model (first route in the chain).
+            request: Model-independent request payload.
+            deadline: Overall budget; each attempt gets a share of it (see class docstring).
+
+        Raises:
+            AllRoutesFailedError: If no route produced a response in time.
+        """
+        errors: list[tuple[Route, str]] = []
+        chain = self.build_chain(model)
+        attempted: set[Route] = set()
+
+        for index, route in enumerate(chain):
+            if route in attempted:
+                continue
+            if deadline is not None and deadline.expired:
+                errors.append((route, "deadline exceeded"))
+                break
+            if not self.breaker(route).allow_request():
+                errors.append((route, "circuit open"))
+                continue
+
+            hedge = self._hedge_for(route, chain[index + 1:])
+            timeout = self._attempt_timeout(route, chain[index + 1:], attempted, deadline)
+            attempted.add(route)
+
+            try:
+                result = await self._hedged_attempt(
+                    route, hedge, request, timeout, attempted, deadline
+                )
+            except openai.APIError as e:
+                errors.append((route, type(e).__name__))
+                continue
+            except TRANSIENT_ERRORS as e:
+                errors.append((route, type(e).__name__))
+                continue
+
+            if errors:
+                print(f"Served by fallback {result.model} ({result.api}) after {len(errors)} failure(s)")
+            return result
+
+        raise AllRoutesFailedError(errors)
+
+    def _attempt_timeout(
+        self,
+        route: Route,
+        remaining: list[Route],
+        attempted: set[Route],
+        deadline: Deadline | None,
+    ) -> float:
+        """Timeout of the attempt on `route`: its share of the deadline, at most `timeout`."""
+        if deadline is None:
+            return self.timeout
+        budget = deadline.remaining()
+        others = [
+            candidate
+            for candidate in remaining
+            if candidate != route
+            and candidate not in attempted
+            and self.breaker(candidate).state != "open"
+        ]
+        if others:
+            budget *= self.deadline_share
+        return min(self.timeout, budget)
+
+    def _hedge_for(self, route: Route, remaining: list[Route]) -> Route | None:
+        """Pick the hedge target: the configured route, else the next in the chain."""
+        if self.hedge_percentile <= 0:
+            return None
+        candidates = [self.hedge_route] if self.hedge_route else remaining
+        for candidate in candidates:
+            if candidate != route and self.breaker(candidate).state == "closed":
+                return candidate
+        return None
+
+    def _hedge_delay(self, route: Route) -> float | None:
+        if self.latency.sample_count(route.model) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(route.model, self.hedge_percentile)
+
+    async def _hedged_attempt(
+        self,
+        route: Route,
+        hedge: Route | None,
+        request: GenerationRequest,
+        timeout: float,
+        attempted: set[Route],
+        deadline: Deadline | None = None,
+    ) -> GenerationResult:
+        """Run `route`, racing it against `hedge` once it exceeds its hedge delay.
+
+        The hedge route is added to `attempted` only if it was actually launched.
+        """
+        self.latency.record_request(route.model)
+        primary = asyncio.create_task(self._attempt(route, request, timeout, deadline))
+        secondary: asyncio.Task | None = None
+
+        delay = self._hedge_delay(route) if hedge else None
+        if delay is None or delay >= timeout:
+            return await primary
+
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+
+            self.latency.record_hedge(route.model)
+            print(f"Hedging {route.model} with {hedge.model} after {delay:.2f}s")
+            attempted.add(hedge)
+            secondary = asyncio.create_task(
+                self._attempt(hedge, request, max(0.0, timeout - delay), deadline)
+            )
+            pending = {primary, secondary}
+            first_error: BaseException | None = None
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is secondary:
+                            self.latency.record_hedge_win(route.model)
+                        return task.result()
+                    first_error = first_error or task.exception()
+
+            raise first_error
+        finally:
+            # Cancel whichever request lost (or both, if we were cancelled)
+            for task in (primary, secondary):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def _attempt(
+        self,
+        route: Route,
+        request: GenerationRequest,
+        timeout: float,
+        deadline: Deadline | None = None,
+    ) -> GenerationResult:
+        """Single call to one route, with breaker and latency bookkeeping."""
+        breaker = self.breaker(route)
+        started = time.monotonic()
+        with span("llm.call", model=route.model, api=route.api, timeout=round(timeout, 3)) as call_span:
+            if call_span.recording:
+                call_span.set_attribute("input_chars", payload_size(request.input_messages))
+            try:
+                result = await asyncio.wait_for(self._call(route, request, timeout), timeout)
+            except asyncio.CancelledError:
+                breaker.record_cancelled()
+                raise
+            except TIMEOUT_ERRORS as e:
+                if deadline is not None and deadline.remaining() <= DEADLINE_SLACK_SECONDS:
+                    # Cut short by the update's deadline, not a slow route
+                    breaker.record_cancelled()
+                    print(f"Route {route.model} ({route.api}) ran out of time after {timeout:.2f}s")
+                else:
+                    self._record_failure(route, breaker, e)
+                raise
+            except TRANSIENT_ERRORS as e:
+                self._record_failure(route, breaker, e)
+                raise
+            except openai.APIError as e:
+                # Request-level error (e.g. unsupported parameter): try the next
+                # route but don't hold it against this model's health.
+                breaker.record_success()
+                metrics.llm_errors.inc(model=route.model, api=route.api, error=type(e).__name__)
+                print(f"Route {route.model} ({route.api}) rejected request: {e!r}")
+                raise
+
+            call_span.set_attributes(
+                input_tokens=result.input_tokens,
+                output_tokens=result.output_tokens,
+                cached_tokens=result.cached_tokens,
+                output_chars=len(result.text),
+            )
+
+        elapsed = time.monotonic() - started
+        breaker.record_success()
+        self.latency.record(route.model, elapsed)
+        effort = self.models.get(route.model).effort(request.reasoning_effort) or "none"
+        metrics.llm_duration.observe(elapsed, model=route.model, api=route.api, effort=effort)
+        metrics.llm_tokens.inc(result.input_tokens - result.cached_tokens, model=route.model, kind="input")
+        metrics.llm_tokens.inc(result.cached_tokens, model=route.model, kind="cached")
+        metrics.llm_tokens.inc(result.output_tokens, model=route.model, kind="output")
+        return result
+
+    def _record_failure(self, route: Route, breaker: CircuitBreaker, error: Exception) -> None:
+        breaker.record_failure()
+        self.latency.record_error(route.model)
+        metrics.llm_errors.inc(model=route.model, api=route.api, error=type(error).__name__)
+        print(f"Route {route.model} ({route.api}) failed: {error!r}")
+
+    async def _call(
+        self, route: Route, request: GenerationRequest, timeout: float
+    ) -> GenerationResult:
+        spec = self.models.get(route.model)
+        reasoning_effort = spec.effort(request.reasoning_effort)
+
+        if route.api == "chat":
+            # Chat Completions has no hosted tools; the fallback answers without them.
+            messages = [{"role": "system", "content": request.instructions}]
+            messages += to_chat_completion_format(request.input_messages)
+            return await self.chat_backend.generate(
+                model=route.model,
+                messages=messages,
+                reasoning_effort=reasoning_effort,
+                supports_reasoning=spec.supports_reasoning,
+                timeout=timeout,
+            )
+
+        return await self.responses_backend.generate(
+            model=route.model,
+            input_messages=request.input_messages,
+            instructions=request.instructions,
+            reasoning_effort=reasoning_effort,
+            enable_web_search=spec.web_search,
+            vector_store_id=request.vector_store_id,
+            timeout=timeout,
+            prompt_cache_key=request.prompt_cache_key,
+        )
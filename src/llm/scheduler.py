@@ -0,0 +1,249 @@
+import asyncio
+import time
+from collections import defaultdict
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+from .deadline import Deadline
+
+
+@dataclass
+class ModelBudget:
+    """Capacity granted to one model."""
+
+    concurrency: int
+    tokens_per_minute: int
+
+
+# Rough per-call output allowance, scaled by reasoning effort
+OUTPUT_TOKEN_ALLOWANCE = 1000
+EFFORT_MULTIPLIER = {None: 1, "low": 1, "medium": 2, "high": 4}
+IMAGE_TOKENS = 1000
+
+
+def estimate_tokens(input_messages: list[dict[str, Any]], reasoning_effort: str | None) -> int:
+    """Cheap upper-bound estimate of a call's token cost (~4 characters per token)."""
+    total = 0
+    for message in input_messages:
+        content = message["content"]
+        if isinstance(content, str):
+            total += len(content) // 4
+            continue
+        for part in content:
+            if part.get("type") == "input_image":
+                total += IMAGE_TOKENS
+            else:
+                total += len(part.get("text", "")) // 4
+    return total + OUTPUT_TOKEN_ALLOWANCE * EFFORT_MULTIPLIER.get(reasoning_effort, 1)
+
+
+class TokenBucket:
+    """Tokens-per-minute budget that refills continuously."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.tokens = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """Charge (positive) or refund (negative) the difference from an estimate."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class QueueTimeoutError(Exception):
+    """Raised when a request's deadline passes while it is still queued."""
+
+
+@dataclass
+class Ticket:
+    """Admission record for one LLM call."""
+
+    user_id: int
+    model: str
+    estimated_tokens: int
+    queued_for: float = 0.0
+    actual_tokens: int | None = None
+
+
+@dataclass
+class _Waiter:
+    ticket: Ticket
+    start: float
+    tag: float
+    enqueued_at: float
+    future: asyncio.Future = field(repr=False)
+
+
+class FairScheduler:
+    """Admission control in front of the model backends.
+
+    - Each user has at most `user_max_inflight` calls running at once.
+    - Each model has a concurrency limit and a tokens-per-minute bucket.
+    - Waiting requests for a model are served in weighted-fair order: each
+      gets a virtual finish tag `max(virtual_time, user's last tag) + cost / weight`,
+      and the smallest eligible tag runs next. A user who floods the queue only
+      pushes their own tags further out; other users keep their place.
+    """
+
+    def __init__(
+        self,
+        budget_for: Callable[[str], ModelBudget],
+        user_max_inflight: int = 2,
+        user_weights: dict[int, float] | None = None,
+    ):
+        self.budget_for = budget_for
+        self.user_max_inflight = user_max_inflight
+        self.user_weights = user_weights or {}
+
+        self._buckets: dict[str, TokenBucket] = {}
+        self._model_inflight: dict[str, int] = defaultdict(int)
+        self._user_inflight: dict[int, int] = defaultdict(int)
+        self._queues: dict[str, list[_Waiter]] = defaultdict(list)
+        self._virtual_time: dict[str, float] = defaultdict(float)
+        self._last_tag: dict[tuple[str, int], float] = {}
+        self._wakeups: dict[str, asyncio.TimerHandle] = {}
+
+    def _bucket(self, model: str) -> TokenBucket:
+        if model not in self._buckets:
+            self._buckets[model] = TokenBucket(self.budget_for(model).tokens_per_minute)
+        return self._buckets[model]
+
+    def queue_depth(self, model: str | None = None) -> int:
+        """Number of requests waiting for a model (or for all models)."""
+        if model is not None:
+            return len(self._queues.get(model, ()))
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        models = set(self._queues) | set(self._model_inflight)
+        return {
+            model: {
+                "queued": self.queue_depth(model),
+                "in_flight": self._model_inflight.get(model, 0),
+                "concurrency": self.budget_for(model).concurrency,
+            }
+            for model in sorted(models)
+        }
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        user_id: int,
+        model: str,
+        estimated_tokens: int,
+        deadline: Deadline | None = None,
+    ) -> AsyncIterator[Ticket]:
+        """Wait for capacity, then hold a slot for the duration of the block.
+
+        Set `ticket.actual_tokens` inside the block to reconcile the model's
+        token bucket with real usage on release.
+
+        Raises:
+            QueueTimeoutError: If `deadline` expires before the request is admitted.
+        """
+        ticket = Ticket(user_id=user_id, model=model, estimated_tokens=estimated_tokens)
+        weight = self.user_weights.get(user_id, 1.0)
+        start_tag = max(self._virtual_time[model], self._last_tag.get((model, user_id), 0.0))
+        tag = start_tag + estimated_tokens / weight
+        self._last_tag[(model, user_id)] = tag
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(
+            ticket=ticket,
+            start=start_tag,
+            tag=tag,
+            enqueued_at=time.monotonic(),
+            future=loop.create_future(),
+        )
+        self._queues[model].append(waiter)
+        self._dispatch(model)
+
+        # Only requests that could not be admitted immediately count as queued
+        if not waiter.future.done():
+            try:
+                timeout = deadline.remaining() if deadline else None
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # Admitted just as we gave up: hand the slot back
+                    self._release(ticket)
+                else:
+                    waiter.future.cancel()
+                    self._queues[model].remove(waiter)
+                if isinstance(e, asyncio.TimeoutError):
+                    raise QueueTimeoutError(f"Timed out waiting for {model} capacity") from None
+                raise
+
+            ticket.queued_for = time.monotonic() - waiter.enqueued_at
+            print(f"User {user_id} queued {ticket.queued_for:.2f}s for {model}")
+
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    def _release(self, ticket: Ticket) -> None:
+        self._model_inflight[ticket.model] -= 1
+        self._user_inflight[ticket.user_id] -= 1
+        if ticket.actual_tokens is not None:
+            self._bucket(ticket.model).adjust(ticket.actual_tokens - ticket.estimated_tokens)
+        # A freed user slot may unblock that user's requests on other models
+        for model in list(self._queues):
+            self._dispatch(model)
+
+    def _dispatch(self, model: str) -> None:
+        """Admit waiters for `model` in tag order while capacity allows."""
+        queue = self._queues[model]
+        budget = self.budget_for(model)
+        bucket = self._bucket(model)
+
+        while queue and self._model_inflight[model] < budget.concurrency:
+            eligible = [
+                w for w in queue if self._user_inflight[w.ticket.user_id] < self.user_max_inflight
+            ]
+            if not eligible:
+                return
+            waiter = min(eligible, key=lambda w: w.tag)
+
+            wait = bucket.wait_time(waiter.ticket.estimated_tokens)
+            if wait > 0:
+                self._schedule_wakeup(model, wait)
+                return
+
+            queue.remove(waiter)
+            bucket.take(waiter.ticket.estimated_tokens)
+            self._model_inflight[model] += 1
+            self._user_inflight[waiter.ticket.user_id] += 1
+            self._virtual_time[model] = max(self._virtual_time[model], waiter.start)
+            waiter.future.set_result(None)
+
+    def _schedule_wakeup(self, model: str, delay: float) -> None:
+        if model in self._wakeups:
+            return
+
+        def wake() -> None:
+            self._wakeups.pop(model, None)
+            self._dispatch(model)
+
+        self._wakeups[model] = asyncio.get_running_loop().call_later(delay, wake)
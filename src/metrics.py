@@ -0,0 +1,308 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Instruments are module-level globals, updated from the hot path and served by
+`GET /metrics` in api/webhook.py. Values are per process: each serverless
+instance reports its own series, to be aggregated by the scraper.
+"""
+
+import bisect
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Base class: a named family of series keyed by label values."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {} if labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Point-in-time value."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per series: per-bucket counts (last slot is +Inf), sum
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def count(self, **labels: object) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(self._sums[key])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global registry and instruments
+registry = Registry()
+
+webhook_duration = registry.register(Histogram(
+    "voroojak_webhook_duration_seconds",
+    "Time to handle one webhook update.",
+    ("outcome",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60),
+))
+db_round_trips = registry.register(Histogram(
+    "voroojak_db_round_trips_per_update",
+    "Supabase HTTP requests made while handling one update.",
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20),
+))
+db_requests = registry.register(Counter(
+    "voroojak_db_requests_total",
+    "Supabase HTTP requests by method.",
+    ("method",),
+))
+prefetch_duration = registry.register(Histogram(
+    "voroojak_prefetch_step_duration_seconds",
+    "Time of each turn preparation step (settings, state, history, images).",
+    ("step",),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5),
+))
+llm_duration = registry.register(Histogram(
+    "voroojak_llm_request_duration_seconds",
+    "Latency of successful model calls.",
+    ("model", "api", "effort"),
+    buckets=(0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+))
+llm_errors = registry.register(Counter(
+    "voroojak_llm_request_errors_total",
+    "Failed model calls by error type.",
+    ("model", "api", "error"),
+))
+llm_tokens = registry.register(Counter(
+    "voroojak_llm_tokens_total",
+    "Tokens consumed by model calls (kind: input, cached, output).",
+    ("model", "kind"),
+))
+response_cache_lookups = registry.register(Counter(
+    "voroojak_response_cache_lookups_total",
+    "Response cache lookups by result (hit or miss).",
+    ("result",),
+))
+file_cache_lookups = registry.register(Counter(
+    "voroojak_file_cache_lookups_total",
+    "Telegram file cache lookups by result (hit or miss).",
+    ("result",),
+))
+image_prefetch_lookups = registry.register(Counter(
+    "voroojak_image_prefetch_lookups_total",
+    "Follow-up messages looking for a pending image prepared in the background (hit, miss or error).",
+    ("result",),
+))
+generations_cancelled = registry.register(Counter(
+    "voroojak_generations_cancelled_total",
+    "In-flight generations cancelled because they were superseded.",
+    ("reason",),
+))
+auto_route_decisions = registry.register(Counter(
+    "voroojak_auto_route_decisions_total",
+    "Turns routed by the Auto setting, by complexity tier and chosen model.",
+    ("tier", "model"),
+))
+batch_requests = registry.register(Counter(
+    "voroojak_batch_requests_total",
+    "Batch API requests by lifecycle event (queued, submitted, completed, failed, delivered).",
+    ("event",),
+))
+scheduler_wait = registry.register(Histogram(
+    "voroojak_scheduler_wait_seconds",
+    "Time a model call waited for scheduler admission.",
+    ("model",),
+    buckets=(0, 0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30),
+))
+scheduler_queued = registry.register(Gauge(
+    "voroojak_scheduler_queue_depth",
+    "Model calls waiting for admission.",
+    ("model",),
+))
+scheduler_in_flight = registry.register(Gauge(
+    "voroojak_scheduler_in_flight",
+    "Model calls currently admitted.",
+    ("model",),
+))
+turn_lock_wait = registry.register(Histogram(
+    "voroojak_turn_lock_wait_seconds",
+    "Time a turn waited for the user's turn lock, by outcome (acquired, timeout, error).",
+    ("outcome",),
+    buckets=(0, 0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30),
+))
+turn_lock_held = registry.register(Histogram(
+    "voroojak_turn_lock_held_seconds",
+    "Time a turn held the user's turn lock.",
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 20, 30, 60),
+))
+telegram_errors = registry.register(Counter(
+    "voroojak_telegram_errors_total",
+    "Bot API calls that failed (HTTP error or transport error).",
+    ("method",),
+))
+telegram_fallbacks = registry.register(Counter(
+    "voroojak_telegram_html_fallbacks_total",
+    "Replies resent as plain text after the HTML version was rejected.",
+))
+
+
+# DB round trips are tallied per update through a mutable holder, so calls
+# made from worker threads (which run in a copied context) still count.
+_update_db_calls: ContextVar[list[int] | None] = ContextVar("update_db_calls", default=None)
+
+
+def count_db_request(request) -> None:
+    """httpx request hook for the Supabase client."""
+    db_requests.inc(method=request.method)
+    calls = _update_db_calls.get()
+    if calls is not None:
+        calls[0] += 1
+
+
+@contextmanager
+def observe_update() -> Iterator[None]:
+    """Record handling time and DB round trips for the update in this block."""
+    calls = [0]
+    token = _update_db_calls.set(calls)
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        _update_db_calls.reset(token)
+        webhook_duration.observe(time.perf_counter() - started, outcome=outcome)
+        db_round_trips.observe(calls[0])
@@ -0,0 +1,281 @@
+"""Non-interactive requests answered through the OpenAI Batch API.
+
+`/later <question>` queues a request instead of calling the model. A
+scheduled job (`run_batch_jobs`, behind /api/cron/batches) then:
+
+1. collects the results of submitted batches: one status call per open
+   batch, and one download of its output and error files once it is done;
+2. sends finished answers (or failures) to their users and saves the turns;
+3. submits everything still queued as a single JSONL batch.
+
+Batch requests cost half the price of interactive ones, are answered within
+24 hours and count against a separate rate limit, so they take no capacity
+from the scheduler that interactive turns share.
+
+Run from a scheduler or by hand:
+    python -m src.services.batch_service
+"""
+
+import asyncio
+import json
+
+from openai import AsyncOpenAI
+from openai.types.responses import Response
+from telegram import Bot
+
+from src import metrics
+from src.config import settings
+from src.db import (
+    claim_batch_requests,
+    count_open_batch_requests,
+    finish_batch_request,
+    get_batch_requests,
+    get_submitted_batch_ids,
+    get_undelivered_batch_requests,
+    mark_batch_delivered,
+    mark_batch_submitted,
+    queue_batch_request,
+    release_batch_requests,
+    save_turn,
+)
+from src.db.models import BatchRequest
+from src.db.records import HistoryRecord, SettingsRecord
+from src.llm.backends.base import GenerationResult
+from src.llm.backends.responses import ResponsesBackend
+from src.llm.engine import engine
+from src.services.usage import usage_ledger
+from src.tracing import current_span, span, traced
+from src.utils import markdown_to_telegram_html
+
+client = AsyncOpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url)
+
+BATCH_ENDPOINT = "/v1/responses"
+# Batch statuses after which the batch's files no longer change
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# Answers are sent as one message when they fit (Telegram's limit is 4096)
+MAX_MESSAGE_CHARS = 4000
+
+
+class TooManyOpenRequestsError(Exception):
+    """The user already has BATCH_MAX_OPEN_PER_USER requests waiting."""
+
+
+def _custom_id(request_id: int) -> str:
+    return f"request-{request_id}"
+
+
+def _request_id(custom_id: str) -> int | None:
+    prefix, _, number = custom_id.partition("-")
+    return int(number) if prefix == "request" and number.isdigit() else None
+
+
+def queue_request(
+    user_id: int,
+    chat_id: int,
+    message_id: int,
+    question: str,
+    history: HistoryRecord,
+    user_settings: SettingsRecord,
+    session_id: int,
+) -> bool:
+    """Queue a question for the next batch (blocking: database calls).
+
+    The prompt is built now, from the history as it is when the question is
+    asked; the answer joins the conversation when it is delivered.
+
+    Returns:
+        False if the message was already queued (a Telegram retry).
+
+    Raises:
+        TooManyOpenRequestsError: If the user has too many requests waiting.
+    """
+    if count_open_batch_requests(user_id) >= settings.batch_max_open_per_user:
+        raise TooManyOpenRequestsError(f"User {user_id} has too many requests waiting")
+    queued = queue_batch_request(
+        BatchRequest(
+            user_id=user_id,
+            chat_id=chat_id,
+            message_id=message_id,
+            session_id=session_id,
+            prompt=question,
+            model=user_settings.selected_model,
+            body=engine.batch_request_body(history, question, user_settings),
+        )
+    )
+    if queued:
+        metrics.batch_requests.inc(event="queued")
+    return queued
+
+
+@traced("batch.submit")
+async def submit_queued() -> int:
+    """Submit queued requests as one batch; returns how many were submitted."""
+    requests = await asyncio.to_thread(
+        claim_batch_requests, settings.batch_max_requests, settings.batch_claim_timeout_seconds
+    )
+    if not requests:
+        return 0
+    ids = [request.id for request in requests]
+    lines = [
+        json.dumps({
+            "custom_id": _custom_id(request.id),
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": request.body,
+        })
+        for request in requests
+    ]
+    try:
+        upload = await client.files.create(
+            file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
+        )
+        batch = await client.batches.create(
+            input_file_id=upload.id, endpoint=BATCH_ENDPOINT, completion_window="24h"
+        )
+    except Exception:
+        # Back to the queue for the next run
+        await asyncio.to_thread(release_batch_requests, ids)
+        raise
+    await asyncio.to_thread(mark_batch_submitted, ids, batch.id)
+    current_span().set_attributes(batch_id=batch.id, requests=len(ids))
+    metrics.batch_requests.inc(len(ids), event="submitted")
+    print(f"Submitted batch {batch.id} with {len(ids)} requests")
+    return len(ids)
+
+
+async def _read_lines(file_id: str | None) -> list[dict]:
+    if not file_id:
+        return []
+    content = await client.files.content(file_id)
+    return [json.loads(line) for line in content.text.splitlines() if line.strip()]
+
+
+def _finish(request: BatchRequest, line: dict | None, batch_status: str) -> GenerationResult | None:
+    """Store the outcome of one request from its output/error line (blocking).
+
+    Returns:
+        The answer, or None if the request failed.
+    """
+    response = (line or {}).get("response") or {}
+    if response.get("status_code") == 200:
+        # Built without validation, like the client's own responses
+        body = Response.construct(**response["body"])
+        result = ResponsesBackend.parse_response(body, request.model)
+        finish_batch_request(
+            request.id,
+            response=result.text,
+            input_tokens=result.input_tokens,
+            cached_tokens=result.cached_tokens,
+            output_tokens=result.output_tokens,
+        )
+        metrics.batch_requests.inc(event="completed")
+        return result
+
+    if line is None:
+        error = f"batch {batch_status} before this request was answered"
+    else:
+        error = (
+            (line.get("error") or {}).get("message")
+            or ((response.get("body") or {}).get("error") or {}).get("message")
+            or f"HTTP {response.get('status_code')}"
+        )
+    finish_batch_request(request.id, error=error)
+    metrics.batch_requests.inc(event="failed")
+    return None
+
+
+@traced("batch.collect")
+async def collect_results() -> int:
+    """Store the outcomes of finished batches; returns how many requests finished."""
+    finished = 0
+    for batch_id in await asyncio.to_thread(get_submitted_batch_ids):
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status not in FINAL_STATUSES:
+            continue
+        lines: dict[int, dict] = {}
+        for line in await _read_lines(batch.output_file_id) + await _read_lines(batch.error_file_id):
+            request_id = _request_id(line.get("custom_id", ""))
+            if request_id is not None:
+                lines[request_id] = line
+        requests = await asyncio.to_thread(get_batch_requests, batch_id)
+        for request in requests:
+            result = await asyncio.to_thread(_finish, request, lines.get(request.id), batch.status)
+            if result is not None:
+                usage_ledger.record(request.user_id, result)
+        finished += len(requests)
+        print(f"Batch {batch_id} {batch.status}: {len(requests)} requests finished")
+    return finished
+
+
+async def _send(bot: Bot, request: BatchRequest, text: str) -> None:
+    """Reply to the /later message, as HTML when it fits, else as plain text chunks."""
+    html = markdown_to_telegram_html(text)
+    if len(html) <= MAX_MESSAGE_CHARS:
+        try:
+            await bot.send_message(
+                request.chat_id, html, parse_mode="HTML", reply_to_message_id=request.message_id
+            )
+            return
+        except Exception as e:
+            print(f"HTML send failed: {e}")
+            metrics.telegram_fallbacks.inc()
+    for start in range(0, len(text), MAX_MESSAGE_CHARS):
+        await bot.send_message(
+            request.chat_id, text[start:start + MAX_MESSAGE_CHARS], reply_to_message_id=request.message_id
+        )
+
+
+@traced("batch.deliver")
+async def deliver_results(bot: Bot) -> int:
+    """Send finished requests to their users; returns how many were delivered.
+
+    A request whose message could not be sent is retried by the next run.
+    """
+    delivered = 0
+    for request in await asyncio.to_thread(get_undelivered_batch_requests):
+        try:
+            if request.status == "completed":
+                # Already saved if an earlier delivery attempt failed after saving
+                await asyncio.to_thread(
+                    save_turn,
+                    request.user_id,
+                    f"[🕓 Later] {request.prompt}",
+                    request.response,
+                    message_id=request.message_id,
+                    session_id=request.session_id,
+                )
+                await _send(bot, request, request.response)
+            else:
+                await bot.send_message(
+                    request.chat_id,
+                    f"❌ Couldn't answer your /later question: {request.error}",
+                    reply_to_message_id=request.message_id,
+                )
+            await asyncio.to_thread(mark_batch_delivered, request.id)
+        except Exception as e:
+            print(f"Batch delivery failed for request {request.id}: {e}")
+            continue
+        metrics.batch_requests.inc(event="delivered")
+        delivered += 1
+    return delivered
+
+
+async def run_batch_jobs(bot: Bot) -> dict[str, int]:
+    """One run of the batch job: collect, deliver, then submit what is queued."""
+    with span("batch.run"):
+        finished = await collect_results()
+        delivered = await deliver_results(bot)
+        submitted = await submit_queued()
+        # The usage of collected answers must not wait for the next interactive turn
+        await asyncio.to_thread(usage_ledger.flush)
+    return {"finished": finished, "delivered": delivered, "submitted": submitted}
+
+
+async def _main() -> None:
+    bot = Bot(settings.telegram_token, base_url=settings.telegram_base_url)
+    async with bot:
+        print(await run_batch_jobs(bot))
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
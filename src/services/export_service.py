@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+from datetime import datetime
+from typing import Literal, TextIO
+
+from src.db import iter_chat_history
+from src.db.models import ChatMessage
+from src.tracing import current_span, traced
+
+ExportFormat = Literal["markdown", "jsonl"]
+
+# Everything except the image payloads: images are referenced, never loaded
+EXPORT_COLUMNS = "seq,role,content,message_id,session_id,created_at,image_count,user_id"
+EXPORT_PAGE_SIZE = 500
+
+
+def _image_reference(message: ChatMessage) -> str | None:
+    if not message.image_count:
+        return None
+    images = "image" if message.image_count == 1 else f"{message.image_count} images"
+    if message.message_id is not None:
+        return f"{images} attached to Telegram message {message.message_id}"
+    return f"{images} attached"
+
+
+def _write_markdown(out: TextIO, user_id: int, messages) -> int:
+    out.write(f"# Voroojak conversation export\n\nUser: {user_id}\n")
+    count = 0
+    session_id = None
+    for message in messages:
+        if message.session_id != session_id:
+            session_id = message.session_id
+            out.write(f"\n## Session {session_id}\n")
+        timestamp = message.created_at.strftime("%Y-%m-%d %H:%M") if message.created_at else ""
+        speaker = "You" if message.role == "user" else "Voroojak"
+        out.write(f"\n**{speaker}** · {timestamp}\n\n{message.content}\n")
+        image = _image_reference(message)
+        if image:
+            out.write(f"\n_[{image}]_\n")
+        count += 1
+    return count
+
+
+def _write_jsonl(out: TextIO, messages) -> int:
+    count = 0
+    for message in messages:
+        record = {
+            "seq": message.seq,
+            "session_id": message.session_id,
+            "role": message.role,
+            "content": message.content,
+            "created_at": message.created_at.isoformat() if message.created_at else None,
+            "image": _image_reference(message),
+        }
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+@traced("export.write")
+def write_export(user_id: int, fmt: ExportFormat = "markdown") -> tuple[str, int]:
+    """Write a user's full history to a temporary file, one keyset page at a time.
+
+    Archived messages are included, in their original order. Memory use is bounded by the page size regardless of history length. The
+    caller owns (and must delete) the returned file.
+
+    Returns:
+        (path, message_count)
+    """
+    suffix = ".md" if fmt == "markdown" else ".jsonl"
+    fd, path = tempfile.mkstemp(prefix=f"voroojak-{user_id}-", suffix=suffix)
+    messages = iter_chat_history(
+        user_id, page_size=EXPORT_PAGE_SIZE, columns=EXPORT_COLUMNS, include_archive=True
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as out:
+            if fmt == "markdown":
+                count = _write_markdown(out, user_id, messages)
+            else:
+                count = _write_jsonl(out, messages)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    current_span().set_attributes(messages=count, bytes=os.path.getsize(path))
+    return path, count
+
+
+def export_filename(fmt: ExportFormat) -> str:
+    extension = "md" if fmt == "markdown" else "jsonl"
+    return f"voroojak-history-{datetime.now().strftime('%Y%m%d')}.{extension}"
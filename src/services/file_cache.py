@@ -0,0 +1,183 @@
+"""Cache of Telegram file contents keyed by `file_unique_id`.
+
+`file_id` differs per bot and may change between messages, but
+`file_unique_id` is stable for the same file, so a photo that is re-sent,
+forwarded or left pending for the next message is fetched from Telegram
+(getFile + download) only once per cache lifetime.
+"""
+
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Protocol
+
+from telegram import Bot
+
+from src import metrics
+from src.config import settings
+from src.tracing import current_span, traced
+
+
+class FileCacheBackend(Protocol):
+    """Storage for downloaded files."""
+
+    def get(self, unique_id: str) -> bytes | None: ...
+
+    async def download(self, bot: Bot, file_id: str, unique_id: str) -> bytes: ...
+
+
+class InMemoryFileCache:
+    """Process-local LRU bounded by total bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+
+    def get(self, unique_id: str) -> bytes | None:
+        data = self._entries.get(unique_id)
+        if data is not None:
+            self._entries.move_to_end(unique_id)
+        return data
+
+    async def download(self, bot: Bot, file_id: str, unique_id: str) -> bytes:
+        file = await bot.get_file(file_id)
+        data = bytes(await file.download_as_bytearray())
+        self._put(unique_id, data)
+        return data
+
+    def _put(self, unique_id: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        if unique_id in self._entries:
+            self.size -= len(self._entries.pop(unique_id))
+        self._entries[unique_id] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class DiskFileCache:
+    """LRU of files in a local directory, bounded by total bytes.
+
+    Downloads stream straight to a temporary file that is renamed into place,
+    so a file is never held twice in memory and a crash never leaves a
+    partial entry. Recency is tracked in memory and seeded from file mtimes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, unique_id: str) -> str:
+        # file_unique_id is URL-safe base64; keep only safe characters regardless
+        name = "".join(c for c in unique_id if c.isalnum() or c in "-_")
+        return os.path.join(self.directory, name)
+
+    def _load_index(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self.size += size
+        self._evict()
+
+    def get(self, unique_id: str) -> bytes | None:
+        path = self._path(unique_id)
+        name = os.path.basename(path)
+        if name not in self._entries:
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.size -= self._entries.pop(name)
+            return None
+        self._entries.move_to_end(name)
+        return data
+
+    async def download(self, bot: Bot, file_id: str, unique_id: str) -> bytes:
+        path = self._path(unique_id)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".partial-")
+        os.close(fd)
+        try:
+            file = await bot.get_file(file_id)
+            await file.download_to_drive(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        name = os.path.basename(path)
+        if name in self._entries:
+            self.size -= self._entries.pop(name)
+        self._entries[name] = os.path.getsize(path)
+        self.size += self._entries[name]
+        self._evict()
+
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _evict(self) -> None:
+        while self._entries and self.size > self.max_bytes:
+            name, size = self._entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+
+class NoFileCache:
+    """Always downloads."""
+
+    def get(self, unique_id: str) -> bytes | None:
+        return None
+
+    async def download(self, bot: Bot, file_id: str, unique_id: str) -> bytes:
+        file = await bot.get_file(file_id)
+        return bytes(await file.download_as_bytearray())
+
+
+def build_file_cache(backend: str, directory: str, max_bytes: int) -> FileCacheBackend:
+    """Create the cache for the configured backend ('memory', 'disk' or 'none')."""
+    if backend == "disk":
+        return DiskFileCache(directory, max_bytes)
+    if backend == "none":
+        return NoFileCache()
+    return InMemoryFileCache(max_bytes)
+
+
+# Global Instance
+file_cache = build_file_cache(
+    settings.file_cache_backend, settings.file_cache_dir, settings.file_cache_max_bytes
+)
+
+
+@traced("files.fetch")
+async def fetch_file(bot: Bot, file_id: str, unique_id: str | None = None) -> bytes:
+    """File contents, from the cache when `unique_id` has been seen before.
+
+    A hit skips both the getFile call and the download.
+    """
+    if unique_id:
+        data = file_cache.get(unique_id)
+        metrics.file_cache_lookups.inc(result="hit" if data is not None else "miss")
+        if data is not None:
+            current_span().set_attributes(cache_hit=True, bytes=len(data))
+            return data
+        data = await file_cache.download(bot, file_id, unique_id)
+    else:
+        data = await NoFileCache().download(bot, file_id, "")
+
+    current_span().set_attributes(cache_hit=False, bytes=len(data))
+    return data
@@ -1,15 +1,18 @@
 from openai import AsyncOpenAI
 from src.config import settings
+from src.tracing import current_span, traced
 
-client = AsyncOpenAI(api_key=settings.openai_api_key)
+client = AsyncOpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url)
 
 
+@traced("files.create_vector_store")
 async def create_vector_store_from_file(file_bytes: bytes, filename: str) -> str:
     """Uploads a file and creates a vector store containing it.
 
     Returns:
         vector_store_id (str)
     """
+    current_span().set_attribute("file_bytes", len(file_bytes))
 
     # 1. Upload File
     file_obj = await client.files.create(file=(filename, file_bytes), purpose="assistants")
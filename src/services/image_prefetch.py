@@ -0,0 +1,73 @@
+"""Pending images prepared ahead of the follow-up message.
+
+A photo sent without a caption is only used with the user's next text
+message. Downloading and encoding it right away, in the background, takes
+that I/O off the follow-up turn: the payload is waiting here, keyed by user.
+
+Entries live in process memory for a short TTL. A follow-up handled by
+another instance, or after the entry expired, downloads the image as usual.
+"""
+
+import asyncio
+import contextvars
+import time
+from collections.abc import Awaitable, Callable, Hashable
+
+from src import metrics
+from src.config import settings
+
+
+class PendingImageCache:
+    """Per-user background preparation of pending image payloads."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        # user_id -> (key of the pending image(s), expiry, preparation task)
+        self._entries: dict[int, tuple[Hashable, float, asyncio.Task]] = {}
+
+    def prepare(self, user_id: int, key: Hashable, load: Callable[[], Awaitable[list[str]]]) -> None:
+        """Start preparing the user's pending image(s), replacing any earlier ones.
+
+        `key` identifies the pending image(s); `take` only returns the payload
+        for the same key.
+        """
+        self._sweep()
+        self.discard(user_id)
+        # Run outside the current update's context: its spans and deadline end
+        # when the update's response is sent, before this work does
+        task = contextvars.Context().run(asyncio.create_task, load())
+        # Failures surface as a miss in `take`; don't log them as unretrieved
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._entries[user_id] = (key, time.monotonic() + self.ttl, task)
+
+    async def take(self, user_id: int, key: Hashable) -> list[str] | None:
+        """The prepared payload for `key` (waiting for it if still in progress), or None."""
+        entry = self._entries.pop(user_id, None)
+        if entry is None or entry[0] != key or entry[1] < time.monotonic():
+            if entry is not None:
+                entry[2].cancel()
+            metrics.image_prefetch_lookups.inc(result="miss")
+            return None
+        try:
+            images = await entry[2]
+        except Exception as e:
+            print(f"Pending image preparation failed for user {user_id}: {e}")
+            metrics.image_prefetch_lookups.inc(result="error")
+            return None
+        metrics.image_prefetch_lookups.inc(result="hit")
+        return images
+
+    def discard(self, user_id: int) -> None:
+        """Drop the user's prepared image(s), e.g. when the pending image is replaced."""
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            entry[2].cancel()
+
+    def _sweep(self) -> None:
+        now = time.monotonic()
+        for user_id in [uid for uid, (_, expires, _) in self._entries.items() if expires < now]:
+            self.discard(user_id)
+
+
+# Global Instance
+pending_images = PendingImageCache(ttl=settings.pending_image_prefetch_ttl_seconds)
@@ -1,20 +1,19 @@
+from collections.abc import Sequence
 
-from src.db.models import ChatHistory, UserSettings
+from src.db.records import HistoryRecord, SettingsRecord
 from src.llm.engine import engine
-
-# Re-export constants for compatibility if needed, though they are now in engine
-REASONING_MODELS = {"gpt-5.2-chat-latest", "gpt-5-mini"}
-WEB_SEARCH_MODELS = {"gpt-5.2-chat-latest", "gpt-5-mini", "gpt-4.1"}
+from src.services.usage import usage_ledger
 
 # Provide direct access to the client object for rare cases where raw access is needed
 client = engine.client 
 
-def generate_response(
-    history: ChatHistory,
+async def generate_response(
+    history: HistoryRecord,
     user_message: str,
-    user_settings: UserSettings,
+    user_settings: SettingsRecord,
     image_base64: str | None = None,
     vector_store_id: str | None = None,
+    extra_images: Sequence[str] = (),
 ) -> str:
     """Generate a response using the centralized LLM Engine.
     
@@ -24,14 +23,33 @@ def generate_response(
         user_settings: User's model and reasoning preferences.
         image_base64: Optional base64-encoded image data.
         vector_store_id: Optional vector store for file search.
+        extra_images: Further base64 images of an album, after `image_base64`.
         
     Returns:
         Generated response text.
+
+    Raises:
+        AllRoutesFailedError: If no model in the fallback chain could answer.
+        GenerationCancelledError: If the generation was superseded (see `cancel_generation`).
     """
-    return engine.generate_response(
+    result = await engine.generate_response(
         history=history,
         user_message=user_message,
         user_settings=user_settings,
         image_base64=image_base64,
-        vector_store_id=vector_store_id
+        vector_store_id=vector_store_id,
+        extra_images=extra_images,
     )
+    # Answers from the response cache cost nothing
+    if result.api != "cache":
+        usage_ledger.record(user_settings.user_id, result)
+    return result.text
+
+
+def cancel_generation(user_id: int, reason: str) -> int:
+    """Abort the user's in-flight generations, e.g. when a new message supersedes them.
+    
+    Returns:
+        Number of generations cancelled.
+    """
+    return engine.cancel_generations(user_id, reason)
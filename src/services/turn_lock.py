@@ -0,0 +1,150 @@
+"""Per-user turn lock shared by all instances.
+
+On a serverless host the updates of one user (a photo and a message sent
+together, a Telegram retry) can be handled by different instances at once.
+A turn takes the user's lease in `user_turn_locks` right before reading its
+context and gives it back as soon as its answer is saved, so turns of the
+same user see each other's history; sending the reply, downloads and the
+reads that do not depend on history happen outside the lock. Other users
+are never affected.
+
+The lock favours availability: if the database cannot be reached, or the
+previous turn holds the lease for longer than `wait_seconds`, the turn runs
+without it (and the wait metric records why).
+"""
+
+import asyncio
+import time
+import uuid
+
+from src import metrics
+from src.config import settings
+from src.db import acquire_turn_lock, release_turn_lock
+from src.tracing import current_span, traced
+
+
+class TurnLease:
+    """One turn's claim on its user's lock. `release` is safe to call more than once.
+
+    Once `acquire` has started, `release` always deletes this holder's row,
+    even if the turn failed or was cancelled while the lock was being taken:
+    an acquire call already sent to the database may still succeed.
+    """
+
+    __slots__ = ("locks", "user_id", "holder", "acquired_at", "attempted", "pending")
+
+    def __init__(self, locks: "TurnLocks", user_id: int):
+        self.locks = locks
+        self.user_id = user_id
+        self.holder = uuid.uuid4().hex
+        # Monotonic time the lease was taken; None while not held
+        self.acquired_at: float | None = None
+        # Set before the first database call; cleared by `release`
+        self.attempted = False
+        # The acquire call in flight, shielded from the turn's cancellation
+        self.pending: asyncio.Future | None = None
+
+    @property
+    def held(self) -> bool:
+        return self.acquired_at is not None
+
+    async def acquire(self) -> bool:
+        """Wait for the lock; returns False if the turn goes ahead without it."""
+        self.acquired_at = await self.locks._acquire(self)
+        return self.held
+
+    async def release(self) -> None:
+        if not self.attempted:
+            return
+        self.attempted = False
+        if self.pending is not None:
+            # Let an interrupted acquire land first, so the delete below removes its row
+            await asyncio.gather(self.pending, return_exceptions=True)
+            self.pending = None
+        if self.acquired_at is not None:
+            metrics.turn_lock_held.observe(time.monotonic() - self.acquired_at)
+            self.acquired_at = None
+        await self.locks._release(self.user_id, self.holder)
+
+
+class TurnLocks:
+    """Leases on user_turn_locks, polled with backoff.
+
+    Waiters in this process are woken as soon as a lease of the same user is
+    released here, instead of at their next poll.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        ttl_seconds: int,
+        wait_seconds: float,
+        poll_interval: float = 0.05,
+        max_poll_interval: float = 0.5,
+    ):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.wait_seconds = wait_seconds
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self._released: dict[int, asyncio.Event] = {}
+
+    def lease(self, user_id: int) -> TurnLease:
+        return TurnLease(self, user_id)
+
+    @traced("turn_lock.acquire")
+    async def _acquire(self, lease: TurnLease) -> float | None:
+        if not self.enabled:
+            return None
+        user_id = lease.user_id
+        lease.attempted = True
+        started = time.monotonic()
+        delay = self.poll_interval
+        attempts = 0
+        while True:
+            attempts += 1
+            lease.pending = asyncio.ensure_future(
+                asyncio.to_thread(acquire_turn_lock, user_id, lease.holder, self.ttl_seconds)
+            )
+            try:
+                taken = await asyncio.shield(lease.pending)
+            except Exception as e:
+                lease.pending = None
+                print(f"Turn lock unavailable for user {user_id}, continuing without it: {e}")
+                return self._waited(started, attempts, "error")
+            lease.pending = None
+            if taken:
+                self._waited(started, attempts, "acquired")
+                return time.monotonic()
+            if time.monotonic() - started + delay > self.wait_seconds:
+                print(f"Turn lock of user {user_id} still held after {self.wait_seconds}s, continuing")
+                return self._waited(started, attempts, "timeout")
+            released = self._released.setdefault(user_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(released.wait(), delay)
+            except asyncio.TimeoutError:
+                delay = min(delay * 2, self.max_poll_interval)
+
+    @staticmethod
+    def _waited(started: float, attempts: int, outcome: str) -> None:
+        waited = time.monotonic() - started
+        metrics.turn_lock_wait.observe(waited, outcome=outcome)
+        current_span().set_attributes(outcome=outcome, attempts=attempts)
+
+    async def _release(self, user_id: int, holder: str) -> None:
+        try:
+            await asyncio.to_thread(release_turn_lock, user_id, holder)
+        except Exception as e:
+            # The lease runs out after ttl_seconds
+            print(f"Releasing the turn lock of user {user_id} failed: {e}")
+        released = self._released.pop(user_id, None)
+        if released is not None:
+            released.set()
+
+
+# Global Instance
+turn_locks = TurnLocks(
+    enabled=settings.turn_lock_enabled,
+    ttl_seconds=settings.turn_lock_ttl_seconds,
+    wait_seconds=settings.turn_lock_wait_seconds,
+)
@@ -0,0 +1,302 @@
+"""Token usage accounting and per-user daily quotas.
+
+Every model call is recorded in `usage_ledger`. Records are buffered in
+memory and written in batches by a background flush, once `batch_size` rows
+are buffered or `flush_interval` seconds after the oldest unwritten one, so
+the turn never waits for the ledger. Quotas are checked against an in-memory count of the user's
+usage today, refreshed from the ledger every `reconcile_seconds` (which also
+picks up usage recorded by other instances). The serverless webhook calls
+`drain` before answering, since the instance may not run again afterwards.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from src.config import settings
+from src.db import get_usage_summary, insert_usage
+from src.db.models import UsageSummary
+from src.llm.backends.base import GenerationResult
+from src.llm.registry import registry
+
+# Rows kept in memory when the ledger cannot be written; older ones are dropped
+MAX_BUFFERED_ROWS = 10_000
+
+
+class QuotaExceededError(Exception):
+    """The user has used up a daily quota."""
+
+    def __init__(self, user_id: int, kind: str, used: int, limit: int):
+        super().__init__(f"User {user_id} reached the daily {kind} quota ({used}/{limit})")
+        self.user_id = user_id
+        self.kind = kind
+        self.used = used
+        self.limit = limit
+
+
+@dataclass(slots=True)
+class _DailyUsage:
+    day: str
+    tokens: int = 0
+    requests: int = 0
+    reconciled_at: float = 0.0
+
+
+def _today() -> tuple[str, datetime]:
+    now = datetime.now(timezone.utc)
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start.date().isoformat(), start
+
+
+class UsageLedger:
+    """Buffered writer for usage_ledger with in-memory daily totals per user."""
+
+    def __init__(
+        self,
+        batch_size: int,
+        flush_interval: float,
+        daily_tokens: int = 0,
+        daily_requests: int = 0,
+        reconcile_seconds: float = 300.0,
+        exempt_user_ids: list[int] | None = None,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.daily_tokens = daily_tokens
+        self.daily_requests = daily_requests
+        self.reconcile_seconds = reconcile_seconds
+        self.exempt_user_ids = set(exempt_user_ids or [])
+        self._buffer: list[dict] = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flush_task: asyncio.Task | None = None
+        self._flush_timer: asyncio.TimerHandle | None = None
+        self._daily: dict[int, _DailyUsage] = {}
+
+    @property
+    def quotas_enabled(self) -> bool:
+        return bool(self.daily_tokens or self.daily_requests)
+
+    def record(self, user_id: int, result: GenerationResult) -> None:
+        """Record one model call; the row is written by a later batch flush."""
+        row = {
+            "user_id": user_id,
+            "model": result.model,
+            "input_tokens": result.input_tokens,
+            "cached_tokens": result.cached_tokens,
+            "output_tokens": result.output_tokens,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with self._lock:
+            self._buffer.append(row)
+            due = (
+                len(self._buffer) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+            usage = self._usage_today(user_id)
+            usage.tokens += result.input_tokens + result.output_tokens
+            usage.requests += 1
+        if due:
+            self._schedule_flush()
+        elif self._flush_timer is None:
+            # Written even if no further call comes to trigger the flush
+            self._arm_timer()
+
+    def _arm_timer(self) -> None:
+        self._flush_timer = asyncio.get_running_loop().call_later(
+            self.flush_interval, self._schedule_flush, context=contextvars.Context()
+        )
+
+    def _schedule_flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._flush_task is not None and not self._flush_task.done():
+            # Rows added after the running flush took the buffer wait for the next one
+            self._arm_timer()
+            return
+        # Not part of the update that triggered it (spans, deadline, DB round trips)
+        self._flush_task = contextvars.Context().run(
+            asyncio.create_task, asyncio.to_thread(self.flush)
+        )
+
+    def flush(self) -> int:
+        """Write all buffered rows now (blocking); returns how many were written.
+
+        On failure the rows are kept for the next flush.
+        """
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        if not rows:
+            return 0
+        try:
+            insert_usage(rows)
+        except Exception as e:
+            print(f"Usage flush failed ({len(rows)} rows kept): {e}")
+            with self._lock:
+                self._buffer[:0] = rows
+                del self._buffer[:-MAX_BUFFERED_ROWS]
+            return 0
+        return len(rows)
+
+    async def drain(self) -> None:
+        """Write everything recorded so far before returning.
+
+        For serverless hosts, which may freeze the instance as soon as the
+        response is sent, before a background flush runs or finishes.
+        """
+        if self._flush_task is not None and not self._flush_task.done():
+            await asyncio.wait([self._flush_task])
+        if self.pending():
+            await asyncio.to_thread(self.flush)
+        if not self.pending() and self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    def pending(self) -> int:
+        """Rows recorded but not written yet."""
+        return len(self._buffer)
+
+    async def check_quota(self, user_id: int) -> None:
+        """Raise QuotaExceededError if the user has used up a daily quota."""
+        if not self.quotas_enabled or user_id in self.exempt_user_ids:
+            return
+        usage = self._usage_today(user_id)
+        if time.monotonic() - usage.reconciled_at >= self.reconcile_seconds:
+            await asyncio.to_thread(self._reconcile, user_id)
+            usage = self._usage_today(user_id)
+        if self.daily_tokens and usage.tokens >= self.daily_tokens:
+            raise QuotaExceededError(user_id, "token", usage.tokens, self.daily_tokens)
+        if self.daily_requests and usage.requests >= self.daily_requests:
+            raise QuotaExceededError(user_id, "request", usage.requests, self.daily_requests)
+
+    def usage_today(self, user_id: int) -> tuple[int, int]:
+        """(tokens, requests) of the user today, as known to this instance."""
+        usage = self._usage_today(user_id)
+        return usage.tokens, usage.requests
+
+    def _usage_today(self, user_id: int) -> _DailyUsage:
+        day, _ = _today()
+        usage = self._daily.get(user_id)
+        if usage is None or usage.day != day:
+            usage = self._daily[user_id] = _DailyUsage(day=day)
+        return usage
+
+    def _reconcile(self, user_id: int) -> None:
+        """Reset the user's daily totals to the ledger plus rows not written yet."""
+        day, start = _today()
+        summary = get_usage_summary(start, user_id)
+        with self._lock:
+            unwritten = [row for row in self._buffer if row["user_id"] == user_id]
+            self._daily[user_id] = _DailyUsage(
+                day=day,
+                tokens=sum(s.total_tokens for s in summary)
+                + sum(row["input_tokens"] + row["output_tokens"] for row in unwritten),
+                requests=sum(s.requests for s in summary) + len(unwritten),
+                reconciled_at=time.monotonic(),
+            )
+
+
+def _tokens(count: int) -> str:
+    return f"{count / 1000:.1f}k" if count >= 1000 else str(count)
+
+
+def _cost(rows: list[UsageSummary]) -> float:
+    """Estimated USD cost at interactive list prices (unpriced models count as 0)."""
+    return sum(
+        registry.get(r.model).cost(r.input_tokens, r.cached_tokens, r.output_tokens) for r in rows
+    )
+
+
+def _usd(amount: float) -> str:
+    return f"${amount:.2f}" if amount >= 0.01 else f"${amount:.4f}"
+
+
+def _by_model(summary: list[UsageSummary]) -> list[str]:
+    return [
+        f"• <code>{s.model}</code>: {s.requests} req, {_tokens(s.input_tokens)} in "
+        f"({_tokens(s.cached_tokens)} cached), {_tokens(s.output_tokens)} out, ≈{_usd(_cost([s]))}"
+        for s in summary
+    ]
+
+
+def user_report(user_id: int, days: int = 30) -> str:
+    """Telegram HTML summary of one user's usage today and over `days` days.
+
+    Blocking (database reads); unwritten records of this instance are flushed first.
+    """
+    usage_ledger.flush()
+    _, today_start = _today()
+    today = get_usage_summary(today_start, user_id)
+    period = get_usage_summary(today_start - timedelta(days=days - 1), user_id)
+
+    lines = ["📊 <b>Your usage</b>", "", "<b>Today (UTC)</b>"]
+    lines += _by_model(today) or ["• No requests yet"]
+    if usage_ledger.quotas_enabled and user_id not in usage_ledger.exempt_user_ids:
+        tokens = sum(s.total_tokens for s in today)
+        requests = sum(s.requests for s in today)
+        if usage_ledger.daily_tokens:
+            lines.append(f"Tokens: {_tokens(tokens)} of {_tokens(usage_ledger.daily_tokens)}")
+        if usage_ledger.daily_requests:
+            lines.append(f"Requests: {requests} of {usage_ledger.daily_requests}")
+    lines += ["", f"<b>Last {days} days</b>"]
+    lines += _by_model(period) or ["• No requests yet"]
+    return "\n".join(lines)
+
+
+def admin_report(days: int = 7, top: int = 20) -> str:
+    """Telegram HTML report of all users' usage over `days` days, heaviest first.
+
+    Blocking (database reads); unwritten records of this instance are flushed first.
+    """
+    usage_ledger.flush()
+    _, today_start = _today()
+    summary = get_usage_summary(today_start - timedelta(days=days - 1))
+
+    per_user: dict[int, list[UsageSummary]] = defaultdict(list)
+    per_model: dict[str, list[UsageSummary]] = defaultdict(list)
+    for s in summary:
+        per_user[s.user_id].append(s)
+        per_model[s.model].append(s)
+
+    def totals(rows: list[UsageSummary]) -> tuple[int, int]:
+        return sum(r.total_tokens for r in rows), sum(r.requests for r in rows)
+
+    tokens, requests = totals(summary)
+    lines = [
+        f"📊 <b>Usage, last {days} days</b>",
+        f"{requests} requests, {_tokens(tokens)} tokens, ≈{_usd(_cost(summary))}, {len(per_user)} users",
+        "",
+        "<b>By model</b>",
+    ]
+    for model, rows in sorted(per_model.items(), key=lambda item: -totals(item[1])[0]):
+        model_tokens, model_requests = totals(rows)
+        lines.append(
+            f"• <code>{model}</code>: {model_requests} req, {_tokens(model_tokens)} tokens, "
+            f"≈{_usd(_cost(rows))}"
+        )
+    lines += ["", "<b>Top users</b>"]
+    ranked = sorted(per_user.items(), key=lambda item: -totals(item[1])[0])[:top]
+    for uid, rows in ranked:
+        user_tokens, user_requests = totals(rows)
+        lines.append(
+            f"• <code>{uid}</code>: {user_requests} req, {_tokens(user_tokens)} tokens, "
+            f"≈{_usd(_cost(rows))}"
+        )
+    return "\n".join(lines)
+
+
+# Global Instance
+usage_ledger = UsageLedger(
+    batch_size=settings.usage_flush_batch_size,
+    flush_interval=settings.usage_flush_interval_seconds,
+    daily_tokens=settings.usage_daily_token_quota,
+    daily_requests=settings.usage_daily_request_quota,
+    reconcile_seconds=settings.usage_reconcile_seconds,
+    exempt_user_ids=settings.admin_user_ids,
+)
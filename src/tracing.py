@@ -0,0 +1,241 @@
+"""Lightweight tracing for the update pipeline.
+
+Spans are opened with `span(...)` or the `@traced(...)` decorator and handed to
+the configured exporters when they finish. With no exporter configured every
+entry point short-circuits to a shared no-op span, so instrumentation can stay
+in hot paths permanently.
+"""
+
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Protocol, TextIO
+
+
+class Span:
+    """A timed operation with attributes, linked to its parent."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "_start_perf", "duration", "attributes", "error")
+
+    recording = True
+
+    def __init__(self, name: str, parent: "Span | None", attributes: dict[str, Any]):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self._start_perf = time.perf_counter()
+        self.duration = 0.0
+        self.attributes = attributes
+        self.error: str | None = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self._start_perf
+        self.end_ns = self.start_ns + int(self.duration * 1e9)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Stand-in returned when tracing is disabled."""
+
+    recording = False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, **attributes: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+_NOOP_CONTEXT = nullcontext(NOOP_SPAN)
+
+
+class SpanExporter(Protocol):
+    """Receives spans as they start and finish."""
+
+    def on_start(self, span: Span) -> None: ...
+
+    def on_end(self, span: Span) -> None: ...
+
+
+class JsonExporter:
+    """Writes each finished span as one JSON line (stdout by default)."""
+
+    def __init__(self, stream: TextIO | None = None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    @classmethod
+    def to_file(cls, path: str) -> "JsonExporter":
+        return cls(open(path, "a", encoding="utf-8", buffering=1))
+
+    def on_start(self, span: Span) -> None:
+        pass
+
+    def on_end(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+
+
+class OpenTelemetryExporter:
+    """Mirrors spans into the OpenTelemetry API.
+
+    Requires `opentelemetry-api`; spans reach a backend only if an SDK and
+    exporter (e.g. OTLP) are configured in the process.
+    """
+
+    def __init__(self, instrumentation_name: str = "voroojak"):
+        from opentelemetry import trace
+
+        self._trace = trace
+        self._tracer = trace.get_tracer(instrumentation_name)
+        self._live: dict[str, Any] = {}
+
+    def on_start(self, span: Span) -> None:
+        parent = self._live.get(span.parent_id) if span.parent_id else None
+        context = self._trace.set_span_in_context(parent) if parent is not None else None
+        self._live[span.span_id] = self._tracer.start_span(
+            span.name, context=context, start_time=span.start_ns
+        )
+
+    def on_end(self, span: Span) -> None:
+        otel_span = self._live.pop(span.span_id, None)
+        if otel_span is None:
+            return
+        for key, value in span.attributes.items():
+            if value is not None:
+                otel_span.set_attribute(key, value if isinstance(value, (bool, int, float, str)) else str(value))
+        if span.error:
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=span.end_ns)
+
+
+class Tracer:
+    """Creates spans and fans them out to exporters."""
+
+    def __init__(self):
+        self.exporters: list[SpanExporter] = []
+        self.enabled = False
+        self._current: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+    def add_exporter(self, exporter: SpanExporter) -> None:
+        self.exporters.append(exporter)
+        self.enabled = True
+
+    def clear_exporters(self) -> None:
+        self.exporters = []
+        self.enabled = False
+
+    def current_span(self) -> "Span | _NoopSpan":
+        if not self.enabled:
+            return NOOP_SPAN
+        return self._current.get() or NOOP_SPAN
+
+    def span(self, name: str, **attributes: Any) -> AbstractContextManager["Span | _NoopSpan"]:
+        if not self.enabled:
+            return _NOOP_CONTEXT
+        return self._span(name, attributes)
+
+    @contextmanager
+    def _span(self, name: str, attributes: dict[str, Any]) -> Iterator[Span]:
+        span = Span(name, self._current.get(), attributes)
+        for exporter in self.exporters:
+            exporter.on_start(span)
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self._current.reset(token)
+            span.finish()
+            for exporter in self.exporters:
+                try:
+                    exporter.on_end(span)
+                except Exception as e:
+                    print(f"Span export failed: {e}")
+
+
+# Global tracer
+tracer = Tracer()
+
+
+def span(name: str, **attributes: Any):
+    """Open a span on the global tracer (no-op when tracing is disabled)."""
+    return tracer.span(name, **attributes)
+
+
+def current_span() -> "Span | _NoopSpan":
+    """The innermost active span, or a no-op span."""
+    return tracer.current_span()
+
+
+def traced(name: str) -> Callable:
+    """Decorator wrapping a sync or async function in a span named `name`."""
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return await func(*args, **kwargs)
+                with tracer.span(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def configure_tracing(exporters: list[str], json_path: str | None = None) -> None:
+    """Register exporters by name ("json", "otel") on the global tracer."""
+    tracer.clear_exporters()
+    for name in exporters:
+        if name == "json":
+            tracer.add_exporter(JsonExporter.to_file(json_path) if json_path else JsonExporter())
+        elif name == "otel":
+            try:
+                tracer.add_exporter(OpenTelemetryExporter())
+            except ImportError:
+                print("Tracing exporter 'otel' needs opentelemetry-api; skipping")
+        else:
+            print(f"Unknown tracing exporter: {name}")
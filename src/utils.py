@@ -1,6 +1,9 @@
 import markdown
 import re
 
+from src.tracing import traced
+
+@traced("format.markdown_to_html")
 def markdown_to_telegram_html(text: str) -> str:
     """
     Convert standard Markdown text to Telegram-supported HTML.
@@ -0,0 +1,11 @@
+import os
+
+# src.config reads these at import time; the tests never reach the services
+for name, value in {
+    "TELEGRAM_TOKEN": "123456:TEST",
+    "WEBHOOK_URL": "http://localhost/api/webhook",
+    "OPENAI_API_KEY": "sk-test",
+    "SUPABASE_URL": "http://localhost:54321",
+    "SUPABASE_KEY": "test-key",
+}.items():
+    os.environ.setdefault(name, value)
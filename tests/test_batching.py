@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+from src.bot.batching import KeyedBatcher
+
+
+async def test_leader_collects_the_group():
+    batcher: KeyedBatcher[int] = KeyedBatcher(window=0.05, max_wait=1.0)
+    leader = asyncio.create_task(batcher.add("a", 1))
+    await asyncio.sleep(0)
+    assert await batcher.add("a", 2) is None
+    assert await batcher.add("a", 3) is None
+    assert await leader == [1, 2, 3]
+    assert batcher.pending() == 0
+
+
+async def test_keys_are_separate():
+    batcher: KeyedBatcher[int] = KeyedBatcher(window=0.02, max_wait=1.0)
+    first = asyncio.create_task(batcher.add("a", 1))
+    second = asyncio.create_task(batcher.add("b", 2))
+    assert await asyncio.gather(first, second) == [[1], [2]]
+
+
+async def test_max_items_ends_the_window():
+    batcher: KeyedBatcher[int] = KeyedBatcher(window=10, max_wait=10, max_items=2)
+    leader = asyncio.create_task(batcher.add("a", 1))
+    await asyncio.sleep(0)
+    await batcher.add("a", 2)
+    assert await asyncio.wait_for(leader, 1) == [1, 2]
+
+
+async def test_max_wait_bounds_a_busy_group():
+    batcher: KeyedBatcher[int] = KeyedBatcher(window=0.05, max_wait=0.1)
+    started = time.monotonic()
+    leader = asyncio.create_task(batcher.add("a", 0))
+    followers = []
+    while not leader.done():
+        # Arrivals closer together than the window never let the group go quiet
+        await asyncio.sleep(0.01)
+        followers.append(asyncio.create_task(batcher.add("a", len(followers) + 1)))
+    assert time.monotonic() - started < 0.2
+    assert 1 < len(leader.result()) <= len(followers)
+    await asyncio.gather(*followers)
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from src.llm.cancellation import GenerationCancelledError, GenerationRegistry
+
+
+async def test_returns_the_result():
+    registry = GenerationRegistry()
+
+    async def answer():
+        return "done"
+
+    assert await registry.run(1, answer()) == "done"
+    assert registry.in_flight(1) == 0
+
+
+async def test_cancel_raises_in_the_caller():
+    registry = GenerationRegistry()
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(10)
+
+    running = asyncio.create_task(registry.run(1, slow()))
+    await started.wait()
+    assert registry.in_flight(1) == 1
+
+    assert registry.cancel(1, "new_message") == 1
+    with pytest.raises(GenerationCancelledError) as raised:
+        await running
+    assert raised.value.reason == "new_message"
+    assert registry.in_flight(1) == 0
+
+
+async def test_cancel_only_affects_that_user():
+    registry = GenerationRegistry()
+    release = asyncio.Event()
+
+    async def wait():
+        await release.wait()
+        return "kept"
+
+    other = asyncio.create_task(registry.run(2, wait()))
+    await asyncio.sleep(0)
+    assert registry.cancel(1, "new_message") == 0
+    release.set()
+    assert await other == "kept"
+
+
+async def test_cancelled_caller_is_not_a_superseded_generation():
+    registry = GenerationRegistry()
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    running = asyncio.create_task(registry.run(1, slow()))
+    await asyncio.sleep(0)
+    running.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await running
+    assert registry.in_flight(1) == 0
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+import pytest
+
+from src.bot.prefetch import TaskGraph, in_thread
+
+
+async def test_dependencies_receive_results():
+    graph = TaskGraph("test")
+
+    async def base():
+        return 2
+
+    async def double(value):
+        return value * 2
+
+    async def total(a, b):
+        return a + b
+
+    graph.add("base", base)
+    graph.add("double", double, after=("base",))
+    graph.add("total", total, after=("base", "double"))
+    assert await graph.run() == {"base": 2, "double": 4, "total": 6}
+
+
+async def test_independent_steps_run_concurrently():
+    graph = TaskGraph("test")
+    graph.add("a", lambda: asyncio.sleep(0.1, "a"))
+    graph.add("b", lambda: asyncio.sleep(0.1, "b"))
+    graph.add("c", in_thread(time.sleep, 0.1))
+    started = time.monotonic()
+    await graph.run()
+    assert time.monotonic() - started < 0.25
+
+
+async def test_failure_cancels_the_other_steps():
+    graph = TaskGraph("test")
+    cancelled = asyncio.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def fail():
+        raise ValueError("boom")
+
+    graph.add("slow", slow)
+    graph.add("fail", fail)
+    with pytest.raises(ValueError, match="boom"):
+        await graph.run()
+    assert cancelled.is_set()
+
+
+def test_unknown_dependency_is_rejected():
+    graph = TaskGraph("test")
+    with pytest.raises(ValueError):
+        graph.add("b", lambda a: a, after=("a",))
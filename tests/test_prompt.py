@@ -0,0 +1,37 @@
+from src.db.records import HistoryRecord, MessageRecord
+from src.llm.prompt import stable_window
+
+
+def history(first_seq: int, count: int, step: int = 1) -> HistoryRecord:
+    """Messages numbered from `first_seq`, `step` apart, without a total."""
+    return HistoryRecord(
+        messages=[
+            MessageRecord(id=None, user_id=1, role="user", content=str(i), seq=first_seq + i * step)
+            for i in range(count)
+        ]
+    )
+
+
+def test_short_session_is_kept_whole():
+    assert len(stable_window(history(1, 7), limit=30, block=10).messages) == 7
+
+
+def test_start_holds_until_block_messages_accumulate():
+    starts = set()
+    for newest in range(45, 55):
+        # The 30 most recent messages, as get_chat_history returns them
+        window = stable_window(history(newest - 29, 30), limit=30, block=10)
+        assert 20 < len(window.messages) <= 30
+        starts.add(window.messages[0].seq)
+    assert starts == {20, 30}
+
+
+def test_slides_without_a_boundary_in_the_first_block():
+    # Odd sequence numbers are never a multiple of 10
+    window = stable_window(history(1, 30, step=2), limit=30, block=10)
+    assert len(window.messages) == 30
+
+
+def test_known_total_aligns_by_position():
+    known = HistoryRecord(messages=history(101, 30).messages, total=45)
+    assert len(stable_window(known, limit=30, block=10).messages) == 25
@@ -0,0 +1,174 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from src.llm.backends.base import GenerationResult
+from src.llm.deadline import Deadline
+from src.llm.latency import LatencyTracker
+from src.llm.registry import MODELS, ModelRegistry
+from src.llm.router import (
+    AllRoutesFailedError,
+    CircuitBreaker,
+    GenerationRequest,
+    ModelRouter,
+    Route,
+)
+
+REQUEST = GenerationRequest(input_messages=[{"role": "user", "content": "Hi"}], instructions="")
+
+
+def connection_error() -> openai.APIConnectionError:
+    return openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1"))
+
+
+def make_router(behaviour: dict[str, object], **options) -> tuple[ModelRouter, list[str]]:
+    """Router whose calls to each model sleep for a delay or raise an error.
+
+    Returns the router and the list of models called, in call order.
+    """
+    router = ModelRouter(
+        responses_backend=None,
+        chat_backend=None,
+        fallback_chain=[Route("gpt-4.1")],
+        models=ModelRegistry(MODELS, LatencyTracker()),
+        **options,
+    )
+    calls: list[str] = []
+
+    async def call(route: Route, request: GenerationRequest, timeout: float) -> GenerationResult:
+        calls.append(route.model)
+        outcome = behaviour[route.model]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        await asyncio.sleep(outcome)
+        return GenerationResult(text=f"from {route.model}", model=route.model, api=route.api)
+
+    router._call = call
+    return router, calls
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+        breaker.record_failure()
+        assert breaker.state == "closed"
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow_request()
+
+    def test_half_open_allows_one_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+        breaker.record_failure()
+        assert breaker.state == "half-open"
+        assert breaker.allow_request()
+        assert not breaker.allow_request()
+
+    def test_probe_success_closes(self):
+        breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+        breaker.record_failure()
+        breaker.allow_request()
+        breaker.record_success()
+        assert breaker.state == "closed"
+        assert breaker.failures == 0
+
+    def test_cancelled_probe_frees_the_slot(self):
+        breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+        breaker.record_failure()
+        assert breaker.allow_request()
+        breaker.record_cancelled()
+        assert breaker.allow_request()
+
+
+class TestFallback:
+    async def test_falls_back_on_transient_error(self):
+        router, calls = make_router({"gpt-5-mini": connection_error(), "gpt-4.1": 0})
+        result = await router.generate("gpt-5-mini", REQUEST)
+        assert result.model == "gpt-4.1"
+        assert calls == ["gpt-5-mini", "gpt-4.1"]
+        assert router.breaker(Route("gpt-5-mini")).failures == 1
+
+    async def test_skips_open_breaker(self):
+        router, calls = make_router(
+            {"gpt-5-mini": connection_error(), "gpt-4.1": 0}, failure_threshold=1, cooldown=60
+        )
+        await router.generate("gpt-5-mini", REQUEST)
+        result = await router.generate("gpt-5-mini", REQUEST)
+        assert result.model == "gpt-4.1"
+        assert calls == ["gpt-5-mini", "gpt-4.1", "gpt-4.1"]
+
+    async def test_all_routes_failed(self):
+        router, _ = make_router({"gpt-5-mini": connection_error(), "gpt-4.1": connection_error()})
+        with pytest.raises(AllRoutesFailedError) as raised:
+            await router.generate("gpt-5-mini", REQUEST)
+        assert [route.model for route, _ in raised.value.errors] == ["gpt-5-mini", "gpt-4.1"]
+
+    async def test_full_timeout_counts_as_failure(self):
+        router, _ = make_router({"gpt-5-mini": 1.0, "gpt-4.1": 0}, timeout=0.05)
+        result = await router.generate("gpt-5-mini", REQUEST)
+        assert result.model == "gpt-4.1"
+        assert router.breaker(Route("gpt-5-mini")).failures == 1
+
+    async def test_hanging_route_under_deadline_counts_and_leaves_time(self):
+        # Deadline (as in production) shorter than the router timeout
+        router, calls = make_router({"gpt-5-mini": 10, "gpt-4.1": 0}, timeout=10)
+        result = await router.generate("gpt-5-mini", REQUEST, deadline=Deadline.after(0.2))
+        assert result.model == "gpt-4.1"
+        assert calls == ["gpt-5-mini", "gpt-4.1"]
+        assert router.breaker(Route("gpt-5-mini")).failures == 1
+        assert router.latency.error_rate("gpt-5-mini") == 1.0
+
+    async def test_hanging_route_opens_breaker_under_deadline(self):
+        router, calls = make_router(
+            {"gpt-5-mini": 10, "gpt-4.1": 0}, timeout=10, failure_threshold=2, cooldown=60
+        )
+        for _ in range(3):
+            await router.generate("gpt-5-mini", REQUEST, deadline=Deadline.after(0.3))
+        assert router.breaker(Route("gpt-5-mini")).state == "open"
+        assert calls.count("gpt-5-mini") == 2
+
+    async def test_timeout_at_the_deadline_is_not_a_failure(self):
+        router, _ = make_router({"gpt-5-mini": 10, "gpt-4.1": 10}, timeout=10)
+        with pytest.raises(AllRoutesFailedError):
+            await router.generate("gpt-5-mini", REQUEST, deadline=Deadline.after(0.2))
+        # The first route used its share; the last one was cut off by the deadline
+        assert router.breaker(Route("gpt-5-mini")).failures == 1
+        assert router.breaker(Route("gpt-4.1")).failures == 0
+        assert router.latency.error_rate("gpt-4.1") is None
+
+
+class TestHedging:
+    def warm(self, router: ModelRouter, seconds: float) -> None:
+        for _ in range(router.hedge_min_samples):
+            router.latency.record("gpt-5-mini", seconds)
+
+    async def test_slow_primary_is_hedged(self):
+        router, calls = make_router({"gpt-5-mini": 1.0, "gpt-4.1": 0}, hedge_min_samples=5)
+        self.warm(router, 0.02)
+        result = await router.generate("gpt-5-mini", REQUEST)
+        assert result.model == "gpt-4.1"
+        assert calls == ["gpt-5-mini", "gpt-4.1"]
+
+    async def test_fast_primary_is_not_hedged(self):
+        router, calls = make_router({"gpt-5-mini": 0, "gpt-4.1": 0}, hedge_min_samples=5)
+        self.warm(router, 0.5)
+        result = await router.generate("gpt-5-mini", REQUEST)
+        assert result.model == "gpt-5-mini"
+        assert calls == ["gpt-5-mini"]
+
+    async def test_no_hedge_without_samples(self):
+        router, calls = make_router({"gpt-5-mini": 0.05, "gpt-4.1": 0})
+        result = await router.generate("gpt-5-mini", REQUEST)
+        assert result.model == "gpt-5-mini"
+        assert calls == ["gpt-5-mini"]
+
+    async def test_hedged_route_is_not_retried_as_fallback(self):
+        router, calls = make_router(
+            {"gpt-5-mini": connection_error(), "gpt-4.1": connection_error()},
+            hedge_min_samples=5,
+        )
+        self.warm(router, 0)
+        with pytest.raises(AllRoutesFailedError):
+            await router.generate("gpt-5-mini", REQUEST)
+        assert calls.count("gpt-4.1") <= 1
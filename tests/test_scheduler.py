@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from src.llm.deadline import Deadline
+from src.llm.scheduler import FairScheduler, ModelBudget, QueueTimeoutError
+
+
+def make_scheduler(concurrency: int = 1, user_max_inflight: int = 2) -> FairScheduler:
+    budget = ModelBudget(concurrency=concurrency, tokens_per_minute=10_000_000)
+    return FairScheduler(lambda model: budget, user_max_inflight=user_max_inflight)
+
+
+async def hold(scheduler: FairScheduler, user_id: int, order: list[int], release: asyncio.Event):
+    async with scheduler.slot(user_id, "m", 100):
+        order.append(user_id)
+        await release.wait()
+
+
+async def test_admits_immediately_with_capacity():
+    scheduler = make_scheduler(concurrency=2)
+    async with scheduler.slot(1, "m", 100) as ticket:
+        assert ticket.queued_for == 0
+        assert scheduler.stats()["m"]["in_flight"] == 1
+    assert scheduler.stats()["m"]["in_flight"] == 0
+
+
+async def test_flooding_user_does_not_starve_others():
+    scheduler = make_scheduler(concurrency=1, user_max_inflight=10)
+    order: list[int] = []
+    gate = asyncio.Event()
+    blocker = asyncio.create_task(hold(scheduler, 0, order, gate))
+    await asyncio.sleep(0)
+
+    # User 1 queues three requests before user 2 queues one
+    release = asyncio.Event()
+    release.set()
+    waiting = [asyncio.create_task(hold(scheduler, 1, order, release)) for _ in range(3)]
+    await asyncio.sleep(0)
+    waiting.append(asyncio.create_task(hold(scheduler, 2, order, release)))
+    await asyncio.sleep(0)
+    assert scheduler.queue_depth("m") == 4
+
+    gate.set()
+    await asyncio.gather(blocker, *waiting)
+    # User 2 runs right after user 1's first request, not behind all of them
+    assert order == [0, 1, 2, 1, 1]
+
+
+async def test_per_user_inflight_limit():
+    scheduler = make_scheduler(concurrency=5, user_max_inflight=1)
+    order: list[int] = []
+    gate = asyncio.Event()
+    first = asyncio.create_task(hold(scheduler, 1, order, gate))
+    second = asyncio.create_task(hold(scheduler, 1, order, gate))
+    await asyncio.sleep(0)
+    assert order == [1]
+    assert scheduler.queue_depth("m") == 1
+    gate.set()
+    await asyncio.gather(first, second)
+    assert order == [1, 1]
+
+
+async def test_cancelled_waiter_leaves_the_queue():
+    scheduler = make_scheduler(concurrency=1)
+    order: list[int] = []
+    gate = asyncio.Event()
+    blocker = asyncio.create_task(hold(scheduler, 1, order, gate))
+    waiter = asyncio.create_task(hold(scheduler, 2, order, gate))
+    await asyncio.sleep(0)
+    assert scheduler.queue_depth("m") == 1
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert scheduler.queue_depth("m") == 0
+
+    gate.set()
+    await blocker
+    assert scheduler.stats()["m"]["in_flight"] == 0
+
+
+async def test_deadline_expires_in_queue():
+    scheduler = make_scheduler(concurrency=1)
+    gate = asyncio.Event()
+    blocker = asyncio.create_task(hold(scheduler, 1, [], gate))
+    await asyncio.sleep(0)
+
+    with pytest.raises(QueueTimeoutError):
+        async with scheduler.slot(2, "m", 100, deadline=Deadline.after(0.02)):
+            pass
+    assert scheduler.queue_depth("m") == 0
+
+    gate.set()
+    await blocker
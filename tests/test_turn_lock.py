@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from src.services import turn_lock
+
+
+def fake_table(monkeypatch, delay: float = 0.0) -> dict[int, str]:
+    """Replace the lock RPCs with an in-memory table (holder by user ID)."""
+    rows: dict[int, str] = {}
+
+    def acquire(user_id: int, holder: str, ttl_seconds: int) -> bool:
+        time.sleep(delay)
+        if rows.get(user_id, holder) != holder:
+            return False
+        rows[user_id] = holder
+        return True
+
+    def release(user_id: int, holder: str) -> None:
+        if rows.get(user_id) == holder:
+            del rows[user_id]
+
+    monkeypatch.setattr(turn_lock, "acquire_turn_lock", acquire)
+    monkeypatch.setattr(turn_lock, "release_turn_lock", release)
+    return rows
+
+
+async def test_second_turn_waits_for_the_first(monkeypatch):
+    rows = fake_table(monkeypatch)
+    locks = turn_lock.TurnLocks(enabled=True, ttl_seconds=90, wait_seconds=5)
+    first, second = locks.lease(1), locks.lease(1)
+    assert await first.acquire()
+
+    waiting = asyncio.create_task(second.acquire())
+    await asyncio.sleep(0.1)
+    assert not waiting.done()
+
+    await first.release()
+    assert await asyncio.wait_for(waiting, 1)
+    assert rows == {1: second.holder}
+    await second.release()
+    assert rows == {}
+
+
+async def test_gives_up_after_wait_seconds(monkeypatch):
+    fake_table(monkeypatch)
+    locks = turn_lock.TurnLocks(enabled=True, ttl_seconds=90, wait_seconds=0.1)
+    assert await locks.lease(1).acquire()
+    assert not await locks.lease(1).acquire()
+
+
+async def test_interrupted_acquire_is_released(monkeypatch):
+    rows = fake_table(monkeypatch, delay=0.1)
+    locks = turn_lock.TurnLocks(enabled=True, ttl_seconds=90, wait_seconds=5)
+    lease = locks.lease(1)
+    acquiring = asyncio.create_task(lease.acquire())
+    await asyncio.sleep(0.02)
+    acquiring.cancel()
+    await asyncio.gather(acquiring, return_exceptions=True)
+
+    await lease.release()
+    assert rows == {}
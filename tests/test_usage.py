@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+from src.llm.backends.base import GenerationResult
+from src.services import usage
+
+RESULT = GenerationResult(text="", model="gpt-5-mini", api="responses", input_tokens=10)
+
+
+def fake_insert(monkeypatch, delay: float = 0.0) -> list[list[dict]]:
+    """Replace the ledger insert with one that records each batch."""
+    batches: list[list[dict]] = []
+
+    def insert(rows: list[dict]) -> None:
+        time.sleep(delay)
+        batches.append(rows)
+
+    monkeypatch.setattr(usage, "insert_usage", insert)
+    return batches
+
+
+async def test_rows_recorded_during_a_flush_are_written_later(monkeypatch):
+    batches = fake_insert(monkeypatch, delay=0.05)
+    ledger = usage.UsageLedger(batch_size=1, flush_interval=0.1)
+    ledger.record(1, RESULT)
+    await asyncio.sleep(0.01)
+    # Due, but the first flush is still running
+    ledger.record(2, RESULT)
+    await asyncio.sleep(0.3)
+    assert [len(rows) for rows in batches] == [1, 1]
+    assert ledger.pending() == 0
+
+
+async def test_drain_writes_everything_before_returning(monkeypatch):
+    batches = fake_insert(monkeypatch, delay=0.05)
+    ledger = usage.UsageLedger(batch_size=1, flush_interval=60)
+    ledger.record(1, RESULT)
+    ledger.record(2, RESULT)
+    await ledger.drain()
+    assert sum(len(rows) for rows in batches) == 2
+    assert ledger.pending() == 0
+    assert ledger._flush_timer is None